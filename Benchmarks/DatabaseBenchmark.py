@@ -0,0 +1,260 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem.
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with PSchem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Database benchmark on a generated gEDA design. Times the reader, the
+importer, connectivity index queries, checkNets, path resolution,
+hierarchy elaboration and (if the Qt bindings are available) a scene
+build. Results are written as JSON, a previous result can be given to
+print the ratios. Run from the top directory:
+
+    python -m Benchmarks.DatabaseBenchmark -o new.json -c old.json
+"""
+
+import sys
+import os
+import time
+import json
+import shutil
+import tempfile
+import subprocess
+from optparse import OptionParser
+
+from Database.Database import Database
+from Database.Cells import *
+from Database.CellViews import *
+from Database.Layers import Layers
+from Database.Design import Design
+from Database.Path import Path
+from Database import Reader
+from Benchmarks.Generator import GedaGenerator
+
+class Client():
+    """Database client without an event loop."""
+    def deferredProcessingRequested(self):
+        pass
+
+    def leaveCPU(self):
+        pass
+
+
+class DatabaseBenchmark():
+    library = 'bench'
+
+    def __init__(self, options):
+        self._options = options
+        self._timings = {}
+        self._counts = {}
+        self._directory = None
+        self._database = None
+        self._occurrencePaths = []
+
+    def timed(self, name, f, *args):
+        """Run f, best of options.repeat runs is recorded for name."""
+        return self.measure(name, self._options.repeat, f, *args)
+
+    def measure(self, name, repeat, f, *args):
+        best = None
+        for n in range(repeat):
+            start = time.time()
+            result = f(*args)
+            t = time.time() - start
+            if best is None or t < best:
+                best = t
+        self._timings[name] = best
+        return result
+
+    def run(self):
+        self._directory = tempfile.mkdtemp(prefix='pschem-bench-')
+        try:
+            self.generate()
+            self._database = Database.createDatabase(Client())
+            self._database.layers = Layers(self._database)
+            self._database.journal.suspend()
+            self.measure('import', 1, self.importLibraries) #not repeatable
+            self.timed('read', self.readTop)
+            top = self.timed('checkNets', self.checkNets)
+            self._counts['netSegments'] = len(top.netSegments)
+            self._counts['solderDots'] = len(top.solderDots)
+            self.timed('indexQueries', self.indexQueries, top)
+            design = self.timed('elaboration', self.elaborate)
+            self.timed('pathResolution', self.resolvePaths)
+            self.sceneBuild(design)
+        finally:
+            if self._database:
+                self._database.close()
+            shutil.rmtree(self._directory)
+        return self.results()
+
+    def generate(self):
+        o = self._options
+        self._generator = GedaGenerator(self._directory, o.symbols,
+                                        o.instances, o.nets, o.blocks)
+        self.measure('generate', 1, self._generator.generate)
+
+    def importLibraries(self):
+        #symbols and sources share a library, blocks are hierarchical
+        importer = Reader.GedaImporter(self._database.libraries)
+        importer.importLibraryList(
+            [[self.library, self._generator.symbolDirectory]],
+            [[self.library, self._generator.sourceDirectory]])
+        self._counts['cells'] = len(self.cellViewPaths())
+
+    def readTop(self):
+        """Parse the top schematic into a new cell."""
+        libraries = self._database.libraries
+        cell = libraries.createCellFromPath(Path.createFromPathName(
+            self.library + '/readTop'))
+        old = cell.cellViewByName('schematic')
+        if old:
+            old.remove()
+        importer = Reader.GedaImporter(libraries)
+        importer.library = cell.library
+        schematic = Schematic('schematic', cell)
+        fileName = os.path.join(self._generator.sourceDirectory, 'top.sch')
+        return Reader.GedaReader(importer).parseSchematic(fileName, schematic)
+
+    def checkNets(self):
+        schematic = self.readTop() #unchecked nets in each run
+        schematic.checkNets()
+        self._database.runDeferredProcesses()
+        return schematic
+
+    def indexQueries(self, schematic):
+        index = schematic.index
+        points = set()
+        for n in schematic.netSegments:
+            points.add((n.x1, n.y1))
+            points.add((n.x2, n.y2))
+        for (x, y) in points:
+            index.netSegmentsAt(x, y)
+            index.netSegmentsEndPointsAt(x, y)
+            index.netSegmentsMidPointsAt(x, y)
+            index.solderDotsAt(x, y)
+        self._counts['indexPoints'] = len(points)
+
+    def cellViewPaths(self):
+        library = self._database.libraries.libraryByPath(
+            Path.createFromPathName(self.library))
+        return [cellView.path for cell in library.cells
+                for cellView in cell.cellViews]
+
+    def resolvePaths(self):
+        """Resolve all cell view paths and design unit occurrence paths."""
+        libraries = self._database.libraries
+        designs = self._database.designs
+        for pathName in self.cellViewPaths():
+            libraries.objectByPath(Path.createFromPathName(pathName))
+        for pathName in self._occurrencePaths:
+            designs.designUnitByPath(pathName)
+
+    def elaborate(self):
+        """Create the top design and expand its whole hierarchy."""
+        designs = self._database.designs
+        for design in list(designs.designs):
+            design.remove()
+        top = self._database.libraries.objectByPath(
+            Path.createFromPathName(self.library + '/top/schematic'))
+        design = Design(top, designs)
+        paths = []
+        pending = [design]
+        while pending:
+            unit = pending.pop()
+            paths.append(unit.path)
+            pending.extend(unit.childDesignUnits.values())
+        self._occurrencePaths = paths
+        self._counts['designUnits'] = len(paths)
+        return design
+
+    def sceneBuild(self, design):
+        try:
+            import Globals
+            Qt = __import__(Globals.UI,  globals(),  locals(),  ['QtCore',  'QtGui'])
+            from PSchem.GraphicsScene import GraphicsScene
+        except ImportError:
+            self._timings['sceneBuild'] = None #no Qt bindings
+            return
+        QtGui = Qt.QtGui
+        app = QtGui.QApplication.instance() or QtGui.QApplication(sys.argv)
+        def build():
+            scene = GraphicsScene(design)
+            while scene.builder:
+                app.processEvents()
+            return scene
+        self.timed('sceneBuild', build)
+
+    def results(self):
+        try:
+            commit = subprocess.Popen(['git', 'rev-parse', 'HEAD'],
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE).communicate()[0].strip()
+        except OSError:
+            commit = None
+        o = self._options
+        return {'commit': commit,
+                'python': sys.version.split()[0],
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'config': {'symbols': o.symbols, 'instances': o.instances,
+                           'nets': o.nets, 'blocks': o.blocks,
+                           'repeat': o.repeat},
+                'timings': self._timings,
+                'counts': self._counts}
+
+
+def report(results, reference = None):
+    for name in sorted(results['timings']):
+        t = results['timings'][name]
+        if t is None:
+            print '%-16s %10s' % (name, 'skipped')
+            continue
+        line = '%-16s %10.4f s' % (name, t)
+        if reference:
+            old = reference['timings'].get(name)
+            if old:
+                line += '   x%.2f' % (t / old)
+        print line
+
+def main(argv):
+    parser = OptionParser()
+    parser.add_option('-s', '--symbols', type='int', default=50)
+    parser.add_option('-i', '--instances', type='int', default=1000)
+    parser.add_option('-n', '--nets', type='int', default=4000)
+    parser.add_option('-b', '--blocks', type='int', default=10)
+    parser.add_option('-r', '--repeat', type='int', default=3)
+    parser.add_option('-o', '--output', help='write results to a JSON file')
+    parser.add_option('-c', '--compare', help='JSON results to compare with')
+    (options, args) = parser.parse_args(argv)
+    results = DatabaseBenchmark(options).run()
+    reference = None
+    if options.compare:
+        f = open(options.compare)
+        try:
+            reference = json.load(f)
+        finally:
+            f.close()
+    report(results, reference)
+    if options.output:
+        f = open(options.output, 'w')
+        try:
+            json.dump(results, f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
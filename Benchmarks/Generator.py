@@ -0,0 +1,123 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem.
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with PSchem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Synthetic gEDA libraries and schematics of a configurable size.
+"""
+
+import os
+import random
+
+class GedaGenerator():
+    """
+    Writes a symbol library (symbols with 2 to 4 pins each, plus a
+    'block' symbol) and a source library with a 'top' schematic and a
+    'block' schematic instantiated from it, so that both a flat and a
+    hierarchical design are available.
+
+    Nets are written as groups of four segments: a horizontal run split
+    into three collinear segments (merged by checkNets) and a vertical
+    branch ending in the middle of the run (a T-junction, split by
+    checkNets and marked with a solder dot).
+    """
+    version = 'v 20080127 1\n'
+    grid = 100
+
+    def __init__(self, directory, symbols = 50, instances = 1000,
+                 nets = 4000, blocks = 10, seed = 1):
+        self._directory = directory
+        self._symbols = symbols
+        self._instances = instances
+        self._nets = nets
+        self._blocks = blocks
+        self._random = random.Random(seed)
+        self._pins = {} #symbol name -> number of pins
+
+    @property
+    def symbolDirectory(self):
+        return os.path.join(self._directory, 'sym')
+
+    @property
+    def sourceDirectory(self):
+        return os.path.join(self._directory, 'sch')
+
+    def generate(self):
+        for d in (self.symbolDirectory, self.sourceDirectory):
+            if not os.path.isdir(d):
+                os.makedirs(d)
+        for n in range(self._symbols):
+            name = 'sym%d' % n
+            self._pins[name] = self._random.randint(2, 4)
+            self.writeSymbol(name, self._pins[name])
+        self.writeSymbol('block', 4)
+        blockInstances = max(1, self._instances // 100)
+        blockNets = max(4, self._nets // 100)
+        self.writeSchematic('block', blockInstances, blockNets, 0)
+        self.writeSchematic('top', self._instances, self._nets, self._blocks)
+
+    def text(self, x, y, text, visible = 1):
+        return 'T %d %d 5 10 %d 1 0 0 1\n%s\n' % (x, y, visible, text)
+
+    def writeSymbol(self, name, pins):
+        g = self.grid
+        height = pins * 2 * g
+        lines = [self.version,
+                 'B 0 0 %d %d 3 0 0 0 -1 -1 0 -1 -1 -1 -1 -1\n' % (4*g, height)]
+        for p in range(pins):
+            x = 4*g if p % 2 else 0
+            x2 = x + g if p % 2 else x - g
+            y = (p // 2) * 2 * g + g
+            lines.append('P %d %d %d %d 1 0 1\n' % (x2, y, x, y))
+            lines.append('{\n' + self.text(x2, y, 'pinnumber=%d' % (p + 1), 0) + '}\n')
+        lines.append(self.text(0, height + g, 'refdes=U?'))
+        self.write(os.path.join(self.symbolDirectory, name + '.sym'), lines)
+
+    def writeSchematic(self, name, instances, nets, blocks):
+        g = self.grid
+        rnd = self._random
+        symbols = sorted(self._pins)
+        lines = [self.version]
+        side = int(instances ** 0.5) + 1
+        for n in range(instances + blocks):
+            x = (n % side) * 10 * g
+            y = (n // side) * 10 * g
+            if n < blocks:
+                symbol = 'block'
+            else:
+                symbol = rnd.choice(symbols)
+            angle = rnd.choice((0, 90, 180, 270))
+            lines.append('C %d %d 1 %d %d %s.sym\n' % (x, y, angle, rnd.randint(0, 1), symbol))
+            lines.append('{\n' + self.text(x, y - g, 'refdes=X%d' % n) + '}\n')
+        x0 = 0
+        y0 = -10 * g
+        for n in range(nets // 4):
+            x = x0 + (n % side) * 10 * g
+            y = y0 - (n // side) * 4 * g
+            lines.append('N %d %d %d %d 4\n' % (x, y, x + 2*g, y))
+            lines.append('N %d %d %d %d 4\n' % (x + 2*g, y, x + 4*g, y))
+            lines.append('N %d %d %d %d 4\n' % (x + 4*g, y, x + 8*g, y))
+            lines.append('N %d %d %d %d 4\n' % (x + 3*g, y, x + 3*g, y - 2*g))
+        self.write(os.path.join(self.sourceDirectory, name + '.sch'), lines)
+
+    def write(self, fileName, lines):
+        f = open(fileName, 'w')
+        try:
+            f.writelines(lines)
+        finally:
+            f.close()
@@ -0,0 +1,57 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem.
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with PSchem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Imports gEDA libraries without the GUI and prints the approximate
+memory use per library, cell and cell view. Run from the top directory:
+
+    python -m Benchmarks.MemoryReport -d 3 sym.analog=../geda/symbols/analog
+    python -m Benchmarks.MemoryReport -s examples=../geda/examples
+"""
+
+import sys
+from optparse import OptionParser
+
+from Database.Database import Database
+from Database.Layers import Layers
+from Database import Reader
+from Benchmarks.DatabaseBenchmark import Client
+
+def libraryList(args):
+    """'library=directory' arguments as importer library lists."""
+    return [arg.split('=', 1) for arg in args]
+
+def main(argv):
+    parser = OptionParser(usage='%prog [options] library=directory ...')
+    parser.add_option('-s', '--source', action='append', default=[],
+                      help='source (schematic) library=directory')
+    parser.add_option('-d', '--depth', type='int', default=2,
+                      help='depth of the printed tree')
+    (options, args) = parser.parse_args(argv)
+    database = Database.createDatabase(Client())
+    database.layers = Layers(database)
+    importer = Reader.GedaImporter(database.libraries)
+    importer.importLibraryList(libraryList(args), libraryList(options.source))
+    usage = database.memoryUsage()
+    print '%-50s %12s %10s' % ('', 'bytes', 'objects')
+    print usage.report(options.depth)
+    database.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,100 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem.
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with PSchem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Opens, fits and pans a large generated schematic in a PSchem window.
+Run from the top directory:
+
+    python -m Benchmarks.SceneBenchmark [elements]
+"""
+
+import sys
+import math
+import time
+
+import Globals
+Qt = __import__(Globals.UI,  globals(),  locals(),  ['QtCore',  'QtGui'])
+QtCore = Qt.QtCore
+QtGui = Qt.QtGui
+
+from PSchem import PWindow
+from Database.Path import Path
+from Database.CellViews import Schematic
+from Database.Primitives import Line
+
+def timed(label, f, *args):
+    t = time.time()
+    result = f(*args)
+    print '%-24s %8.3f s' % (label, time.time() - t)
+    return result
+
+def createSheet(database, elements):
+    """Schematic with a square array of short diagonal lines."""
+    cell = database.libraries.createCellFromPath(
+        Path.createFromPathName('benchmark/sheet'))
+    schematic = Schematic('schematic', cell)
+    layers = database.layers
+    side = int(math.sqrt(elements)) or 1
+    database.journal.suspend()
+    with database.transaction():
+        for n in xrange(elements):
+            x = (n % side) * 1600
+            y = (n // side) * 1600
+            Line(schematic, layers, x, y, x + 800, y + 800)
+    database.journal.resume()
+    return schematic
+
+def settle(app, scene):
+    """Process events until the scene is populated."""
+    app.processEvents()
+    while scene.builder:
+        app.processEvents()
+
+def openSheet(app, window, schematic):
+    window.openCellView(schematic)
+    view = window.mdiArea.subWindowList()[-1].widget()
+    settle(app, view.scene())
+    return view
+
+def fit(app, view):
+    view.fit()
+    settle(app, view.scene())
+
+def pan(app, view, steps):
+    for n in range(steps):
+        view.move(0.25, 0.1)
+        app.processEvents()
+        view.updateVisibleArea()
+        settle(app, view.scene())
+
+def main(elements=100000, steps=20):
+    app = QtGui.QApplication(sys.argv)
+    window = PWindow.PWindow()
+    window.show()
+    schematic = timed('create %d elements' % elements, createSheet, window.database, elements)
+    view = timed('open', openSheet, app, window, schematic)
+    timed('fit', fit, app, view)
+    timed('extents', lambda: schematic.extents)
+    timed('pan x%d' % steps, pan, app, view, steps)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
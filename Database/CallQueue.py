@@ -0,0 +1,106 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+from collections import deque
+
+class PendingCall():
+    """A call queued in CallQueue, its result can be waited for."""
+    def __init__(self, func, args, kwargs):
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    @property
+    def done(self):
+        return self._done.isSet()
+
+    def run(self):
+        try:
+            self._result = self._func(*self._args, **self._kwargs)
+        except Exception as err:
+            self._error = err
+        self._done.set()
+
+    def result(self, timeout = None):
+        """
+        Wait until the call has been run and return its result, or
+        re-raise its exception. Returns None on timeout.
+        """
+        self._done.wait(timeout)
+        if self._error:
+            raise self._error
+        return self._result
+
+
+class CallQueue():
+    """
+    Database calls posted from other threads (e.g. a script running in
+    the background), to be run by the thread that owns the database.
+    Calls are applied in batches, each batch in a single transaction so
+    that views are updated once per batch rather than once per call.
+    """
+    def __init__(self, database, batchSize = 1000):
+        self._database = database
+        self._batchSize = batchSize
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def database(self):
+        return self._database
+
+    def __len__(self):
+        return len(self._calls)
+
+    def post(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs), return a PendingCall."""
+        call = PendingCall(func, args, kwargs)
+        with self._lock:
+            self._calls.append(call)
+        return call
+
+    def apply(self, batchSize = None):
+        """
+        Run up to batchSize queued calls (all if 0) in one transaction.
+        Returns True if calls are still pending.
+        """
+        if batchSize is None:
+            batchSize = self._batchSize
+        with self._lock:
+            n = len(self._calls)
+            if batchSize:
+                n = min(n, batchSize)
+            batch = [self._calls.popleft() for i in range(n)]
+        if batch:
+            with self.database.transaction():
+                for call in batch:
+                    call.run()
+        return len(self._calls) > 0
+
+    def cancel(self):
+        """Drop calls not yet run, waiting threads get None."""
+        with self._lock:
+            calls = list(self._calls)
+            self._calls.clear()
+        for call in calls:
+            call._done.set()
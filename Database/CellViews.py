@@ -20,7 +20,10 @@
 #print 'CellViews in'
 
 from Index import Index
+from SpatialIndex import SpatialIndex
 from Primitives import *
+from Perf import timed
+import weakref
 #from Design import *
 from xml.etree import ElementTree as et
 
@@ -28,6 +31,7 @@ from xml.etree import ElementTree as et
 
 class CellView():
     def __init__(self, name, cell):
+        cell.database.checkThread()
         self._name = name
         self._attribs = {}
         self._cell = cell
@@ -64,6 +68,7 @@ class CellView():
         pass
 
     def remove(self):
+        self.database.checkThread()
         #for a in list(self.attributes):
         #    a.remove()
         self.cell.cellViewRemoved(self)
@@ -77,7 +82,7 @@ class Diagram(CellView):
     def __init__(self, name, cell):
         CellView.__init__(self, name, cell)
         #self._elems = set()
-        self._items = set()
+        self._items = weakref.WeakSet()
         self._lines = set()
         self._rects = set()
         self._customPaths = set()
@@ -89,6 +94,7 @@ class Diagram(CellView):
         self._attribs['uu'] = 160 # default DB units per user units
         #self._name = 'diagram'
         self._designUnits = set()
+        self._spatialIndex = None
 
     @property
     def designUnits(self):
@@ -132,6 +138,21 @@ class Diagram(CellView):
     def attributeLabels(self):
         return self._attributeLabels
 
+    @property
+    def spatialIndex(self):
+        """Spatial index of the diagram elements, built on first use."""
+        if self._spatialIndex is None:
+            self._spatialIndex = SpatialIndex(64 * self.uu)
+            for e in self.elems:
+                if e.drawn:
+                    self._spatialIndex.add(e, e.boundingBox)
+        return self._spatialIndex
+
+    @property
+    def extents(self):
+        """Bounding box of all elements (in database units) or None."""
+        return self.spatialIndex.extents
+
     @property
     def uu(self):
         return self._attribs['uu']
@@ -140,6 +161,10 @@ class Diagram(CellView):
     def uu(self, uu):
         self._attribs['uu'] = uu
 
+    def instanceChanged(self, instance):
+        """An instance now refers to another cell view."""
+        self.database.designStatistics.cellChanged(self.cell)
+
     def instanceItemAdded(self, view):
         self.items.add(view)
         for elem in self.elems:
@@ -148,9 +173,7 @@ class Diagram(CellView):
         #    elem.addToDesignUnit(designUnit)
             
     def instanceItemRemoved(self, view):
-        self.items.remove(view)
-        for elem in self.elems:
-            elem.removeFromView()
+        self.items.discard(view)
             
     def designUnitAdded(self, designUnit):
         self.designUnits.add(designUnit)
@@ -167,17 +190,40 @@ class Diagram(CellView):
     #        #v.updateItem()
 
     def elementAdded(self, elem):
-        pass
+        self.database.checkThread()
+        self.database.journal.elementAdded(elem)
         #for designUnit in self._designUnits:
         #    elem.addToDesignUnit(designUnit)
 
+    def indexElement(self, elem):
+        """Hidden elements are left out of the index (and extents)."""
+        index = self._spatialIndex
+        if index is not None:
+            extents = index.extents
+            if elem.drawn:
+                index.update(elem, elem.boundingBox)
+            else:
+                index.remove(elem)
+            if index.extents != extents:
+                self.extentsChanged()
+
+    def extentsChanged(self):
+        for designUnit in self.designUnits:
+            designUnit.extentsChanged()
+
     def elementChanged(self, elem):
-        pass
+        self.indexElement(elem)
         #for designUnit in self._designUnits:
         #    elem.addToDesignUnit(designUnit)
 
     def elementRemoved(self, elem):
-        pass
+        self.database.journal.elementRemoved(elem)
+        index = self._spatialIndex
+        if index is not None:
+            extents = index.extents
+            index.remove(elem)
+            if index.extents != extents:
+                self.extentsChanged()
         #for designUnit in self._designUnits:
         #    elem.removeFromDesignUnit(designUnit)
         
@@ -196,42 +242,49 @@ class Diagram(CellView):
 
     def lineAdded(self, line):
         self.lines.add(line)
+        self.indexElement(line)
         
     def lineRemoved(self, line):
         self.lines.remove(line)
         
     def rectAdded(self, rect):
         self.rects.add(rect)
+        self.indexElement(rect)
         
     def rectRemoved(self, rect):
         self.rects.remove(rect)
         
     def customPathAdded(self, customPath):
         self.customPaths.add(customPath)
+        self.indexElement(customPath)
         
     def customPathRemoved(self, customPath):
         self.customPaths.remove(customPath)
         
     def ellipseAdded(self, ellipse):
         self.ellipses.add(ellipse)
+        self.indexElement(ellipse)
         
     def ellipseRemoved(self, ellipse):
         self.ellipses.remove(ellipse)
         
     def ellipseArcAdded(self, ellipseArc):
         self.ellipseArcs.add(ellipseArc)
+        self.indexElement(ellipseArc)
         
     def ellipseArcRemoved(self, ellipseArc):
         self.ellipseArcs.remove(ellipseArc)
         
     def labelAdded(self, label):
         self.labels.add(label)
+        self.indexElement(label)
         
     def labelRemoved(self, label):
         self.labels.remove(label)
         
     def attributeLabelAdded(self, attributeLabel):
         self.attributeLabels.add(attributeLabel)
+        self.indexElement(attributeLabel)
         
     def attributeLabelRemoved(self, attributeLabel):
         self.attributeLabels.remove(attributeLabel)
@@ -243,6 +296,7 @@ class Diagram(CellView):
         for du in list(self.designUnits):
             du.remove()
             #self.removeDesignUnit(o)
+        self.database.forgetDeferredProcessing(self)
         CellView.remove(self)
 
     def save(self):
@@ -280,6 +334,8 @@ class Diagram(CellView):
 
                 
 class Schematic(Diagram):
+    deferredPriority = 0 #net normalization goes first
+    
     def __init__(self, name, cell):
         Diagram.__init__(self, name, cell)
         #self._name = 'schematic'
@@ -289,6 +345,9 @@ class Schematic(Diagram):
         self._solderDots = set()
         self._nets = set()
         self._index = Index()
+        #connectivity index updates postponed by transactions, elem -> added
+        self._pendingNetSegments = {}
+        self._pendingSolderDots = {}
         
         #self._netSegmentsAdded = set()
         #self._netSegmentsRemoved = set()
@@ -336,19 +395,53 @@ class Schematic(Diagram):
 
     @property
     def index(self):
+        if self._pendingNetSegments or self._pendingSolderDots:
+            self.updateIndex()
         return self._index
 
+    def updateIndex(self):
+        """
+        Apply connectivity index updates postponed by a transaction.
+        """
+        idx = self._index
+        pending = self._pendingNetSegments
+        self._pendingNetSegments = {}
+        for ns, added in pending.iteritems():
+            if not added:
+                idx.netSegmentRemoved(ns)
+        for ns, added in pending.iteritems():
+            if added:
+                idx.netSegmentAdded(ns)
+        pending = self._pendingSolderDots
+        self._pendingSolderDots = {}
+        for sd, added in pending.iteritems():
+            if not added:
+                idx.solderDotRemoved(sd)
+        for sd, added in pending.iteritems():
+            if added:
+                idx.solderDotAdded(sd)
+
+    def _postponeIndexUpdate(self, pending, elem, added):
+        if not added and pending.get(elem):
+            del pending[elem] #added and removed, never indexed
+        else:
+            pending[elem] = added
+
     def pinAdded(self, pin):
         self.pins.add(pin)
+        self.indexElement(pin)
        
     def pinRemoved(self, pin):
         self.pins.remove(pin)
         
     def instanceAdded(self, instance):
         self.instances.add(instance)
+        self.indexElement(instance)
+        self.database.designStatistics.cellChanged(self.cell)
         
     def instanceRemoved(self, instance):
         self.instances.remove(instance)
+        self.database.designStatistics.cellChanged(self.cell)
         
     #def addNet(self, net):
     #    "call only from addToDiagram"
@@ -364,8 +457,12 @@ class Schematic(Diagram):
 
     def netSegmentAdded(self, netSegment):
         #print self.__class__.__name__, "ns added", netSegment
-        self.index.netSegmentAdded(netSegment)
+        if self.database.inTransaction:
+            self._postponeIndexUpdate(self._pendingNetSegments, netSegment, True)
+        else:
+            self.index.netSegmentAdded(netSegment)
         self._netSegments.add(netSegment) #don't trigger deferred processing
+        self.indexElement(netSegment)
         #self._netSegmentsAdded.add(netSegment)
         self.database.requestDeferredProcessing(self)
         #self.splitNetSegment(netSegment)
@@ -376,21 +473,31 @@ class Schematic(Diagram):
         
     def netSegmentRemoved(self, netSegment):
         #print self.__class__.__name__, "ns removed", netSegment
-        self.index.netSegmentRemoved(netSegment)
+        if self.database.inTransaction:
+            self._postponeIndexUpdate(self._pendingNetSegments, netSegment, False)
+        else:
+            self.index.netSegmentRemoved(netSegment)
         self._netSegments.remove(netSegment) #don't trigger deferred processing
         #self._netSegmentsRemoved.add(netSegment)
         self.database.requestDeferredProcessing(self)
         
     def solderDotAdded(self, solderDot):
-        self.index.solderDotAdded(solderDot)
+        if self.database.inTransaction:
+            self._postponeIndexUpdate(self._pendingSolderDots, solderDot, True)
+        else:
+            self.index.solderDotAdded(solderDot)
         #for designUnit in self._designUnits:
         #    #solderDot.addToDesignUnit(designUnit)
         #    if designUnit.scene():
         #        solderDot.addToView(designUnit.scene())
         self._solderDots.add(solderDot) #don't trigger deferred processing
+        self.indexElement(solderDot)
         
     def solderDotRemoved(self, solderDot):
-        self.index.solderDotRemoved(solderDot)
+        if self.database.inTransaction:
+            self._postponeIndexUpdate(self._pendingSolderDots, solderDot, False)
+        else:
+            self.index.solderDotRemoved(solderDot)
         self._solderDots.remove(solderDot) #don't trigger deferred processing
         
     def splitNetSegment(self, netSegment):
@@ -469,6 +576,7 @@ class Schematic(Diagram):
                     n += 1
         #print self.__class__.__name__, "added", n, "solder dots"
             
+    @timed('Schematic.checkNets')
     def checkNets(self):
         self.splitNetSegments()
         self.mergeNetSegments()
@@ -509,6 +617,7 @@ class Symbol(Diagram):
 
     def symbolPinAdded(self, symbolPin):
         self.symbolPins.add(symbolPin)
+        self.indexElement(symbolPin)
        
     def symbolPinRemoved(self, symbolPin):
         self.symbolPins.remove(symbolPin)
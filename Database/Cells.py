@@ -21,7 +21,9 @@
 
 from CellViews import *
 from Path import Path
+from NameIndex import NameIndex
 from xml.etree import ElementTree as et
+import weakref
 
 #print 'Cells out'
 
@@ -35,12 +37,14 @@ class Cell():
         if name in library.cellNames:
             self = library.cellNames[name]
         else:
+            library.database.checkThread()
             self = cls()
             self._cellViews = set()
             self._cellViewNames = {}
             self._name = name
             self._library = library
             self._sortedCellViews = None
+            self._childRows = None
             library.cellAdded(self)
         return self
 
@@ -89,6 +93,12 @@ class Cell():
             self._sortedCellViews = sorted(self.cellViews, lambda a, b: cmp(a.name.lower(), b.name.lower()))
         return self._sortedCellViews
 
+    def childRow(self, cellView):
+        """Row of a cell view in sortedCellViews."""
+        if self._childRows is None:
+            self._childRows = dict((c, n) for (n, c) in enumerate(self.sortedCellViews))
+        return self._childRows[cellView]
+
     def cellViewByName(self, cellViewName):
         if self.cellViewNames.has_key(cellViewName):
             return self.cellViewNames[cellViewName]
@@ -103,21 +113,32 @@ class Cell():
         return cellView
         
     def cellViewAdded(self, cellView):
+        old = self.cellViewNames.get(cellView.name)
+        if old and old is not cellView: #replaced
+            self.cellViews.discard(old)
         self.cellViews.add(cellView)
         self.cellViewNames[cellView.name] = cellView
         self._sortedCellViews = None
+        self._childRows = None
+        self.root.invalidateObjectCache(old, True)
+        self.root.childrenChanged(self)
         self.library.cellChanged(self)
 
     def cellViewRemoved(self, cellView):
-        self.cellViews.remove(cellView)
-        del self.cellViewNames[cellView.name]
+        self.cellViews.discard(cellView)
+        if self.cellViewNames.get(cellView.name) is cellView:
+            del self.cellViewNames[cellView.name]
         self._sortedCellViews = None
+        self._childRows = None
+        self.root.invalidateObjectCache(cellView)
+        self.root.childrenChanged(self)
         self.library.cellChanged(self)
         
     def cellViewChanged(self, cellView):
         self.library.cellChanged(self)
 
     def remove(self):
+        self.database.checkThread()
         for c in list(self.cellViews):
             c.remove()
         self.library.cellRemoved(self)
@@ -140,6 +161,7 @@ class Library():
         if name in parent.libraryNames:
             self = parent.libraryNames[name]
         else:
+            parent.database.checkThread()
             self = cls()
             self._cells = set()
             self._cellNames = {}
@@ -149,6 +171,8 @@ class Library():
             self._name = name
             self._sortedLibraries = None
             self._sortedCells = None
+            self._sortedChildren = None
+            self._childRows = None
             parent.libraryAdded(self)
         return self
 
@@ -205,35 +229,68 @@ class Library():
             self._sortedCells = sorted(self.cells, lambda a, b: cmp(a.name.lower(), b.name.lower()))
         return self._sortedCells
 
+    @property
+    def sortedChildren(self):
+        """Cached list of sorted child libraries followed by sorted cells."""
+        if self._sortedChildren is None:
+            self._sortedChildren = self.sortedLibraries + self.sortedCells
+        return self._sortedChildren
+
+    def childRow(self, child):
+        """Row of a child library or cell in sortedChildren."""
+        if self._childRows is None:
+            self._childRows = dict((c, n) for (n, c) in enumerate(self.sortedChildren))
+        return self._childRows[child]
+
     def cellAdded(self, cell):
         self.cells.add(cell)
         self.cellNames[cell.name] = cell
+        self.root.nameIndex.add(cell.name, cell)
         self._sortedCells = None
+        self._sortedChildren = None
+        self._childRows = None
+        self.root.invalidateObjectCache()
+        self.root.childrenChanged(self)
         self.root.libraryChanged(self)
 
     def cellRemoved(self, cell):
         self.cells.remove(cell)
         del self.cellNames[cell.name]
+        self.root.nameIndex.remove(cell.name, cell)
         self._sortedCells = None
+        self._sortedChildren = None
+        self._childRows = None
+        self.root.invalidateObjectCache()
+        self.root.childrenChanged(self)
         self.root.libraryChanged(self)
         
     def cellChanged(self, cell):
-        self.root.libraryChanged(self)
+        self.root.nodeChanged(cell)
 
     def libraryAdded(self, library):
         self.libraries.add(library)
         self.libraryNames[library.name] = library
+        self.root.nameIndex.add(library.name, library)
         self._sortedLibraries = None
+        self._sortedChildren = None
+        self._childRows = None
+        self.root.invalidateObjectCache()
+        self.root.childrenChanged(self)
         self.root.libraryChanged(self)
 
     def libraryRemoved(self, library):
         self.libraries.remove(library)
         del self.libraryNames[library.name]
+        self.root.nameIndex.remove(library.name, library)
         self._sortedLibraries = None
+        self._sortedChildren = None
+        self._childRows = None
+        self.root.invalidateObjectCache()
+        self.root.childrenChanged(self)
         self.root.libraryChanged(self)
         
     def libraryChanged(self, library):
-        self.root.libraryChanged(self)
+        self.root.nodeChanged(library)
 
     def objectByPath(self, path, create=False):
         if self.cellNames.has_key(path.cellName):
@@ -276,6 +333,7 @@ class Library():
         return Symbol(self, cell)
         
     def remove(self):
+        self.database.checkThread()
         # remove child libraries&cells
         for c in list(self.cells):
             c.remove()
@@ -293,6 +351,7 @@ class Library():
         
 class Libraries():
     theLibraries = None
+    deferredPriority = 10 #library views refresh, after net processing
     
     @classmethod
     def createLibraries(cls, database):
@@ -305,8 +364,16 @@ class Libraries():
             self.database = database
             self._libraries = set()
             self._libraryNames = {}
-            self._libraryViews = set()
+            self._libraryViews = weakref.WeakSet()
             self._sortedLibraries = None
+            self._childRows = None
+            self._objectCache = {}
+            self._generation = 0
+            self._staleCellViews = set()
+            self._fallbackCellViews = set()
+            self._changedNodes = set()
+            self._changedData = set()
+            self._nameIndex = NameIndex()
         return self
             
     @property
@@ -317,6 +384,11 @@ class Libraries():
     def libraryNames(self):
         return self._libraryNames
 
+    @property
+    def nameIndex(self):
+        """Search index of library and cell names."""
+        return self._nameIndex
+
     @property
     def libraryViews(self):
         return self._libraryViews
@@ -329,13 +401,26 @@ class Libraries():
         #print self._sortedLibraries
         return self._sortedLibraries
 
+    def childRow(self, library):
+        """Row of a library in sortedLibraries."""
+        if self._childRows is None:
+            self._childRows = dict((c, n) for (n, c) in enumerate(self.sortedLibraries))
+        return self._childRows[library]
+
     def libraryViewAdded(self, view):
         self._libraryViews.add(view)
 
     def updateLibraryViews(self):
-        "Notify views that the libraries layout has changed"
+        """
+        Notify views which nodes have changed their children
+        or their data since the last notification.
+        """
+        changedNodes = self._changedNodes
+        changedData = self._changedData
+        self._changedNodes = set()
+        self._changedData = set()
         for v in self._libraryViews:
-            v.update()
+            v.update(changedNodes, changedData)
 
     def updateLibraryViewsPreparation(self):
         """
@@ -348,23 +433,85 @@ class Libraries():
     def libraryAdded(self, library):
         self.libraries.add(library)
         self.libraryNames[library.name] = library
+        self.nameIndex.add(library.name, library)
         self._sortedLibraries = None
+        self._childRows = None
+        self.invalidateObjectCache()
+        self.childrenChanged(self)
         self.database.requestDeferredProcessing(self)
 
     def libraryRemoved(self, library):
         self.libraries.remove(library)
         del self._libraryNames[library.name]
+        self.nameIndex.remove(library.name, library)
         self._sortedLibraries = None
+        self._childRows = None
+        self.invalidateObjectCache()
+        self.childrenChanged(self)
         self.database.requestDeferredProcessing(self)
         
     def libraryChanged(self, library):
+        self.nodeChanged(library)
+
+    def childrenChanged(self, node):
+        """
+        Record that children of a node (Libraries, Library or Cell)
+        were added or removed. Views are told once per deferred run.
+        """
+        self._changedNodes.add(node)
         self.database.requestDeferredProcessing(self)
 
+    def nodeChanged(self, node):
+        """Record that a library or a cell has changed."""
+        self._changedData.add(node)
+        self.database.requestDeferredProcessing(self)
+
+    @property
+    def generation(self):
+        """Counter incremented on every change of the library hierarchy."""
+        return self._generation
+
+    def invalidateObjectCache(self, cellView=None, added=False):
+        """
+        Forget resolved paths, called whenever the hierarchy changes.
+        Instance items bound to a removed (or replaced) cellView,
+        or to a fallback cellView when something was added,
+        are rebound on the next deferred run.
+        """
+        self._objectCache.clear()
+        self._generation += 1
+        if cellView:
+            self._staleCellViews.add(cellView)
+        if added:
+            self._staleCellViews |= self._fallbackCellViews
+        if self._staleCellViews:
+            self.database.requestDeferredProcessing(self)
+
+    def fallbackCellViewUsed(self, cellView):
+        if cellView:
+            self._fallbackCellViews.add(cellView)
+
+    def rebindInstanceItems(self):
+        """Ask instance items of stale cellViews to resolve their cellView again."""
+        cellViews = self._staleCellViews
+        self._staleCellViews = set()
+        for cv in cellViews:
+            for item in list(cv.items):
+                item.rebind()
+
     def objectByPath(self, path, create=False):
+        if not create:
+            key = path.key
+            if key in self._objectCache:
+                return self._objectCache[key]
         library = self.libraryByPath(path, create)
         if library and path.cellName:
-            return library.objectByPath(path, create)
-        return library
+            obj = library.objectByPath(path, create)
+        else:
+            obj = library
+        if not create:
+            self._objectCache[key] = obj
+        return obj
 
     def libraryByPath(self, path, create=False):
         if not path.absolute or not path.subLibrary:
@@ -398,6 +545,7 @@ class Libraries():
         Runs deferred processes of the Database class.
         Do not call it directly, Use Database.runDeferredProcesses(object)
         """
+        self.rebindInstanceItems()
         self.updateLibraryViews()
         
     def close(self):
@@ -405,6 +553,12 @@ class Libraries():
             pass
             #fix it
             #l.remove()
+        self._objectCache.clear()
+        self._staleCellViews.clear()
+        self._fallbackCellViews.clear()
+        self._changedNodes.clear()
+        self._changedData.clear()
+        self._nameIndex.clear()
         Libraries.theLibraries = None
                 
     def __repr__(self):
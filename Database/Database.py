@@ -21,11 +21,23 @@
 
 from Cells import *
 from Design import *
+from Transaction import Transaction
+from Journal import Journal
+from DesignStatistics import DesignStatistics
+from CallQueue import CallQueue
+from Perf import perf, timed
+from Memory import MemoryAccounting
+from Exceptions import ThreadError
+from thread import get_ident
+import heapq
+import time
+import weakref
 
 #print 'Database out'
 
 class Database():
     theDatabase = None
+    defaultDeferredPriority = 50
 
     @classmethod
     def createDatabase(cls, client):
@@ -37,10 +49,20 @@ class Database():
             self = cls()
             Database.theDatabase = self
             self._client = client
+            self._ownerThread = get_ident()
             self._libraries = Libraries.createLibraries(self)
             self._layers = None
             self._designs = Designs(self)
-            self._deferredProcessingObjects = set()
+            self._deferredRequests = {} #object -> (queue entry, request time)
+            self._deferredQueue = []    #heap of (priority, sequence, object)
+            self._deferredSequence = 0
+            self._deferredStats = weakref.WeakKeyDictionary()
+            self._transactionDepth = 0
+            self._transactionRequests = []
+            self._transactionElements = set()
+            self._journal = Journal(self)
+            self._designStatistics = DesignStatistics(self)
+            self._callQueue = CallQueue(self)
         return self
     
     @property
@@ -64,52 +86,223 @@ class Database():
     def designs(self):
         return self._designs
 
+    @property
+    def journal(self):
+        return self._journal
+
+    @property
+    def designStatistics(self):
+        return self._designStatistics
+
+    @property
+    def callQueue(self):
+        """Calls posted by other threads, see CallQueue."""
+        return self._callQueue
+
+    def checkThread(self):
+        """
+        Raise ThreadError unless called by the thread which created the
+        database (the GUI thread). Other threads post changes to the
+        callQueue instead.
+        """
+        if get_ident() != self._ownerThread:
+            raise ThreadError('database modified outside of its thread, ' +
+                              'post the change with mutate() instead')
+
+    def memoryUsage(self):
+        """Approximate memory use as a tree of MemoryNodes."""
+        return MemoryAccounting(self).account()
+
+    def undo(self):
+        return self.journal.undo()
+
+    def redo(self):
+        return self.journal.redo()
+
     def wasDeferredProcessingRequested(self, object=None):
         if object:
-            return object in self._deferredProcessingObjects
+            return object in self._deferredRequests
         else:
-            return len(self._deferredProcessingObjects) > 0
+            return len(self._deferredRequests) > 0
         
     def requestDeferredProcessing(self, object):
         """
         Request deferred processing of object's notifications.
-        Once per object. No priorities or order guarantees.
+        Requests are coalesced, once per object. Objects are processed
+        in order of their deferredPriority attribute (lower first),
+        then in order of requests.
+        The client is notified only when the queue becomes non-empty.
         """
-        self._deferredProcessingObjects.add(object)
+        self.checkThread()
+        if self._transactionDepth > 0:
+            if object not in self._transactionRequests:
+                self._transactionRequests.append(object)
+            return
+        if object in self._deferredRequests:
+            return
+        wasIdle = not self._deferredRequests
+        self._deferredSequence += 1
+        priority = getattr(object, 'deferredPriority', self.defaultDeferredPriority)
+        entry = (priority, self._deferredSequence, object)
+        self._deferredRequests[object] = (entry, time.time())
+        heapq.heappush(self._deferredQueue, entry)
         ##print self.__class__.__name__, "request", object
-        self.client.deferredProcessingRequested()
-        self.leaveCPU()
+        if wasIdle:
+            self.client.deferredProcessingRequested()
             
     def cancelDeferredProcessing(self, object):
         """
         Cancel deferred processing of a given object.
         For example, if it has already been triggered manually.
         """
-        self._deferredProcessingObjects.remove(object)
+        del self._deferredRequests[object]
+        #the queue entry is discarded when popped
+
+    def forgetDeferredProcessing(self, object):
+        """Drop pending requests and statistics of a removed object."""
+        self._deferredRequests.pop(object, None)
+        if object in self._transactionRequests:
+            self._transactionRequests.remove(object)
+        self._deferredStats.pop(object, None)
         
-    def runDeferredProcesses(self, object = None):
+    def _runDeferredProcess(self, object, requestTime):
+        start = time.time()
+        more = object.runDeferredProcess()
+        end = time.time()
+        perf.count('Database.deferredProcesses')
+        stats = self._deferredStats.get(object)
+        if not stats:
+            stats = {'runs': 0, 'latency': 0.0, 'maxLatency': 0.0,
+                     'runTime': 0.0, 'maxRunTime': 0.0}
+            self._deferredStats[object] = stats
+        latency = start - requestTime
+        runTime = end - start
+        stats['runs'] += 1
+        stats['latency'] += latency
+        stats['maxLatency'] = max(stats['maxLatency'], latency)
+        stats['runTime'] += runTime
+        stats['maxRunTime'] = max(stats['maxRunTime'], runTime)
+        if more:
+            self.requestDeferredProcessing(object)
+
+    @timed('Database.runDeferredProcesses')
+    def runDeferredProcesses(self, object = None, budget = None):
         """
-        Force execution of all deferred processes.
+        Execute deferred processes.
         To be called synchronously or from within the main loop
         (an "idle" function).
+        If object is given only its processes are executed.
+        Otherwise queued objects are processed in priority order until
+        the queue is empty or the time budget (in seconds) is exceeded.
+        An object's runDeferredProcess may return True to be requeued
+        when it has more work left.
+        Returns True if some processing is still pending.
         """
         if object:
             while self.wasDeferredProcessingRequested(object):
+                (entry, requestTime) = self._deferredRequests[object]
                 self.cancelDeferredProcessing(object)
-                object.runDeferredProcess()
-        else:
-            while self.wasDeferredProcessingRequested(object):
-                dpos = list(self._deferredProcessingObjects)
-                self._deferredProcessingObjects = set()
-                for o in dpos:
-                    ##print self.__class__.__name__, "run", o
-                    o.runDeferredProcess()
+                self._runDeferredProcess(object, requestTime)
+            return self.wasDeferredProcessingRequested()
+        if budget is not None:
+            deadline = time.time() + budget
+        queue = self._deferredQueue
+        requests = self._deferredRequests
+        while queue:
+            entry = heapq.heappop(queue)
+            o = entry[2]
+            if o not in requests or requests[o][0] is not entry:
+                continue #cancelled or already processed
+            requestTime = requests.pop(o)[1]
+            ##print self.__class__.__name__, "run", o
+            self._runDeferredProcess(o, requestTime)
+            if budget is not None and time.time() > deadline:
+                break
+        pending = self.wasDeferredProcessingRequested()
+        if not pending and not self.inTransaction:
+            self.journal.closeGroup()
+        return pending
             
+    @property
+    def deferredProcessingStats(self):
+        """
+        Per object statistics of deferred processing: number of runs,
+        total and maximum queue latency and run time (in seconds).
+        Objects are weakly referenced, entries of removed objects are
+        dropped.
+        """
+        return self._deferredStats
+
+    def resetDeferredProcessingStats(self):
+        self._deferredStats = weakref.WeakKeyDictionary()
+
+    @property
+    def inTransaction(self):
+        return self._transactionDepth > 0
+
+    def transaction(self):
+        """
+        Return a Transaction to be used in a 'with' statement.
+        Transactions can be nested, only the outermost one commits.
+        """
+        return Transaction(self)
+
+    def beginTransaction(self):
+        if self._transactionDepth == 0:
+            self.journal.closeGroup() #the open group holds only this transaction
+        self._transactionDepth += 1
+
+    def commitTransaction(self):
+        """
+        Close a transaction. When the outermost one is closed, changed
+        elements are reindexed and their views updated once, then all
+        buffered deferred processes (e.g. net checks of the touched
+        schematics and library/hierarchy view refreshes) run once.
+        """
+        self._transactionDepth -= 1
+        if self._transactionDepth > 0:
+            return
+        elements = self._transactionElements
+        requests = self._transactionRequests
+        self._transactionElements = set()
+        self._transactionRequests = []
+        for e in elements:
+            if e.diagram:
+                e.updateViews()
+        for o in requests:
+            self.requestDeferredProcessing(o)
+        self.runDeferredProcesses()
+        self.journal.closeGroup()
+
+    def rollbackTransaction(self):
+        """
+        Close a transaction which failed. When the outermost one is
+        closed, its recorded edits are reverted, then it is committed.
+        """
+        if self._transactionDepth == 1:
+            try:
+                self.journal.rollback()
+            finally:
+                self.commitTransaction()
+        else:
+            self.commitTransaction()
+
+    def elementChanged(self, element):
+        """
+        Called by elements when their views need an update.
+        Returns True if the update has been postponed by a transaction.
+        """
+        if self._transactionDepth > 0:
+            self._transactionElements.add(element)
+            return True
+        return False
+
     def leaveCPU(self):
         self.client.leaveCPU()
 
     def close(self):
         self.runDeferredProcesses()
+        self.journal.clear()
         self.designs.close()
         self.libraries.close()
         Database.theDatabase = None
@@ -23,6 +23,8 @@
 #from Cells import *
 #from Attributes import *
 from xml.etree import ElementTree as et
+from Perf import timed
+import weakref
 
 #print 'Design out'
 
@@ -31,13 +33,17 @@ class DesignUnit():
         self._instance = instance
         self._parentDesignUnit = parentDesignUnit
         self._name = instance.name
+        self._path = None
         self._childDesignUnits = {} #set()
+        self._childDesignUnitNames = {}
         self._sortedChildDesignUnits = None
+        self._childRows = None
         self._design = parentDesignUnit.design
         self._scene = None
         #self._index = Index()
         self.cellView.designUnitAdded(self)
         parentDesignUnit.childDesignUnitAdded(self)
+        self.design.designs.designUnitAdded(self)
  
     @property
     def name(self):
@@ -45,10 +51,14 @@ class DesignUnit():
 
     @property
     def path(self):
-        parent = self.parentDesignUnit
-        if parent.parentDesignUnit:
-            return parent.path + '.' + self.name
-        return parent.path + ':' + self.name
+        """Occurrence path, e.g. 'lib/cell/schematic:X1.X2' (cached)."""
+        if not self._path:
+            parent = self.parentDesignUnit
+            if parent.parentDesignUnit:
+                self._path = parent.path + '.' + self.name
+            else:
+                self._path = parent.path + ':' + self.name
+        return self._path
 
     @property
     def childDesignUnits(self):
@@ -68,6 +78,12 @@ class DesignUnit():
                 #self._childDesignUnits[i] = DesignUnit(i, self)
         return self._childDesignUnits
 
+    def childDesignUnitByName(self, name):
+        """Child design unit of a given instance name, or None."""
+        if len(self._childDesignUnits) == 0:
+            self.childDesignUnits #elaborate
+        return self._childDesignUnitNames.get(name)
+
     @property
     def sortedChildDesignUnits(self):
         """Cached list of designs units sorted by name."""
@@ -76,13 +92,27 @@ class DesignUnit():
         #print self._sortedChildDesignUnits
         return self._sortedChildDesignUnits
 
+    def childRow(self, designUnit):
+        """Row of a child design unit in sortedChildDesignUnits."""
+        if self._childRows is None:
+            self._childRows = dict((c, n) for (n, c) in enumerate(self.sortedChildDesignUnits))
+        return self._childRows[designUnit]
+
     @property
     def parentDesignUnit(self):
         return self._parentDesignUnit
 
+    @property
+    def statistics(self):
+        """Occurrence statistics of the hierarchy below this design unit."""
+        database = self.design.designs.database
+        return database.designStatistics.cellStatistics(self.cellView.cell)
+
     @property
     def scene(self):
-        return self._scene
+        """The scene showing this design unit, held by a weak reference."""
+        if self._scene:
+            return self._scene()
     
     @property
     def instance(self):
@@ -101,23 +131,32 @@ class DesignUnit():
         #else:
         #    return self.instance.instanceCellView
 
+    @timed('DesignUnit.sceneAdded')
     def sceneAdded(self, scene):
-        self._scene = scene
-        for e in self.cellView.elems:
-            e.addToView(scene)
+        self._scene = weakref.ref(scene)
+        scene.addElems(self.cellView.elems)
         
     def childDesignUnitAdded(self, designUnit):
         self._childDesignUnits[designUnit.instance] = designUnit
+        self._childDesignUnitNames.setdefault(designUnit.name, designUnit)
         self._sortedChildDesignUnits = None
+        self._childRows = None
         
     def childDesignUnitRemoved(self, designUnit):
         del self._childDesignUnits[designUnit.instance]
+        if self._childDesignUnitNames.get(designUnit.name) is designUnit:
+            del self._childDesignUnitNames[designUnit.name]
         self._sortedChildDesignUnits = None
+        self._childRows = None
 
     def updateItem(self):
         if self.scene:
             self.scene.updateItem()
 
+    def extentsChanged(self):
+        if self.scene:
+            self.scene.extentsChanged()
+
     def addInstance(self, instance):
         #designUnit = self._childDesignUnits.get(instance)
         #if not designUnit:
@@ -138,6 +177,7 @@ class DesignUnit():
             self.scene.instanceRemoved()
             self.cellView.DesignUnitRemoved(self)
         self.parentDesignUnit.childDesignUnitRemoved(self)
+        self.design.designs.designUnitRemoved(self)
         
     def __repr__(self):
         return "<DesignUnit '" + self.path + "'>"
@@ -147,8 +187,11 @@ class Design(DesignUnit):
         self._cellView = cellView
         self._designs = designs
         self._name = cellView.path
+        self._path = None
         self._childDesignUnits = {}
+        self._childDesignUnitNames = {}
         self._sortedChildDesignUnits = None
+        self._childRows = None
         self._scene = None
         self.cellView.designUnitAdded(self)
         designs.designAdded(self)
@@ -173,10 +216,10 @@ class Design(DesignUnit):
     def designs(self):
         return self._designs
         
+    @timed('Design.sceneAdded')
     def sceneAdded(self, scene):
-        self._scene = scene
-        for e in self.cellView.elems:
-            e.addToView(scene)
+        self._scene = weakref.ref(scene)
+        scene.addElems(self.cellView.elems)
             
     def sceneRemoved(self):
         self._scene = None
@@ -198,12 +241,16 @@ class Design(DesignUnit):
         return "<Design '" + self.path + "'>"
 
 class Designs():
+    deferredPriority = 20 #hierarchy views refresh
+    
     def __init__(self, database):
         self._database = database
         self._designs = set()
         self._designNames = {}
-        self._hierarchyViews = set()
+        self._designUnitPaths = {}
+        self._hierarchyViews = weakref.WeakSet()
         self._sortedDesigns = []
+        self._designRows = None
        
     @property
     def designs(self):
@@ -226,7 +273,14 @@ class Designs():
         """Preserve the order the designs were added."""
         return self._sortedDesigns
 
+    def designRow(self, design):
+        """Row of a design in sortedDesigns."""
+        if self._designRows is None:
+            self._designRows = dict((d, n) for (n, d) in enumerate(self._sortedDesigns))
+        return self._designRows[design]
+
     def installUpdateHierarchyViewsHook(self, view):
+        """Register a view, it is dropped when the view is deleted."""
         self.hierarchyViews.add(view)
 
     def updateHierarchyViews(self):
@@ -240,6 +294,7 @@ class Designs():
         self.designNames[design.name] = design
         #self.updateHierarchyViews()
         self._sortedDesigns.append(design)
+        self._designRows = None
         self.database.requestDeferredProcessing(self)
 
     def designRemoved(self, design):
@@ -247,12 +302,34 @@ class Designs():
         self.designs.remove(design)
         del self.designNames[design.name]
         #self.updateHierarchyViews()
-        del self._sortedDesigns[self._sortedDesigns.index(design)]
+        del self._sortedDesigns[self.designRow(design)]
+        self._designRows = None
         self.database.requestDeferredProcessing(self)
         
+    def designUnitAdded(self, designUnit):
+        self._designUnitPaths.setdefault(designUnit.path, designUnit)
+
+    def designUnitRemoved(self, designUnit):
+        if self._designUnitPaths.get(designUnit.path) is designUnit:
+            del self._designUnitPaths[designUnit.path]
+
     def designUnitByPath(self, pathName):
+        """
+        Find a design ('lib/cell/view') or an occurrence within it
+        ('lib/cell/view:X1.X2.R5'), elaborating the hierarchy on the way.
+        """
         if pathName in self.designNames:
             return self.designNames[pathName]
+        if pathName in self._designUnitPaths:
+            return self._designUnitPaths[pathName]
+        (designName, sep, instancePathName) = pathName.partition(':')
+        designUnit = self.designNames.get(designName)
+        if designUnit and instancePathName:
+            for name in instancePathName.split('.'):
+                designUnit = designUnit.childDesignUnitByName(name)
+                if not designUnit:
+                    break
+            return designUnit
         
     def runDeferredProcess(self):
         """Runs deferred processes."""
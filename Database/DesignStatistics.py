@@ -0,0 +1,143 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+from Exceptions import HierarchyError
+
+class CellStatistics():
+    """Occurrence statistics of the hierarchy below a cell."""
+    def __init__(self, cell, occurrences, depth, deviceCount):
+        self._cell = cell
+        self._occurrences = occurrences
+        self._depth = depth
+        self._deviceCount = deviceCount
+
+    @property
+    def cell(self):
+        return self._cell
+
+    @property
+    def occurrences(self):
+        """Dictionary: cell -> number of its occurrences below this cell."""
+        return self._occurrences
+
+    @property
+    def instanceCount(self):
+        return sum(self._occurrences.values())
+
+    @property
+    def depth(self):
+        return self._depth
+
+    @property
+    def deviceCount(self):
+        """Number of occurrences of leaf cells (without instances)."""
+        return self._deviceCount
+
+    def __repr__(self):
+        return "<CellStatistics '" + self.cell.path + "' instances: " + \
+            str(self.instanceCount) + " devices: " + str(self.deviceCount) + \
+            " depth: " + str(self.depth) + ">"
+
+class DesignStatistics():
+    """
+    Whole-design statistics computed from per-cell instance multisets.
+    Occurrence counts are multiplied up the hierarchy, so no design unit
+    is ever elaborated. Results are memoized per cell and invalidated
+    when a schematic's instance set or the library hierarchy changes.
+    """
+    def __init__(self, database):
+        self._database = database
+        self._cellInstances = {}    #cell -> {instantiated cell: count}
+        self._cellStatistics = {}   #cell -> CellStatistics
+        self._parentCells = {}      #cell -> set of cells instantiating it
+        self._visiting = set()
+        self._generation = None
+
+    @property
+    def database(self):
+        return self._database
+
+    def validate(self):
+        generation = self.database.libraries.generation
+        if self._generation != generation:
+            self.clear()
+            self._generation = generation
+
+    def clear(self):
+        self._cellInstances = {}
+        self._cellStatistics = {}
+        self._parentCells = {}
+
+    def cellChanged(self, cell):
+        """Forget results of a cell and of all cells instantiating it."""
+        pending = [cell]
+        while pending:
+            c = pending.pop()
+            self._cellInstances.pop(c, None)
+            if self._cellStatistics.pop(c, None):
+                pending.extend(self._parentCells.get(c, ()))
+
+    def cellInstances(self, cell):
+        """Multiset (cell -> count) of cells instantiated in the cell's schematic."""
+        self.validate()
+        counts = self._cellInstances.get(cell)
+        if counts is None:
+            counts = {}
+            schematic = cell.cellViewByName('schematic')
+            if schematic:
+                for i in schematic.instances:
+                    c = i.instanceCell
+                    if c:
+                        counts[c] = counts.get(c, 0) + 1
+            for c in counts:
+                self._parentCells.setdefault(c, set()).add(cell)
+            self._cellInstances[cell] = counts
+        return counts
+
+    def cellStatistics(self, cell):
+        """Statistics of the hierarchy below a cell (memoized)."""
+        self.validate()
+        stats = self._cellStatistics.get(cell)
+        if stats:
+            return stats
+        if cell in self._visiting:
+            raise HierarchyError(cell.path, "Recursive instantiation")
+        self._visiting.add(cell)
+        try:
+            occurrences = {}
+            depth = 0
+            deviceCount = 0
+            for (c, n) in self.cellInstances(cell).iteritems():
+                s = self.cellStatistics(c)
+                occurrences[c] = occurrences.get(c, 0) + n
+                for (d, m) in s.occurrences.iteritems():
+                    occurrences[d] = occurrences.get(d, 0) + n * m
+                depth = max(depth, s.depth + 1)
+                if s.occurrences:
+                    deviceCount += n * s.deviceCount
+                else:
+                    deviceCount += n
+        finally:
+            self._visiting.discard(cell)
+        stats = CellStatistics(cell, occurrences, depth, deviceCount)
+        self._cellStatistics[cell] = stats
+        return stats
+
+    def __repr__(self):
+        return "<DesignStatistics " + str(len(self._cellStatistics)) + " cells>"
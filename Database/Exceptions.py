@@ -29,3 +29,15 @@ class PathError(DatabaseError):
     def __str__(self):
         return repr(self.path + ": " + self.msg)
 
+class ThreadError(DatabaseError):
+    """Database modified by a thread other than its owner."""
+    pass
+
+class HierarchyError(DatabaseError):
+    def __init__(self, path, msg=''):
+        self.path = path
+        self.msg = msg
+        
+    def __str__(self):
+        return repr(self.path + ": " + self.msg)
+
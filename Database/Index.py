@@ -88,10 +88,15 @@ class Index():
             self._solderDotsAtCoord[p].add(solderDot) # multiple solder dots at same location?
         else:
             self._solderDotsAtCoord[p] = set([solderDot])
+        self._coordsOfSolderDot[solderDot] = p
             
     def solderDotRemoved(self, solderDot):
         if solderDot in self._coordsOfSolderDot:
+            p = self._coordsOfSolderDot[solderDot]
             del self._coordsOfSolderDot[solderDot]
+            self._solderDotsAtCoord[p].remove(solderDot)
+            if len(self._solderDotsAtCoord[p]) == 0:
+                del self._solderDotsAtCoord[p]
     
     def netSegmentsAt(self, x, y):
         return self.netSegmentsEndPointsAt(x, y) | self.netSegmentsMidPointsAt(x, y)
@@ -0,0 +1,298 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+class Journal(object):
+    """
+    Undo/redo journal of element edits.
+
+    Edits are recorded as deltas of element states. A state is a tuple
+    (class, diagram, layers, geometry, properties) from which the
+    element can be recreated. Elements are referred to by stable keys,
+    so that recreated elements take over the records of the original
+    ones.
+
+    Deltas are grouped: a group is closed when the outermost
+    transaction commits or when deferred processing becomes idle.
+    A group is a list of (kind, key, before, after) records, at most
+    one per key, where kind is 'add', 'remove' or 'change'.
+    Groups older than depth are merged (compacted) into a single one.
+    Keys are reference counted by the groups on the undo/redo stacks,
+    elements whose keys are no longer referenced are released.
+    """
+    ADD = 'add'
+    REMOVE = 'remove'
+    CHANGE = 'change'
+
+    def __init__(self, database, depth=100):
+        self._database = database
+        self._depth = depth
+        self._undoGroups = []
+        self._redoGroups = []
+        self._group = {}      #key -> [kind, before]
+        self._groupOrder = [] #keys in order of first record
+        self._keys = {}       #element -> key
+        self._elements = {}   #key -> element
+        self._refs = {}       #key -> number of groups referring to it
+        self._lastKey = 0
+        self._suspended = 0
+        self._replaying = False
+
+    @property
+    def database(self):
+        return self._database
+
+    @property
+    def depth(self):
+        return self._depth
+
+    @depth.setter
+    def depth(self, depth):
+        self._depth = max(1, depth)
+        self.compact()
+
+    @property
+    def recording(self):
+        return not self._suspended and not self._replaying
+
+    @property
+    def undoDepth(self):
+        return len(self._undoGroups) + (1 if self._group else 0)
+
+    @property
+    def redoDepth(self):
+        return len(self._redoGroups)
+
+    def suspend(self):
+        """Stop recording, e.g. while importing. Calls can be nested."""
+        self._suspended += 1
+
+    def resume(self):
+        self._suspended -= 1
+
+    @staticmethod
+    def state(element):
+        return (element.__class__, element.diagram, element.layers,
+                element.geometry, element.properties)
+
+    def key(self, element):
+        key = self._keys.get(element)
+        if key is None:
+            self._lastKey += 1
+            key = self._lastKey
+            self._bind(key, element)
+        return key
+
+    def _bind(self, key, element):
+        old = self._elements.get(key)
+        if old is not None:
+            del self._keys[old]
+        self._elements[key] = element
+        self._keys[element] = key
+
+    def _retain(self, group):
+        refs = self._refs
+        for record in group:
+            key = record[1]
+            refs[key] = refs.get(key, 0) + 1
+
+    def _release(self, group):
+        refs = self._refs
+        for record in group:
+            key = record[1]
+            refs[key] -= 1
+            if not refs[key]:
+                del refs[key]
+                self._forget(key)
+
+    def _forget(self, key):
+        """Unbind a key which is not referenced by any group."""
+        if key in self._refs or key in self._group:
+            return
+        element = self._elements.pop(key, None)
+        if element is not None:
+            del self._keys[element]
+
+    def _record(self, kind, key, before):
+        group = self._group
+        if key not in group:
+            group[key] = [kind, before]
+            self._groupOrder.append(key)
+            return
+        entry = group[key]
+        if kind == self.REMOVE:
+            if entry[0] == self.ADD:
+                del group[key]
+                self._groupOrder.remove(key)
+                self._forget(key)
+            else:
+                entry[0] = self.REMOVE
+        elif kind == self.ADD and entry[0] == self.REMOVE:
+            entry[0] = self.CHANGE
+
+    def elementAdded(self, element):
+        if self.recording:
+            self._record(self.ADD, self.key(element), None)
+
+    def elementAboutToChange(self, element):
+        if self.recording:
+            self._record(self.CHANGE, self.key(element), self.state(element))
+
+    def elementRemoved(self, element):
+        if self.recording:
+            self._record(self.REMOVE, self.key(element), self.state(element))
+
+    def _takeGroup(self):
+        """Turn recorded edits into a group of deltas."""
+        group = []
+        for key in self._groupOrder:
+            (kind, before) = self._group[key]
+            after = None
+            if kind != self.REMOVE:
+                after = self.state(self._elements[key])
+            if kind == self.CHANGE and before == after:
+                continue
+            group.append((kind, key, before, after))
+        self._group = {}
+        self._groupOrder = []
+        return group
+
+    def closeGroup(self):
+        """
+        Turn recorded edits into a group of deltas on the undo stack.
+        """
+        if not self._group:
+            return
+        keys = self._groupOrder
+        group = self._takeGroup()
+        if group:
+            self._undoGroups.append(group)
+            self._retain(group)
+            for g in self._redoGroups:
+                self._release(g)
+            self._redoGroups = []
+            self.compact()
+        for key in keys:
+            self._forget(key)
+
+    @classmethod
+    def merge(cls, group1, group2):
+        """Compose two consecutive groups into one."""
+        records = {}
+        order = []
+        for (kind, key, before, after) in group1 + group2:
+            if key not in records:
+                records[key] = [kind, before, after]
+                order.append(key)
+                continue
+            r = records[key]
+            if kind == cls.REMOVE:
+                if r[0] == cls.ADD:
+                    del records[key]
+                    order.remove(key)
+                    continue
+                r[0] = cls.REMOVE
+            elif kind == cls.ADD and r[0] == cls.REMOVE:
+                r[0] = cls.CHANGE
+            r[2] = after
+        return [(records[k][0], k, records[k][1], records[k][2]) for k in order]
+
+    def compact(self):
+        while len(self._undoGroups) > self._depth:
+            (group1, group2) = self._undoGroups[0:2]
+            merged = self.merge(group1, group2)
+            self._undoGroups[0:2] = [merged]
+            self._retain(merged)
+            self._release(group1)
+            self._release(group2)
+
+    def _create(self, key, state):
+        (cls, diagram, layers, geometry, properties) = state
+        element = cls(diagram, layers, *geometry)
+        element.setProperties(properties)
+        self._bind(key, element)
+
+    def _apply(self, key, state):
+        element = self._elements[key]
+        if (element.__class__ != state[0] or element.diagram != state[1] or
+            element.geometry != state[3]):
+            element.remove()
+            self._create(key, state)
+        else:
+            element.setProperties(state[4])
+
+    def _replay(self, group, undo):
+        self._replaying = True
+        try:
+            with self.database.transaction():
+                if undo:
+                    for (kind, key, before, after) in reversed(group):
+                        if kind == self.ADD:
+                            self._elements[key].remove()
+                        elif kind == self.REMOVE:
+                            self._create(key, before)
+                        else:
+                            self._apply(key, before)
+                else:
+                    for (kind, key, before, after) in group:
+                        if kind == self.ADD:
+                            self._create(key, after)
+                        elif kind == self.REMOVE:
+                            self._elements[key].remove()
+                        else:
+                            self._apply(key, after)
+        finally:
+            self._replaying = False
+
+    def rollback(self):
+        """Revert recorded edits which are not grouped yet."""
+        keys = self._groupOrder
+        group = self._takeGroup()
+        if group:
+            self._replay(group, True)
+        for key in keys:
+            self._forget(key)
+
+    def undo(self):
+        """Revert the last group of edits. Returns False if there is none."""
+        self.closeGroup()
+        if not self._undoGroups:
+            return False
+        group = self._undoGroups.pop()
+        self._replay(group, True)
+        self._redoGroups.append(group)
+        return True
+
+    def redo(self):
+        """Reapply the last undone group. Returns False if there is none."""
+        self.closeGroup()
+        if not self._redoGroups:
+            return False
+        group = self._redoGroups.pop()
+        self._replay(group, False)
+        self._undoGroups.append(group)
+        return True
+
+    def clear(self):
+        self._undoGroups = []
+        self._redoGroups = []
+        self._group = {}
+        self._groupOrder = []
+        self._keys = {}
+        self._elements = {}
+        self._refs = {}
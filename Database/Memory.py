@@ -0,0 +1,210 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+from collections import deque
+from Primitives import Element
+
+plainTypes = (str, unicode, int, long, float, bool, type(None))
+containerTypes = (list, tuple, set, frozenset, dict, deque)
+
+def dataSize(data, seen):
+    """
+    Approximate size in bytes of plain data and containers, including
+    their contents. Other objects are references and are not followed.
+    Objects whose id is in seen are not counted again.
+    """
+    if id(data) in seen:
+        return 0
+    if isinstance(data, plainTypes):
+        seen.add(id(data))
+        return sys.getsizeof(data)
+    if not isinstance(data, containerTypes):
+        return 0
+    seen.add(id(data))
+    size = sys.getsizeof(data)
+    if isinstance(data, dict):
+        for (k, v) in data.iteritems():
+            size += dataSize(k, seen) + dataSize(v, seen)
+    else:
+        for v in data:
+            size += dataSize(v, seen)
+    return size
+
+def objectSize(obj, seen):
+    """Size of an object with its attributes (see dataSize)."""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    d = getattr(obj, '__dict__', None)
+    if d is not None:
+        size += dataSize(d, seen)
+    return size
+
+
+class MemoryNode():
+    """Bytes and number of objects accounted to a named part of the database."""
+    def __init__(self, name):
+        self._name = name
+        self._bytes = 0
+        self._objects = 0
+        self._children = []
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    @property
+    def objects(self):
+        return self._objects
+
+    @property
+    def children(self):
+        return self._children
+
+    @property
+    def totalBytes(self):
+        return self._bytes + sum(c.totalBytes for c in self._children)
+
+    @property
+    def totalObjects(self):
+        return self._objects + sum(c.totalObjects for c in self._children)
+
+    def add(self, bytes, objects = 1):
+        self._bytes += bytes
+        self._objects += objects
+
+    def child(self, name):
+        node = MemoryNode(name)
+        self._children.append(node)
+        return node
+
+    def childByName(self, name):
+        for c in self._children:
+            if c.name == name:
+                return c
+
+    def report(self, depth = 2, indent = ''):
+        """Tree of total sizes, largest first, down to a given depth."""
+        lines = ['%-50s %12d %10d' % (indent + self.name, self.totalBytes, self.totalObjects)]
+        if depth > 0:
+            for c in sorted(self._children, key=lambda c: -c.totalBytes):
+                lines.append(c.report(depth - 1, indent + '  '))
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return '%-50s %12s %10s\n' % ('', 'bytes', 'objects') + self.report()
+
+
+class MemoryAccounting():
+    """
+    Approximate memory use of the database: libraries, cell views with
+    their elements and indices, designs and the scenes showing them.
+    Sizes come from sys.getsizeof on objects and the plain data they
+    own, each object is counted once. Element view registrations are
+    tallied separately, registrations of views detached from their
+    scene usually indicate a leak.
+    """
+    def __init__(self, database):
+        self._database = database
+
+    @property
+    def database(self):
+        return self._database
+
+    def account(self):
+        self._seen = set()
+        root = MemoryNode('database')
+        root.add(objectSize(self.database, self._seen))
+        self._views = root.child('views')
+        self._detachedViews = root.child('views (detached)')
+        libraries = self.database.libraries
+        node = root.child('libraries')
+        node.add(objectSize(libraries, self._seen))
+        for library in libraries.libraries:
+            self.accountLibrary(library, node)
+        designs = self.database.designs
+        node = root.child('designs')
+        node.add(objectSize(designs, self._seen))
+        for design in designs.designs:
+            self.accountDesignUnit(design, node)
+        self._seen = None
+        return root
+
+    def accountLibrary(self, library, parent):
+        node = parent.child(library.name)
+        node.add(objectSize(library, self._seen))
+        for l in library.libraries:
+            self.accountLibrary(l, node)
+        for cell in library.cells:
+            cellNode = node.child(cell.name)
+            cellNode.add(objectSize(cell, self._seen))
+            for cellView in cell.cellViews:
+                self.accountCellView(cellView, cellNode)
+
+    def accountCellView(self, cellView, parent):
+        seen = self._seen
+        node = parent.child(cellView.name)
+        node.add(objectSize(cellView, seen))
+        elements = node.child('elements')
+        for (name, value) in cellView.__dict__.items():
+            if isinstance(value, (set, list)):
+                for e in value:
+                    if isinstance(e, Element):
+                        self.accountElement(e, elements)
+            elif name in ('_index', '_spatialIndex') and value is not None:
+                node.child(name[1:]).add(objectSize(value, seen))
+
+    def accountElement(self, element, node):
+        seen = self._seen
+        if id(element) in seen:
+            return
+        node.add(objectSize(element, seen))
+        for view in element.views:
+            if id(view) in seen:
+                continue
+            size = sys.getsizeof(view)
+            seen.add(id(view))
+            scene = getattr(view, 'scene', None)
+            if callable(scene) and scene() is None:
+                self._detachedViews.add(size)
+            else:
+                self._views.add(size)
+
+    def accountDesignUnit(self, designUnit, parent):
+        node = parent.child(designUnit.name)
+        node.add(objectSize(designUnit, self._seen))
+        scene = designUnit.scene
+        if scene is not None and id(scene) not in self._seen:
+            self._seen.add(id(scene))
+            items = getattr(scene, 'items', None)
+            items = items() if callable(items) else ()
+            sceneNode = node.child('scene')
+            sceneNode.add(sys.getsizeof(scene))
+            for item in items:
+                if id(item) not in self._seen:
+                    self._seen.add(id(item))
+                    sceneNode.add(sys.getsizeof(item))
+        for child in designUnit._childDesignUnits.values(): #no elaboration
+            self.accountDesignUnit(child, node)
@@ -0,0 +1,130 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+class NameIndex():
+    """
+    Trigram index of object names for incremental searching.
+    Names are case-insensitive and kept as unicode, byte string names
+    are decoded as UTF-8. Each name is split into trigrams of
+    the name padded with '$' at both ends; a substring query only has
+    to verify names sharing all trigrams of the query.
+    """
+    def __init__(self):
+        self._objects = {}  #lowercase name -> set of objects
+        self._trigrams = {} #trigram -> set of lowercase names
+
+    @staticmethod
+    def key(name):
+        """Lowercase unicode form of a name or query."""
+        if isinstance(name, str):
+            name = name.decode('utf-8', 'replace')
+        return name.lower()
+
+    @staticmethod
+    def trigrams(name, pad=True):
+        if pad:
+            name = '$' + name + '$'
+        return set(name[i:i+3] for i in range(len(name)-2))
+
+    def __len__(self):
+        return sum(len(o) for o in self._objects.itervalues())
+
+    def add(self, name, obj):
+        if not name:
+            return
+        name = self.key(name)
+        objects = self._objects.get(name)
+        if objects is None:
+            objects = self._objects[name] = set()
+            for t in self.trigrams(name):
+                self._trigrams.setdefault(t, set()).add(name)
+        objects.add(obj)
+
+    def remove(self, name, obj):
+        if not name:
+            return
+        name = self.key(name)
+        objects = self._objects.get(name)
+        if objects is None:
+            return
+        objects.discard(obj)
+        if not objects:
+            del self._objects[name]
+            for t in self.trigrams(name):
+                names = self._trigrams[t]
+                names.discard(name)
+                if not names:
+                    del self._trigrams[t]
+
+    def clear(self):
+        self._objects = {}
+        self._trigrams = {}
+
+    def matchingNames(self, text):
+        """Set of (lowercase) names containing the text."""
+        text = self.key(text)
+        trigrams = self.trigrams(text, False)
+        if not trigrams:
+            return set(n for n in self._objects if text in n)
+        postings = sorted((self._trigrams.get(t, ()) for t in trigrams), key=len)
+        if not postings[0]:
+            return set()
+        names = set(postings[0])
+        for p in postings[1:]:
+            names &= p
+        return set(n for n in names if text in n)
+
+    def similarNames(self, text):
+        """Dictionary: name -> number of padded trigrams shared with the text."""
+        counts = {}
+        for t in self.trigrams(self.key(text)):
+            for n in self._trigrams.get(t, ()):
+                counts[n] = counts.get(n, 0) + 1
+        return counts
+
+    def search(self, text, fuzzy=False, limit=None):
+        """
+        List of objects whose names contain the text, best matches
+        first (exact, prefix, other substrings). With fuzzy set, names
+        sharing at least half of the text's trigrams are appended,
+        ranked by the number of shared trigrams.
+        """
+        text = self.key(text)
+        ranked = []
+        names = self.matchingNames(text)
+        for n in names:
+            if n == text:
+                rank = 0
+            elif n.startswith(text):
+                rank = 1
+            else:
+                rank = 2
+            ranked.append((rank, 0, len(n), n))
+        if fuzzy:
+            threshold = max(1, len(self.trigrams(text)) // 2)
+            for (n, count) in self.similarNames(text).iteritems():
+                if count >= threshold and not n in names:
+                    ranked.append((3, -count, len(n), n))
+        ranked.sort()
+        result = []
+        for r in ranked:
+            result.extend(self._objects[r[3]])
+            if limit and len(result) >= limit:
+                return result[:limit]
+        return result
@@ -19,112 +19,148 @@
 
 from Exceptions import PathError
 
-class Path():
-    def __init__(self, pathName=None):
+class Path(object):
+    """
+    Immutable, parsed path name.
+    Paths created from path names are interned, derived paths
+    (descend, cell, library, parentLibrary) are memoized.
+    """
+    maxInterned = 10000
+    _interned = {}
+
+    def __init__(self, pathName=None, libraryPath=(), cellName=None, cellViewName=None, absolute=False):
+        self._libraryPath = tuple(libraryPath)
+        self._cellName = cellName
+        self._cellViewName = cellViewName
+        self._absolute = absolute
+        self._name = None
+        self._key = None
+        self._descend = None
+        self._cell = None
+        self._library = None
+        self._parentLibrary = None
         if pathName:
-            self._libraryPath = None
-            self.cellName = None
-            self.cellViewName = None
-            self.absolute = False
             self.parse(pathName)
-    
+
     @classmethod
     def createFromPathName(cls, pathName):
-        self = cls(pathName)
+        """Return the interned path object for a given path name."""
+        self = cls._interned.get(pathName)
+        if not self:
+            self = cls(pathName)
+            if len(cls._interned) >= cls.maxInterned:
+                cls._interned.clear()
+            cls._interned[pathName] = self
         return self
 
     @classmethod
     def createFromNames(cls, pathName, cellName=None, cellViewName=None):
-        self = cls()
-        self._libraryPath = None
-        self.cellName = cellName
-        self.cellViewName = cellViewName
-        self.absolute = False
-        self.parseLibPath(pathName, pathName)
-        if (cellViewName and cellViewName != '') and \
-            (not cellName or cellName == ''):
-            raise PathError(pathName + '//' + cellViewName, "Empty cell name")
-        return self
+        name = pathName
+        if cellName or cellViewName:
+            name += '/' + (cellName or '')
+        if cellViewName:
+            name += '/' + cellViewName
+        return cls.createFromPathName(name)
 
     @classmethod
     def createFromPath(cls, path, idxStart=0, idxEnd=None):
-        self = cls()
-        self._origPath = path
-        self._libraryPath = None
-        self.cellName = path.cellName
-        self.cellViewName = path.cellViewName
-        self.absolute = path.absolute
-        self._idxStart = idxStart
-        self._idxEnd = idxEnd
-        return self
-        
+        return cls(None, path._libraryPath[idxStart:idxEnd],
+            path.cellName, path.cellViewName, path.absolute)
+
+    @classmethod
+    def clearInterned(cls):
+        cls._interned.clear()
+
     @property
     def name(self):
-        s = ''
-        if not self.absolute and self.subLibrary:
-            for n in self.libraryPath:
-                s += ('.' + str(n))
-        elif not self.absolute:
-            s += '.'
-        else:
-            s += str(self.libraryPath[0])
-            for n in self.libraryPath[1:]:
-                s += ('.' + str(n))
-        if self.cellName:
-            s += ('/' + str(self.cellName))
-        if self.cellViewName:
-            s += ('/' + str(self.cellViewName))
-        return s
+        if self._name is None:
+            s = ''
+            if not self.absolute and self.subLibrary:
+                for n in self._libraryPath:
+                    s += ('.' + str(n))
+            elif not self.absolute:
+                s += '.'
+            else:
+                s += '.'.join(map(str, self._libraryPath))
+            if self.cellName:
+                s += ('/' + str(self.cellName))
+            if self.cellViewName:
+                s += ('/' + str(self.cellViewName))
+            self._name = s
+        return self._name
+
+    @property
+    def key(self):
+        """Hashable tuple identifying the path."""
+        if not self._key:
+            self._key = (self._absolute, self._libraryPath, self._cellName, self._cellViewName)
+        return self._key
 
     @property
     def libraryPath(self):
-        if self._libraryPath:
-            return self._libraryPath
-        else:
-            lp = self._origPath.libraryPath[self._idxStart:self._idxEnd]
-            return lp
-        
+        return list(self._libraryPath)
+
+    @property
+    def cellName(self):
+        return self._cellName
+
+    @property
+    def cellViewName(self):
+        return self._cellViewName
+
+    @property
+    def absolute(self):
+        return self._absolute
+
     @property
     def libraryName(self):
-        if len(self.libraryPath) > 0:
-            return self.libraryPath[0]
+        if len(self._libraryPath) > 0:
+            return self._libraryPath[0]
         return ''
 
     @property
     def subLibrary(self):
-        if len(self.libraryPath) > 0:
-            return self.libraryPath[0]
+        if len(self._libraryPath) > 0:
+            return self._libraryPath[0]
         else:
             return None
 
     @property
     def descend(self):
-        p = Path.createFromPath(self, 1)
-        p.absolute = False
-        return p
-        
+        if not self._descend:
+            self._descend = Path(None, self._libraryPath[1:],
+                self.cellName, self.cellViewName, False)
+        return self._descend
+
     @property
     def cell(self):
-        p = Path.createFromPath(self)
-        p.cellViewName=None
-        return p
-        
+        if not self._cell:
+            if self.cellViewName:
+                self._cell = Path(None, self._libraryPath,
+                    self.cellName, None, self.absolute)
+            else:
+                self._cell = self
+        return self._cell
+
     @property
     def library(self):
-        p = Path.createFromPath(self)
-        p.cellViewName=None
-        p.cellName=None
-        return p
-        
+        if not self._library:
+            if self.cellName or self.cellViewName:
+                self._library = Path(None, self._libraryPath,
+                    None, None, self.absolute)
+            else:
+                self._library = self
+        return self._library
+
     @property
     def parentLibrary(self):
-        if len(self.libraryPath) > 1:
-            p = Path.createFromPath(self, 0, -1)
-            p.cellViewName=None
-            p.cellName=None
-            return p
+        if len(self._libraryPath) > 1:
+            if not self._parentLibrary:
+                self._parentLibrary = Path(None, self._libraryPath[:-1],
+                    None, None, self.absolute)
+            return self._parentLibrary
         raise PathError('', "Empty path name")
-        
+
     def parse(self, name):
         if name == '':
             raise PathError(name, "Empty path name")
@@ -134,39 +170,38 @@ class Path():
             (cellName, sep, rest2) = rest.partition('/')
             if cellName == '':
                 raise PathError(name, "Empty cell name")
-            self.cellName = cellName
+            self._cellName = cellName
             if rest2 != '':
                 (cellViewName, sep, rest3) = rest2.partition('/')
                 if cellViewName == '':
                     raise PathError(name, "Empty cell view name")
                 if rest3 != '':
                     raise PathError(name, "Additional characters after the cell view name")
-                self.cellViewName = cellViewName
-        
+                self._cellViewName = cellViewName
+
     def parseLibPath(self, libPath, origName):
         if libPath == '':
             raise PathError(origName, "Unspecified library path name")
-        (first, sep, rest) = libPath.partition('.')
-        self.libraryPath = []
-        if first != '':
-            self.absolute = True
-            self.libraryPath.append(first)
+        names = libPath.split('.')
+        if names[0] != '':
+            self._absolute = True
         else:
-            self.absolute = False
-            #self.libraryPath.append('.')
-            if rest == '':
-                return
-        if sep != '':
-            self.parseLibPathRec(rest, origName)
-
-    def parseLibPathRec(self, libPath, origName):
-        (first, sep, rest) = libPath.partition('.')
-        if libPath == '' or first == '':
+            self._absolute = False
+            names = names[1:]
+            if names == ['']:
+                names = []
+        if '' in names:
             raise PathError(origName, "Incorrect library path name")
-        self.libraryPath.append(first)
-        if sep != '':
-            self.parseLibPathRec(rest, origName)
+        self._libraryPath = tuple(names)
+
+    def __eq__(self, other):
+        return isinstance(other, Path) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.key)
 
     def __repr__(self):
         return "Path('" + self.name + "')"
-        
\ No newline at end of file
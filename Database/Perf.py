@@ -0,0 +1,180 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import json
+import threading
+import functools
+
+class Timer():
+    """Context manager measuring one run of a named timer."""
+    def __init__(self, perf, name):
+        self._perf = perf
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self._perf.record(self._name, self._start, time.time())
+        return False
+
+
+class NullTimer():
+    """Shared do-nothing timer returned while profiling is disabled."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return False
+
+
+class Perf():
+    """
+    Named timers and counters for instrumenting hot paths.
+    Collection is disabled by default, instrumented code then only
+    checks the enabled flag. Optionally each timer run is also recorded
+    as an event that can be saved in the Chrome trace-event format
+    (chrome://tracing).
+    """
+    maxEvents = 1000000
+
+    def __init__(self):
+        self._enabled = False
+        self._tracing = False
+        self._nullTimer = NullTimer()
+        self.reset()
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @property
+    def tracing(self):
+        return self._tracing
+
+    def enable(self, tracing = False):
+        self._enabled = True
+        self._tracing = tracing
+
+    def disable(self):
+        self._enabled = False
+        self._tracing = False
+
+    def reset(self):
+        self._timers = {}   #name -> [runs, total, max]
+        self._counters = {} #name -> count
+        self._events = []
+        self._origin = time.time()
+
+    @property
+    def timers(self):
+        """name -> (runs, total time, maximum time), in seconds."""
+        return dict((name, tuple(t)) for (name, t) in self._timers.items())
+
+    @property
+    def counters(self):
+        return dict(self._counters)
+
+    def timer(self, name):
+        """Return a context manager timing its block as name."""
+        if self._enabled:
+            return Timer(self, name)
+        return self._nullTimer
+
+    def record(self, name, start, end):
+        t = self._timers.get(name)
+        if not t:
+            t = [0, 0.0, 0.0]
+            self._timers[name] = t
+        duration = end - start
+        t[0] += 1
+        t[1] += duration
+        if duration > t[2]:
+            t[2] = duration
+        if self._tracing and len(self._events) < self.maxEvents:
+            self._events.append(('X', name, start, duration,
+                                 threading.current_thread().ident))
+
+    def count(self, name, n = 1):
+        if self._enabled:
+            value = self._counters.get(name, 0) + n
+            self._counters[name] = value
+            if self._tracing and len(self._events) < self.maxEvents:
+                self._events.append(('C', name, time.time(), value,
+                                     threading.current_thread().ident))
+
+    def summary(self, n = 3):
+        """One line with the n timers of the largest total time."""
+        timers = sorted(self._timers.items(), key=lambda t: -t[1][1])
+        return ', '.join('%s %.3fs' % (name, t[1]) for (name, t) in timers[:n])
+
+    def report(self):
+        lines = ['%-40s %8s %10s %10s' % ('timer', 'runs', 'total[s]', 'max[ms]')]
+        for name, t in sorted(self._timers.items(), key=lambda t: -t[1][1]):
+            lines.append('%-40s %8d %10.3f %10.3f' % (name, t[0], t[1], 1000*t[2]))
+        if self._counters:
+            lines.append('%-40s %8s' % ('counter', 'count'))
+            for name in sorted(self._counters):
+                lines.append('%-40s %8d' % (name, self._counters[name]))
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return self.report()
+
+    def traceEvents(self):
+        """Recorded events as Chrome trace-event dictionaries."""
+        pid = os.getpid()
+        events = []
+        for (phase, name, start, value, tid) in self._events:
+            event = {'ph': phase, 'name': name, 'pid': pid, 'tid': tid,
+                     'ts': int((start - self._origin) * 1e6)}
+            if phase == 'X':
+                event['dur'] = int(value * 1e6)
+            else:
+                event['args'] = {name: value}
+            events.append(event)
+        return events
+
+    def saveTrace(self, fileName):
+        f = open(fileName, 'w')
+        try:
+            json.dump({'traceEvents': self.traceEvents()}, f)
+        finally:
+            f.close()
+
+
+perf = Perf()
+
+def timed(name):
+    """Decorator timing every call of a function as name."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not perf._enabled:
+                return function(*args, **kwargs)
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                perf.record(name, start, time.time())
+        return wrapper
+    return decorate
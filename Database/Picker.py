@@ -0,0 +1,87 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+class Picker():
+    """
+    Hit-testing of diagram elements through the diagram's spatial index.
+    Elements within the pick tolerance of a point are returned topmost
+    first: higher stacking order (Element.zValue, as used by the views),
+    then smaller elements, then by geometry and finally the later created
+    one first, so the order is deterministic. Hidden elements are not in
+    the index. Results are cached per (grid snapped) position until the
+    index changes.
+    Region queries (intersecting, contained) use the bounding boxes
+    kept in the index and are not cached.
+    """
+    maxCached = 1024
+
+    def __init__(self, diagram, tolerance=0):
+        self._diagram = diagram
+        self._tolerance = tolerance
+        self._cache = {}
+        self._index = None
+        self._generation = None
+
+    @property
+    def diagram(self):
+        return self._diagram
+
+    @property
+    def tolerance(self):
+        return self._tolerance
+
+    def setTolerance(self, tolerance):
+        if tolerance != self._tolerance:
+            self._tolerance = tolerance
+            self._cache = {}
+
+    @staticmethod
+    def zOrder(elem):
+        """Sort key, topmost elements first."""
+        b = elem.boundingBox
+        return (-elem.zValue, (b[2]-b[0])*(b[3]-b[1]), b,
+                elem.__class__.__name__, -elem.serial)
+
+    def pick(self, x, y):
+        """Tuple of elements hit at (x, y), in database units."""
+        index = self.diagram.spatialIndex
+        if index is not self._index or index.generation != self._generation:
+            self._cache = {}
+            self._index = index
+            self._generation = index.generation
+        hit = self._cache.get((x, y))
+        if hit is None:
+            t = self._tolerance
+            candidates = index.intersecting((x-t, y-t, x+t, y+t))
+            hit = tuple(sorted((e for e in candidates if e.hitTest(x, y, t)),
+                               key=self.zOrder))
+            if len(self._cache) >= self.maxCached:
+                self._cache = {}
+            self._cache[(x, y)] = hit
+        return hit
+
+    def intersecting(self, box):
+        """Elements whose bounding boxes intersect the box, topmost first."""
+        elems = self.diagram.spatialIndex.intersecting(box)
+        return sorted(elems, key=self.zOrder)
+
+    def contained(self, box):
+        """Elements whose bounding boxes lie within the box, topmost first."""
+        elems = self.diagram.spatialIndex.contained(box)
+        return sorted(elems, key=self.zOrder)
@@ -24,13 +24,31 @@
 from Path import *
 from Attributes import *
 from xml.etree import ElementTree as et
+import math
+import weakref
+import itertools
+
+def distanceToSegment(x, y, x1, y1, x2, y2):
+    """Distance of the point (x, y) from the segment (x1, y1)-(x2, y2)."""
+    dx = x2 - x1
+    dy = y2 - y1
+    l = dx*dx + dy*dy
+    if l == 0:
+        return math.hypot(x - x1, y - y1)
+    t = max(0.0, min(1.0, float((x - x1)*dx + (y - y1)*dy) / l))
+    return math.hypot(x - x1 - t*dx, y - y1 - t*dy)
 
 #print 'Primitives out'
 
-class Element():
+class Element(object):
+    #properties recorded by the journal, see Journal
+    journalProperties = ('layer', 'x', 'y', 'angle', 'hMirror', 'vMirror', 'visible')
+    _serials = itertools.count()
+
     def __init__(self, diagram, layers):
+        self._serial = next(Element._serials)
         self._attributes = set()
-        self._views = set()
+        self._views = None #WeakSet created on first registration
         self._layers = layers
         self._diagram = diagram
         self._name = 'element'
@@ -48,13 +66,19 @@ class Element():
     def editable(self):
         return self._editable
 
+    @property
+    def serial(self):
+        """Creation order, later elements are stacked on top."""
+        return self._serial
+
     @property
     def attributes(self):
         return self._attributes
 
     @property
     def views(self):
-        return self._views
+        """Registered view items, they drop out when deleted."""
+        return self._views or ()
 
     @property
     def diagram(self):
@@ -87,6 +111,7 @@ class Element():
     @name.setter
     def name(self, name):
         if self.editable:
+            self.aboutToChange()
             self._name = name
             self.updateViews()
 
@@ -97,9 +122,16 @@ class Element():
     @layer.setter
     def layer(self, layer):
         if self.editable:
+            self.aboutToChange()
             self._layer = layer
             self.updateViews()
 
+    @property
+    def zValue(self):
+        """Stacking order of the element's items in the views."""
+        layer = self._layer
+        return layer.zValue if layer else 0
+
     @property
     def x(self):
         return self._x
@@ -107,6 +139,7 @@ class Element():
     @x.setter
     def x(self, x): #int
         if self.editable:
+            self.aboutToChange()
             self._x = x
             self.updateViews()
 
@@ -117,6 +150,7 @@ class Element():
     @y.setter
     def y(self, y): #int
         if self.editable:
+            self.aboutToChange()
             self._y = y
             self.updateViews()
 
@@ -127,6 +161,7 @@ class Element():
     @angle.setter
     def angle(self, angle): #0, 90, 180, 270
         if self.editable:
+            self.aboutToChange()
             self._angle = angle
             self.updateViews()
 
@@ -137,6 +172,7 @@ class Element():
     @vMirror.setter
     def vMirror(self, mirror): #bool
         if self.editable:
+            self.aboutToChange()
             self._vmirror = mirror
             self.updateViews()
 
@@ -147,6 +183,7 @@ class Element():
     @hMirror.setter
     def hMirror(self, mirror): #bool
         if self.editable:
+            self.aboutToChange()
             self._hmirror = mirror
             self.updateViews()
 
@@ -157,24 +194,75 @@ class Element():
     @visible.setter
     def visible(self, visible): #bool
         if self.editable:
+            self.aboutToChange()
             self._visible = visible
             self.updateViews()
 
     def addAttribute(self, attrib):
         self.attributes.add(attrib)
 
+    @property
+    def boundingBox(self):
+        """
+        (left, top, right, bottom) tuple in database units.
+        """
+        return (self.x, self.y, self.x, self.y)
+
+    @property
+    def drawn(self):
+        """False if the views do not draw the element."""
+        return True
+
+    def hitTest(self, x, y, tolerance=0):
+        """True if the point lies within tolerance of the element."""
+        b = self.boundingBox
+        return b[0]-tolerance <= x <= b[2]+tolerance and \
+            b[1]-tolerance <= y <= b[3]+tolerance
+
+    @property
+    def geometry(self):
+        """
+        Constructor arguments following diagram and layers.
+        """
+        return ()
+
+    @property
+    def properties(self):
+        return tuple((p, getattr(self, p)) for p in self.journalProperties)
+
+    def setProperties(self, properties):
+        for (p, val) in properties:
+            if getattr(self, p) != val:
+                setattr(self, p, val)
+
+    def aboutToChange(self):
+        """Called by mutators before the element is modified."""
+        if self.diagram:
+            self.database.checkThread()
+            self.database.journal.elementAboutToChange(self)
+
     def installUpdateHook(self, view):
-        self.views.add(view)
+        if self._views is None:
+            self._views = weakref.WeakSet()
+        self._views.add(view)
+
+    def uninstallUpdateHook(self, view):
+        if self._views:
+            self._views.discard(view)
 
     def itemAdded(self, item):
-        self.views.add(item)
+        self.installUpdateHook(item)
 
     def updateViews(self):
+        if self.diagram:
+            if self.database.elementChanged(self):
+                return #postponed until the transaction commits
+            self.diagram.elementChanged(self)
         for v in self.views:
             v.updateItem()
 
     def addToView(self, view):
-        view.addElem()
+        return view.addElem(self)
 
     def removeFromView(self, view):
         view.removeElem(self)
@@ -195,14 +283,15 @@ class Element():
         return elem
 
     def remove(self):
+        self.database.checkThread()
         for a in self.attributes:
             a.remove()
-        for v in self.views:
+        for v in list(self.views):
             v.removeItem()
-        #self.diagram.elementRemoved(self)
-        self.layers = None
-        self.layer = None
-        self.diagram = None
+        self.diagram.elementRemoved(self)
+        self._layers = None
+        self._layer = None
+        self._diagram = None
         
     def __repr__(self):
         return "<Element @[" + str(self.x) + "," + str(self.y) + "]>"
@@ -234,8 +323,20 @@ class Line(Element):
     def y2(self):
         return self._y2
 
+    @property
+    def geometry(self):
+        return (self.x1, self.y1, self.x2, self.y2)
+
+    @property
+    def boundingBox(self):
+        return (min(self.x1, self.x2), min(self.y1, self.y2),
+                max(self.x1, self.x2), max(self.y1, self.y2))
+
+    def hitTest(self, x, y, tolerance=0):
+        return distanceToSegment(x, y, self.x1, self.y1, self.x2, self.y2) <= tolerance
+
     def addToView(self, view):
-        view.addLine(self)
+        return view.addLine(self)
 
     def toXml(self):
         elem = Element.toXml(self)
@@ -244,6 +345,11 @@ class Line(Element):
         elem.attrib['layer'] = str(self.layer.name)
         return elem
         
+    def remove(self):
+        self.database.checkThread()
+        self.diagram.lineRemoved(self)
+        Element.remove(self)
+
     def __repr__(self):
         return "<Line @[" + str(self.x1) + "," + str(self.y1) + "]-[" + str(self.x2) + "," + str(self.y2) + "]>"
 
@@ -266,8 +372,22 @@ class Rect(Element):
     def h(self):
         return self._h
 
+    @property
+    def geometry(self):
+        return (self.x, self.y, self.w, self.h)
+
+    @property
+    def boundingBox(self):
+        return (min(self.x, self.x+self.w), min(self.y, self.y+self.h),
+                max(self.x, self.x+self.w), max(self.y, self.y+self.h))
+
     def addToView(self, view):
-        view.addRect(self)
+        return view.addRect(self)
+
+    def remove(self):
+        self.database.checkThread()
+        self.diagram.rectRemoved(self)
+        Element.remove(self)
 
     def __repr__(self):
         return "<Rect @[" + str(self.x) + "," + str(self.y) + "],[" + str(self.w) + "x" + str(self.h) + "]>"
@@ -285,29 +405,64 @@ class CustomPath(Element):
     def path(self):
         return self._path
 
+    @property
+    def properties(self):
+        path = tuple(tuple(e) for e in self.path)
+        return Element.properties.fget(self) + (('path', path),)
+
+    def setProperties(self, properties):
+        for (p, val) in properties:
+            if p == 'path':
+                if self.editable and self.properties[-1][1] != val:
+                    self.aboutToChange()
+                    self._path = [list(e) for e in val]
+                    self.updateViews()
+            elif getattr(self, p) != val:
+                setattr(self, p, val)
+
+    @property
+    def boundingBox(self):
+        xs = []
+        ys = []
+        for e in self.path:
+            xs.extend(e[1::2])
+            ys.extend(e[2::2])
+        if not xs:
+            return Element.boundingBox.fget(self)
+        return (min(xs), min(ys), max(xs), max(ys))
+
     def addToView(self, view):
-        view.addCustomPath(self)
+        return view.addCustomPath(self)
 
     def moveTo(self, x, y):
         if self.editable:
+            self.aboutToChange()
             self._path.append([self.move, x, y])
             self.updateViews()
 
     def lineTo(self, x, y):
         if self.editable:
+            self.aboutToChange()
             self._path.append([self.line, x, y])
             self.updateViews()
 
     def curveTo(self, xcp1, ycp1, xcp2, ycp2, x, y):
         if self.editable:
+            self.aboutToChange()
             self._path.append([self.curve, xcp1, ycp1, xcp2, ycp2, x, y])
             self.updateViews()
 
     def closePath(self):
         if self.editable:
+            self.aboutToChange()
             self._path.append([self.close])
             self.updateViews()
 
+    def remove(self):
+        self.database.checkThread()
+        self.diagram.customPathRemoved(self)
+        Element.remove(self)
+
     def __repr__(self):
         return "<CustomPath " + repr(self.path) + ">"
 
@@ -329,6 +484,7 @@ class Ellipse(Element):
     @radiusX.setter
     def radiusX(self, radiusX):
         if self.editable:
+            self.aboutToChange()
             self._radiusX = radiusX
             self.updateViews()
 
@@ -339,11 +495,28 @@ class Ellipse(Element):
     @radiusY.setter
     def radiusY(self, radiusY):
         if self.editable:
+            self.aboutToChange()
             self._radiusY = radiusY
             self.updateViews()
 
+    @property
+    def geometry(self):
+        return (self.x, self.y, self.radiusX, self.radiusY)
+
+    @property
+    def boundingBox(self):
+        #radiusX and radiusY span the whole ellipse, see EllipseItem
+        rx = abs(self.radiusX)/2.0
+        ry = abs(self.radiusY)/2.0
+        return (self.x-rx, self.y-ry, self.x+rx, self.y+ry)
+
     def addToView(self, view):
-        view.addEllipse(self)
+        return view.addEllipse(self)
+
+    def remove(self):
+        self.database.checkThread()
+        self.diagram.ellipseRemoved(self)
+        Element.remove(self)
 
     def __repr__(self):
         return "<Ellipse @[" + str(self.x) + "," + str(self.y) + "],[" + str(self.radiusX) + "x" + str(self.radiusY) + "]>"
@@ -369,6 +542,7 @@ class EllipseArc(Element):
     @radiusX.setter
     def radiusX(self, radiusX):
         if self.editable:
+            self.aboutToChange()
             self._radiusX = radiusX
             self.updateViews()
 
@@ -379,6 +553,7 @@ class EllipseArc(Element):
     @radiusY.setter
     def radiusY(self, radiusY):
         if self.editable:
+            self.aboutToChange()
             self._radiusY = radiusY
             self.updateViews()
 
@@ -389,6 +564,7 @@ class EllipseArc(Element):
     @startAngle.setter
     def startAngle(self, startAngle):
         if self.editable:
+            self.aboutToChange()
             self._startAngle = startAngle
             self.updateViews()
 
@@ -399,16 +575,36 @@ class EllipseArc(Element):
     @spanAngle.setter
     def spanAngle(self, spanAngle):
         if self.editable:
+            self.aboutToChange()
             self._spanAngle = spanAngle
             self.updateViews()
 
+    @property
+    def geometry(self):
+        return (self.x, self.y, self.radiusX, self.radiusY,
+                self.startAngle, self.spanAngle)
+
+    @property
+    def boundingBox(self):
+        #radiusX and radiusY span the whole ellipse, see EllipseItem
+        rx = abs(self.radiusX)/2.0
+        ry = abs(self.radiusY)/2.0
+        return (self.x-rx, self.y-ry, self.x+rx, self.y+ry)
+
     def addToView(self, view):
-        view.addEllipseArc(self)
+        return view.addEllipseArc(self)
+
+    def remove(self):
+        self.database.checkThread()
+        self.diagram.ellipseArcRemoved(self)
+        Element.remove(self)
 
     def __repr__(self):
         return "<EllipseArc @[" + str(self.x) + "," + str(self.y) + "],[" + str(self.radiusX) + "x" + str(self.radiusY) + "]>"
 
 class Label(Element):
+    journalProperties = Element.journalProperties + (
+        'text', 'textSize', 'hAlign', 'vAlign')
     AlignLeft = 0
     AlignCenter = 1
     AlignRight = 2
@@ -431,6 +627,7 @@ class Label(Element):
     @text.setter
     def text(self, text):
         if self.editable:
+            self.aboutToChange()
             self._text = text
             self.updateViews()
 
@@ -441,6 +638,7 @@ class Label(Element):
     @textSize.setter
     def textSize(self, textSize): #int in uu
         if self.editable:
+            self.aboutToChange()
             self._textSize = textSize
             self.updateViews()
 
@@ -451,6 +649,7 @@ class Label(Element):
     @hAlign.setter
     def hAlign(self, align):
         if self.editable:
+            self.aboutToChange()
             self._hAlign = align
             self.updateViews()
 
@@ -461,11 +660,51 @@ class Label(Element):
     @vAlign.setter
     def vAlign(self, align):
         if self.editable:
+            self.aboutToChange()
             self._vAlign = align
             self.updateViews()
 
+    @property
+    def drawn(self):
+        return self.visible
+
+    @property
+    def textRect(self):
+        """
+        (left, bottom, right, top) of the text relative to its anchor,
+        before rotation. The width is estimated from the character count,
+        exact text extents are only known to the views.
+        """
+        w = 0.6 * self.textSize * len(self.text)
+        h = self.textSize
+        left = {self.AlignCenter: -w/2.0, self.AlignRight: -w}.get(self.hAlign, 0)
+        bottom = {self.AlignCenter: -h/2.0, self.AlignTop: -h}.get(self.vAlign, 0)
+        return (left, bottom, left + w, bottom + h)
+
+    @property
+    def boundingBox(self):
+        (l, b, r, t) = self.textRect
+        a = math.radians(self.angle)
+        c = math.cos(a)
+        s = math.sin(a)
+        xs = [x*c - y*s for (x, y) in ((l, b), (r, b), (l, t), (r, t))]
+        ys = [x*s + y*c for (x, y) in ((l, b), (r, b), (l, t), (r, t))]
+        return (self.x+min(xs), self.y+min(ys), self.x+max(xs), self.y+max(ys))
+
+    def hitTest(self, x, y, tolerance=0):
+        """Point tested against the rotated text rectangle."""
+        (l, b, r, t) = self.textRect
+        a = math.radians(self.angle)
+        c = math.cos(a)
+        s = math.sin(a)
+        dx = x - self.x
+        dy = y - self.y
+        u = dx*c + dy*s
+        v = -dx*s + dy*c
+        return l-tolerance <= u <= r+tolerance and b-tolerance <= v <= t+tolerance
+
     def addToView(self, view):
-        view.addLabel(self)
+        return view.addLabel(self)
 
     def toXml(self):
         elem = Element.toXml(self)
@@ -475,11 +714,18 @@ class Label(Element):
         elem.attrib['size'] = str(self.textSize)
         return elem
 
+    def remove(self):
+        self.database.checkThread()
+        self.diagram.labelRemoved(self)
+        Element.remove(self)
+
     def __repr__(self):
         return "<Label @[" + str(self.x) + "," + str(self.y) + "] '" + str(self.text) + "'>"
 
         
 class AttributeLabel(Label):
+    journalProperties = Element.journalProperties + (
+        'textSize', 'hAlign', 'vAlign', 'visibleKey')
     AlignLeft = 0
     AlignCenter = 1
     AlignRight = 2
@@ -502,6 +748,10 @@ class AttributeLabel(Label):
     def attribute(self):
         return self._attribute
 
+    @property
+    def geometry(self):
+        return (self.key, self.value)
+
     @property
     def key(self):
         return self.attribute.name
@@ -517,6 +767,7 @@ class AttributeLabel(Label):
     @text.setter
     def text(self, text):
         if self.editable:
+            self.aboutToChange()
             self.attribute.val = text
             self.updateViews()
 
@@ -527,11 +778,12 @@ class AttributeLabel(Label):
     @visibleKey.setter
     def visibleKey(self, visible):
         if self.editable:
+            self.aboutToChange()
             self._visibleKey = visible
             self.updateViews()
 
     def addToView(self, view):
-        view.addAttributeLabel(self)
+        return view.addAttributeLabel(self)
 
     def toXml(self):
         elem = Label.toXml(self)
@@ -543,6 +795,11 @@ class AttributeLabel(Label):
         elem.append(attr)
         return elem
         
+    def remove(self):
+        self.database.checkThread()
+        self.diagram.attributeLabelRemoved(self)
+        Element.remove(self)
+
     def __repr__(self):
         return "<AttributeLabel @[" + str(self.x) + "," + str(self.y) + "] '" + str(self.text) + "'>"
 
@@ -614,8 +871,20 @@ class NetSegment(Element):
     def isDiagonal135(self):
         return self.dx == self.dy
         
+    @property
+    def geometry(self):
+        return (self.x1, self.y1, self.x2, self.y2)
+
+    @property
+    def boundingBox(self):
+        return (min(self.x1, self.x2), min(self.y1, self.y2),
+                max(self.x1, self.x2), max(self.y1, self.y2))
+
+    def hitTest(self, x, y, tolerance=0):
+        return distanceToSegment(x, y, self.x1, self.y1, self.x2, self.y2) <= tolerance
+
     def addToView(self, view):
-        view.addNetSegment(self)
+        return view.addNetSegment(self)
         
     def removeFromView(self, view):
         "remove from view ", view
@@ -653,6 +922,7 @@ class NetSegment(Element):
         ns = NetSegment(diagram, layers, minX, minY, maxX, maxY)
 
     def remove(self):
+        self.database.checkThread()
         #self._layer = None
         self.diagram.netSegmentRemoved(self)
         Element.remove(self)
@@ -677,13 +947,32 @@ class SolderDot(Element):
     def radiusY(self):
         return self.diagram.uu
         
+    @property
+    def geometry(self):
+        return (self.x, self.y)
+
+    @property
+    def boundingBox(self):
+        r = self.radiusX/2.0
+        return (self.x-r, self.y-r, self.x+r, self.y+r)
+
     def addToView(self, view):
-        view.addSolderDot(self)
+        return view.addSolderDot(self)
         
+    def remove(self):
+        self.database.checkThread()
+        self.diagram.solderDotRemoved(self)
+        Element.remove(self)
+
     def __repr__(self):
         return "<SolderDot @[" + str(self.x) + "," + str(self.y) + "]>"
 
 class Instance(Element):
+    journalProperties = Element.journalProperties + (
+        'instanceLibraryPath', 'instanceCellName', 'instanceCellViewName')
+    defaultCellPath = Path.createFromNames('sym.analog', 'voltage-1')
+    defaultCellViewPath = Path.createFromNames('sym.analog', 'voltage-1', 'symbol')
+
     def __init__(self, diagram, layers):
         Element.__init__(self, diagram, layers)
         self._instanceLibPath = ''
@@ -695,31 +984,32 @@ class Instance(Element):
         self._instanceCell = None
         self._instanceCellView = None
         self._requestedInstanceCellView = None
+        self._instanceGeneration = None
         self._layer = self.layers.layerByName('instance', 'drawing')
         diagram.instanceAdded(self)
 
     @property
     def instanceCell(self):
+        cv = self.requestedInstanceCellView #validates the cache
         if self._instanceCell:    #cache
             return self._instanceCell
-        cv = self.requestedInstanceCellView
         if cv:
             self._instanceCell = cv.cell
         else:
-            path = Path.createFromNames('sym.analog', 'voltage-1')
-            self._instanceCell = self.database.libraries.objectByPath(path)
+            self._instanceCell = self.database.libraries.objectByPath(self.defaultCellPath)
         return self._instanceCell
 
     @property
     def instanceCellView(self):
+        cv = self.requestedInstanceCellView #validates the cache
         if self._instanceCellView:   #cache
             return self._instanceCellView
-        cv = self.requestedInstanceCellView
         if cv:
             self._instanceCellView = cv
         else:
-            path = Path.createFromNames('sym.analog', 'voltage-1', 'symbol')
-            self._instanceCellView = self.database.libraries.objectByPath(path)
+            libraries = self.database.libraries
+            self._instanceCellView = libraries.objectByPath(self.defaultCellViewPath)
+            libraries.fallbackCellViewUsed(self._instanceCellView)
         return self._instanceCellView
 
     @property
@@ -729,9 +1019,19 @@ class Instance(Element):
     @instanceLibraryPath.setter
     def instanceLibraryPath(self, path):
         if self.editable:
+            self.aboutToChange()
             self._instanceLibPath = path
+            self.resetInstanceCache()
+            self.diagram.instanceChanged(self)
             self.updateViews()
         
+    def resetInstanceCache(self):
+        self._instanceLibrary = None
+        self._instanceCell = None
+        self._instanceCellView = None
+        self._requestedInstanceCellView = None
+        self._instanceGeneration = None
+
     @property
     def instanceAbsolutePath(self):
         path = self.instanceLibraryPath
@@ -745,7 +1045,10 @@ class Instance(Element):
     @instanceCellName.setter
     def instanceCellName(self, name):
         if self.editable:
+            self.aboutToChange()
             self._instanceCellName = name
+            self.resetInstanceCache()
+            self.diagram.instanceChanged(self)
         
     @property
     def instanceCellViewName(self):
@@ -754,11 +1057,23 @@ class Instance(Element):
     @instanceCellViewName.setter
     def instanceCellViewName(self, name):
         if self.editable:
-            self._instanceViewCellName = name
+            self.aboutToChange()
+            self._instanceCellViewName = name
+            self.resetInstanceCache()
+            self.diagram.instanceChanged(self)
             self.updateViews()
         
     @property
     def requestedInstanceCellView(self):
+        """
+        Cell view named by the instance, or None.
+        Resolved once per generation of the library hierarchy.
+        """
+        generation = self.database.libraries.generation
+        if self._instanceGeneration == generation:
+            return self._requestedInstanceCellView
+        self.resetInstanceCache()
+        self._instanceGeneration = generation
         if self.instanceLibraryPath == '':
             path = Path.createFromNames('.', self.instanceCellName, self.instanceCellViewName)
             self._requestedInstanceCellView = self.library.objectByPath(path)
@@ -771,17 +1086,74 @@ class Instance(Element):
         
     @property
     def instanceLibrary(self):
+        cv = self.requestedInstanceCellView #validates the cache
         if self._instanceLibrary:    #cache
             return self._instanceLibrary
-        cv = self.requestedInstanceCellView
         if cv:
             self._instanceLibrary = cv.library
         else:
             self._instanceLibrary = self.database.libraryByPath(Path.createFromPathName('sym.analog'))
         return self._instanceLibrary
 
+    @property
+    def boundingBox(self):
+        """
+        Extents of the instantiated cellView mapped to the diagram
+        coordinates (mirroring, then rotation, then translation).
+        """
+        cv = self.instanceCellView
+        extents = cv and cv.extents
+        if not extents:
+            return Element.boundingBox.fget(self)
+        f = float(self.diagram.uu) / cv.uu
+        sx = -f if self.hMirror else f
+        sy = -f if self.vMirror else f
+        a = math.radians(self.angle)
+        c = math.cos(a)
+        s = math.sin(a)
+        xs = []
+        ys = []
+        for (px, py) in ((extents[0], extents[1]), (extents[2], extents[1]),
+                         (extents[0], extents[3]), (extents[2], extents[3])):
+            px *= sx
+            py *= sy
+            xs.append(self.x + px*c - py*s)
+            ys.append(self.y + px*s + py*c)
+        return (min(xs), min(ys), max(xs), max(ys))
+
+    @property
+    def zValue(self):
+        """Instance items are not stacked by their layer."""
+        return 0
+
+    def hitTest(self, x, y, tolerance=0):
+        """Point tested against the drawn elements of the cellView."""
+        cv = self.instanceCellView
+        if not cv or not cv.extents:
+            return Element.hitTest(self, x, y, tolerance)
+        f = float(self.diagram.uu) / cv.uu
+        sx = -f if self.hMirror else f
+        sy = -f if self.vMirror else f
+        a = math.radians(self.angle)
+        c = math.cos(a)
+        s = math.sin(a)
+        dx = x - self.x
+        dy = y - self.y
+        px = (dx*c + dy*s) / sx
+        py = (-dx*s + dy*c) / sy
+        t = tolerance / f
+        for e in cv.spatialIndex.intersecting((px-t, py-t, px+t, py+t)):
+            if e.hitTest(px, py, t):
+                return True
+        return False
+
     def addToView(self, view):
-        view.addInstance(self)
+        return view.addInstance(self)
+
+    def remove(self):
+        self.database.checkThread()
+        self.diagram.instanceRemoved(self)
+        Element.remove(self)
 
     def __repr__(self):
         return "<Instance @[" + str(self.x) + "," + str(self.y) + "] '" + self.instanceCellView.path + "'>"
@@ -805,6 +1177,7 @@ class Pin(Instance):
         self._instanceCell = None
         self._instanceCellView = None
         self._requestedInstanceCellView = None
+        self._instanceGeneration = None
         diagram.pinAdded(self)
         
     @property
@@ -823,8 +1196,27 @@ class Pin(Instance):
     def y2(self):
         return self._y2
 
+    @property
+    def geometry(self):
+        return (self.x1, self.y1, self.x2, self.y2)
+
+    @property
+    def boundingBox(self):
+        return (min(self.x1, self.x2), min(self.y1, self.y2),
+                max(self.x1, self.x2), max(self.y1, self.y2))
+
+    def hitTest(self, x, y, tolerance=0):
+        return distanceToSegment(x, y, self.x1, self.y1, self.x2, self.y2) <= tolerance
+
+    zValue = Element.zValue #drawn as a line
+
     def addToView(self, view):
-        view.addPin(self)
+        return view.addPin(self)
+
+    def remove(self):
+        self.database.checkThread()
+        self.diagram.pinRemoved(self)
+        Element.remove(self)
 
     def __repr__(self):
         return "<Pin @[" + str(self.x) + "," + str(self.y) + "] '" + self.instanceCellView.path + "'>"
@@ -848,6 +1240,7 @@ class SymbolPin(Instance):
         self._instanceCell = None
         self._instanceCellView = None
         self._requestedInstanceCellView = None
+        self._instanceGeneration = None
         diagram.symbolPinAdded(self)
         
     @property
@@ -866,8 +1259,27 @@ class SymbolPin(Instance):
     def y2(self):
         return self._y2
 
+    @property
+    def geometry(self):
+        return (self.x1, self.y1, self.x2, self.y2)
+
+    @property
+    def boundingBox(self):
+        return (min(self.x1, self.x2), min(self.y1, self.y2),
+                max(self.x1, self.x2), max(self.y1, self.y2))
+
+    def hitTest(self, x, y, tolerance=0):
+        return distanceToSegment(x, y, self.x1, self.y1, self.x2, self.y2) <= tolerance
+
+    zValue = Element.zValue #drawn as a line
+
     def addToView(self, view):
-        view.addPin(self)
+        return view.addPin(self)
+
+    def remove(self):
+        self.database.checkThread()
+        self.diagram.symbolPinRemoved(self)
+        Element.remove(self)
 
     def __repr__(self):
         return "<SymbolPin @[" + str(self.x) + "," + str(self.y) + "] '" + self.instanceCellView.path + "'>"
@@ -26,6 +26,7 @@ from Primitives import *
 from CellViews import *
 from Cells import *
 from Layers import *
+from Perf import perf, timed
 
 #print 'Reader out'
 
@@ -322,6 +323,7 @@ class GedaReader(Reader):
             return
 
 
+    @timed('GedaReader.parseFile')
     def parseFile(self, fileName, mode):
         self.f = open(fileName, 'r')
         self.error = False
@@ -334,9 +336,13 @@ class GedaReader(Reader):
         else:
             self.error = True
         #rest of the file
+        records = 0
         while (not self.error and not self.eof):
             self.parseCommand(mode)
+            if not self.eof:
+                records += 1
         self.f.close()
+        perf.count('GedaReader.records', records)
         return self.view
     
     def parseSchematic(self, fileName, cellView):
@@ -400,10 +406,16 @@ class GedaImporter(Importer):
     def importLibraryList(self, componentList, sourceList):
         self.componentLibraryList = componentList
         self.sourceLibraryList = sourceList
-        for l in self.componentLibraryList:
-            self.importComponentLibrary(l)
-        for l in self.sourceLibraryList:
-            self.importSourceLibrary(l)
+        self.database.journal.suspend() #imports are not undoable
+        try:
+            for l in self.componentLibraryList:
+                self.importComponentLibrary(l)
+            for l in self.sourceLibraryList:
+                self.importSourceLibrary(l)
+            #normalize imported nets now, so it is not journaled later
+            self.database.runDeferredProcesses()
+        finally:
+            self.database.journal.resume()
             
     def libPathAbsToRel(self, libPath):
         l = self.library.path
@@ -459,6 +471,7 @@ class GedaImporter(Importer):
         f = os.path.basename(fileName)
         return self.pstrip.sub('', f)
     
+    @timed('GedaImporter.importComponentLibrary')
     def importComponentLibrary(self, lib):
         library = lib[0]
         directory = lib[1]
@@ -501,6 +514,8 @@ class GedaImporter(Importer):
                         #self.cell.addCellView(cv)
                         r = GedaReader(self)
                         cv = r.parseSymbol(f, cv)
+                        perf.count('GedaImporter.cells')
+                        self.database.leaveCPU()
                     #cv = r.parseSymbol(f)
                     #self.cell.addCellView(cv)
                 else:
@@ -548,6 +563,7 @@ class GedaImporter(Importer):
                         #self.cell.addCellView(cv)
                         r = GedaReader(self)
                         r.parseSchematic(f, cv)
+                        self.database.leaveCPU()
                     #self.cell.addCellView(cv)
                 else:
                     pass
@@ -0,0 +1,181 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+import heapq
+
+class SpatialIndex():
+    """
+    Spatial hash of object bounding boxes.
+    The plane is divided into square buckets, each storing the set of
+    objects whose bounding boxes overlap it. Boxes are
+    (left, top, right, bottom) tuples in database units.
+    Objects spanning too many buckets are kept in a separate set
+    which is always scanned.
+    Extents are maintained incrementally: for each edge a multiset of
+    coordinates (counts) and a lazily cleaned heap of its distinct values.
+    """
+    maxBuckets = 64 #per object
+
+    def __init__(self, bucketSize=4096):
+        self._bucketSize = bucketSize
+        self._buckets = {}   #(i, j) -> set of objects
+        self._boxes = {}     #object -> box
+        self._oversized = set()
+        self._generation = 0
+        self._edges = ([], [], [], [])     #heaps: left, top, -right, -bottom
+        self._edgeCounts = ({}, {}, {}, {}) #value -> number of boxes
+
+    @property
+    def bucketSize(self):
+        return self._bucketSize
+
+    @property
+    def generation(self):
+        """Counter incremented on every modification."""
+        return self._generation
+
+    @property
+    def objects(self):
+        return self._boxes.keys()
+
+    @property
+    def extents(self):
+        """Union of all bounding boxes, None if the index is empty."""
+        if not self._boxes:
+            return None
+        return (self._edge(0), self._edge(1), -self._edge(2), -self._edge(3))
+
+    def _edge(self, k):
+        heap = self._edges[k]
+        counts = self._edgeCounts[k]
+        while heap[0] not in counts:
+            heapq.heappop(heap)
+        return heap[0]
+
+    def _addEdges(self, box):
+        for (k, v) in enumerate((box[0], box[1], -box[2], -box[3])):
+            counts = self._edgeCounts[k]
+            n = counts.get(v, 0)
+            if n == 0:
+                heapq.heappush(self._edges[k], v)
+            counts[v] = n + 1
+
+    def _removeEdges(self, box):
+        for (k, v) in enumerate((box[0], box[1], -box[2], -box[3])):
+            counts = self._edgeCounts[k]
+            n = counts[v] - 1
+            if n == 0:
+                del counts[v]
+            else:
+                counts[v] = n
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def __contains__(self, obj):
+        return obj in self._boxes
+
+    def boxOf(self, obj):
+        return self._boxes.get(obj)
+
+    def _range(self, box):
+        s = self._bucketSize
+        return (int(box[0] // s), int(box[1] // s),
+                int(box[2] // s), int(box[3] // s))
+
+    def add(self, obj, box):
+        if obj in self._boxes:
+            self.remove(obj)
+        box = (min(box[0], box[2]), min(box[1], box[3]),
+               max(box[0], box[2]), max(box[1], box[3]))
+        self._boxes[obj] = box
+        self._generation += 1
+        self._addEdges(box)
+        i1, j1, i2, j2 = self._range(box)
+        if (i2-i1+1)*(j2-j1+1) > self.maxBuckets:
+            self._oversized.add(obj)
+            return
+        buckets = self._buckets
+        for i in xrange(i1, i2+1):
+            for j in xrange(j1, j2+1):
+                if (i, j) in buckets:
+                    buckets[(i, j)].add(obj)
+                else:
+                    buckets[(i, j)] = set([obj])
+
+    def remove(self, obj):
+        box = self._boxes.pop(obj, None)
+        if box is None:
+            return
+        self._generation += 1
+        self._removeEdges(box)
+        if obj in self._oversized:
+            self._oversized.remove(obj)
+            return
+        buckets = self._buckets
+        i1, j1, i2, j2 = self._range(box)
+        for i in xrange(i1, i2+1):
+            for j in xrange(j1, j2+1):
+                bucket = buckets[(i, j)]
+                bucket.remove(obj)
+                if not bucket:
+                    del buckets[(i, j)]
+
+    def update(self, obj, box):
+        if self._boxes.get(obj) != box:
+            self.add(obj, box)
+
+    def intersecting(self, box):
+        """Set of objects whose bounding boxes intersect the box."""
+        left, top, right, bottom = box
+        boxes = self._boxes
+        result = set()
+        candidates = set(self._oversized)
+        i1, j1, i2, j2 = self._range(box)
+        buckets = self._buckets
+        if (i2-i1+1)*(j2-j1+1) > len(buckets):
+            for bucket in buckets.itervalues():
+                candidates.update(bucket)
+        else:
+            for i in xrange(i1, i2+1):
+                for j in xrange(j1, j2+1):
+                    bucket = buckets.get((i, j))
+                    if bucket:
+                        candidates.update(bucket)
+        for obj in candidates:
+            b = boxes[obj]
+            if b[0] <= right and b[2] >= left and b[1] <= bottom and b[3] >= top:
+                result.add(obj)
+        return result
+
+    def contained(self, box):
+        """Set of objects whose bounding boxes lie within the box."""
+        left, top, right, bottom = box
+        boxes = self._boxes
+        return set(obj for obj in self.intersecting(box)
+                   if boxes[obj][0] >= left and boxes[obj][2] <= right and
+                   boxes[obj][1] >= top and boxes[obj][3] <= bottom)
+
+    def clear(self):
+        self._buckets = {}
+        self._boxes = {}
+        self._oversized = set()
+        self._generation += 1
+        self._edges = ([], [], [], [])
+        self._edgeCounts = ({}, {}, {}, {})
@@ -1,8 +1,16 @@
 ﻿import unittest
+import os
+import shutil
+import tempfile
 
 from Database import Database
 from Database.Cells import *
 from Database.Design import *
+from Database.Primitives import *
+from Database.Layers import *
+from Database.Exceptions import *
+from Database.Reader import GedaImporter
+from Database.Perf import perf
 
 class Client():
     def __init__(self):
@@ -20,6 +28,32 @@ class Client():
             self.timer = False
             self.database.runDeferredProcesses()
             
+class DeferredObject():
+    def __init__(self, log, name, priority, runs=1):
+        self.log = log
+        self.name = name
+        self.deferredPriority = priority
+        self.runs = runs
+        
+    def runDeferredProcess(self):
+        self.log.append(self.name)
+        self.runs -= 1
+        return self.runs > 0
+        
+class RebindItem():
+    def __init__(self, log):
+        self.log = log
+
+    def rebind(self):
+        self.log.append(self)
+
+class LibraryView():
+    def __init__(self):
+        self.updates = []
+
+    def update(self, changedNodes=None, changedData=()):
+        self.updates.append((changedNodes, changedData))
+
 class DatabaseTest(unittest.TestCase):
     def setUp(self):
         self.client = Client()
@@ -87,4 +121,469 @@ class DatabaseTest(unittest.TestCase):
         sy = root.createSymbolFromPath(p)
         self.assertEqual(sy.__class__.__name__, 'Symbol')
         
-        
\ No newline at end of file
+    def test_04_deferredProcessing(self):
+        log = []
+        a = DeferredObject(log, 'a', 20)
+        b = DeferredObject(log, 'b', 0, 2)
+        c = DeferredObject(log, 'c', 10)
+        self.database.requestDeferredProcessing(a)
+        self.assertEqual(self.client.timer, True)
+        self.client.timer = False
+        self.database.requestDeferredProcessing(b)
+        self.database.requestDeferredProcessing(c)
+        self.database.requestDeferredProcessing(a) #coalesced
+        self.assertEqual(self.client.timer, False)
+        self.database.cancelDeferredProcessing(c)
+        pending = self.database.runDeferredProcesses(budget=0)
+        self.assertEqual(pending, True)
+        self.assertEqual(log, ['b'])
+        self.database.runDeferredProcesses()
+        self.assertEqual(log, ['b', 'b', 'a'])
+        self.assertEqual(self.database.wasDeferredProcessingRequested(), False)
+        self.assertEqual(self.database.deferredProcessingStats[b]['runs'], 2)
+        self.assertEqual(c in self.database.deferredProcessingStats, False)
+        stats = self.database.deferredProcessingStats
+        self.assertEqual(len(stats), 2)
+        del a, b
+        self.assertEqual(len(stats), 0) #objects are not kept alive
+        self.database.layers = Layers(self.database)
+        cell = self.database.libraries.createCellFromPath(Path.createFromPathName('lib/cell'))
+        sc = Schematic('schematic', cell)
+        NetSegment(sc, self.database.layers, 0, 0, 1000, 0)
+        self.database.runDeferredProcesses()
+        self.assertTrue(sc in stats)
+        NetSegment(sc, self.database.layers, 0, 0, 0, 1000)
+        sc.remove()
+        self.assertFalse(sc in stats)
+        self.assertEqual(self.database.wasDeferredProcessingRequested(sc), False)
+        
+    def test_05_transaction(self):
+        self.database.layers = Layers(self.database)
+        root = self.database.libraries
+        cell = root.createCellFromPath(Path.createFromPathName('lib/cell'))
+        sc = Schematic('schematic', cell)
+        self.database.runDeferredProcesses()
+        self.client.timer = False
+        with self.database.transaction():
+            with self.database.transaction():
+                NetSegment(sc, self.database.layers, 0, 0, 1000, 0)
+            NetSegment(sc, self.database.layers, 500, 0, 500, 500)
+            tmp = NetSegment(sc, self.database.layers, 0, 100, 1000, 100)
+            tmp.remove()
+            self.assertEqual(len(sc._netSegments), 2) #no net processing yet
+            self.assertEqual(self.client.timer, False)
+            self.assertEqual(self.database.wasDeferredProcessingRequested(), False)
+        self.assertEqual(len(sc.netSegments), 3)
+        self.assertEqual(len(sc.solderDots), 1)
+        self.assertEqual(len(sc.index.netSegmentsEndPointsAt(500, 0)), 3)
+        self.assertEqual(sc.index.netSegmentsAt(0, 100), set())
+        
+    def test_06_undo(self):
+        self.database.layers = Layers(self.database)
+        layers = self.database.layers
+        root = self.database.libraries
+        cell = root.createCellFromPath(Path.createFromPathName('lib/cell'))
+        sc = Schematic('schematic', cell)
+        with self.database.transaction():
+            NetSegment(sc, layers, 0, 0, 1000, 0)
+            l = Label(sc, layers)
+            l.text = 'a'
+        with self.database.transaction():
+            NetSegment(sc, layers, 500, 0, 500, 500)
+        l.text = 'b'
+        self.assertEqual(len(sc.netSegments), 3)
+        self.assertEqual(len(sc.solderDots), 1)
+        self.assertEqual(self.database.undo(), True) #label text
+        l = list(sc.labels)[0]
+        self.assertEqual(l.text, 'a')
+        self.assertEqual(self.database.undo(), True) #T junction
+        self.assertEqual(len(sc.netSegments), 1)
+        self.assertEqual(len(sc.solderDots), 0)
+        self.assertEqual(list(sc.netSegments)[0].geometry, (0, 0, 1000, 0))
+        self.assertEqual(self.database.redo(), True)
+        self.assertEqual(len(sc.netSegments), 3)
+        self.assertEqual(len(sc.solderDots), 1)
+        self.assertEqual(self.database.undo(), True)
+        self.assertEqual(self.database.undo(), True) #first transaction
+        self.assertEqual(len(sc.netSegments), 0)
+        self.assertEqual(len(sc.labels), 0)
+        self.assertEqual(self.database.undo(), False)
+        self.assertEqual(self.database.redo(), True)
+        self.assertEqual(len(sc.netSegments), 1)
+        self.assertEqual(list(sc.labels)[0].text, 'a')
+        
+    def test_07_journalCompaction(self):
+        self.database.layers = Layers(self.database)
+        layers = self.database.layers
+        root = self.database.libraries
+        cell = root.createCellFromPath(Path.createFromPathName('lib/cell'))
+        sc = Schematic('schematic', cell)
+        journal = self.database.journal
+        journal.depth = 2
+        l = Label(sc, layers)
+        journal.closeGroup()
+        for t in ['a', 'b', 'c', 'd']:
+            l.text = t
+            journal.closeGroup()
+        self.assertEqual(journal.undoDepth, 2)
+        self.assertEqual(self.database.undo(), True)
+        self.assertEqual(list(sc.labels)[0].text, 'c')
+        self.assertEqual(self.database.undo(), True) #compacted
+        self.assertEqual(len(sc.labels), 0)
+
+    def test_08_objectCache(self):
+        root = self.database.libraries
+        p = Path.createFromPathName('lib/cell/schematic')
+        self.assertEqual(root.objectByPath(p), None)
+        cell = root.createCellFromPath(Path.createFromPathName('lib/cell'))
+        self.assertEqual(root.objectByPath(p.cell), cell)
+        sc = Schematic('schematic', cell)
+        self.assertEqual(root.objectByPath(p), sc)
+        self.assertEqual(root.objectByPath(Path.createFromNames('lib', 'cell', 'schematic')), sc)
+        sc.remove()
+        self.assertEqual(root.objectByPath(p), None)
+        cell.remove()
+        self.assertEqual(root.objectByPath(p.cell), None)
+
+    def test_09_instanceResolution(self):
+        self.database.layers = Layers(self.database)
+        layers = self.database.layers
+        root = self.database.libraries
+        top = root.createCellFromPath(Path.createFromPathName('lib/top'))
+        res = root.createCellFromPath(Path.createFromPathName('lib/res'))
+        sc = Schematic('schematic', top)
+        i = Instance(sc, layers)
+        i.instanceLibraryPath = 'lib'
+        i.instanceCellName = 'res'
+        i.instanceCellViewName = 'symbol'
+        self.assertEqual(i.requestedInstanceCellView, None)
+        sy1 = Symbol('symbol', res)
+        self.assertEqual(i.requestedInstanceCellView, sy1)
+        self.assertEqual(i.instanceCellView, sy1)
+        log = []
+        item = RebindItem(log)
+        sy1.instanceItemAdded(item)
+        self.database.runDeferredProcesses()
+        sy2 = Symbol('symbol', res) #replace
+        self.assertEqual(i.instanceCellView, sy2)
+        self.assertEqual(i.instanceCell, res)
+        self.database.runDeferredProcesses()
+        self.assertEqual(log, [item])
+
+    def test_10_designUnitByPath(self):
+        self.database.layers = Layers(self.database)
+        layers = self.database.layers
+        root = self.database.libraries
+        cells = {}
+        for name in ['top', 'mid', 'leaf']:
+            cells[name] = root.createCellFromPath(Path.createFromPathName('lib/' + name))
+            Symbol('symbol', cells[name])
+            Schematic('schematic', cells[name])
+        for (parent, child, name) in [('top', 'mid', 'X1'), ('mid', 'leaf', 'X2')]:
+            i = Instance(cells[parent].cellViewByName('schematic'), layers)
+            i.name = name
+            i.instanceLibraryPath = 'lib'
+            i.instanceCellName = child
+            i.instanceCellViewName = 'symbol'
+        designs = self.database.designs
+        design = Design(cells['top'].cellViewByName('schematic'), designs)
+        self.assertEqual(designs.designUnitByPath('lib/top/schematic'), design)
+        du = designs.designUnitByPath('lib/top/schematic:X1.X2')
+        self.assertEqual(du.path, 'lib/top/schematic:X1.X2')
+        self.assertEqual(du.cellView, cells['leaf'].cellViewByName('schematic'))
+        self.assertEqual(designs.designUnitByPath('lib/top/schematic:X1.X2'), du)
+        self.assertEqual(designs.designUnitByPath('lib/top/schematic:X1.X3'), None)
+
+    def test_11_designStatistics(self):
+        self.database.layers = Layers(self.database)
+        layers = self.database.layers
+        root = self.database.libraries
+        cells = {}
+        for name in ['top', 'mid', 'leaf']:
+            cells[name] = root.createCellFromPath(Path.createFromPathName('lib/' + name))
+            Symbol('symbol', cells[name])
+            Schematic('schematic', cells[name])
+        def instantiate(parent, child):
+            i = Instance(cells[parent].cellViewByName('schematic'), layers)
+            i.instanceLibraryPath = 'lib'
+            i.instanceCellName = child
+            i.instanceCellViewName = 'symbol'
+            return i
+        for n in range(2):
+            instantiate('top', 'mid')
+        for n in range(3):
+            instantiate('mid', 'leaf')
+        stats = self.database.designStatistics
+        s = stats.cellStatistics(cells['top'])
+        self.assertEqual(s.occurrences, {cells['mid']: 2, cells['leaf']: 6})
+        self.assertEqual(s.instanceCount, 8)
+        self.assertEqual(s.deviceCount, 6)
+        self.assertEqual(s.depth, 2)
+        self.assertTrue(stats.cellStatistics(cells['top']) is s) #memoized
+        instantiate('mid', 'leaf')
+        self.assertEqual(stats.cellStatistics(cells['top']).deviceCount, 8)
+        i = instantiate('leaf', 'top')
+        self.assertRaises(HierarchyError, stats.cellStatistics, cells['top'])
+        i.remove()
+        self.assertEqual(stats.cellStatistics(cells['top']).depth, 2)
+
+    def test_12_childRows(self):
+        root = self.database.libraries
+        for name in ['lib.b', 'lib.a', 'lib/d', 'lib/c']:
+            root.createLibraryFromPath(Path.createFromPathName(name))
+        root.createCellFromPath(Path.createFromPathName('lib/d'))
+        c = root.createCellFromPath(Path.createFromPathName('lib/c'))
+        lib = root.libraryByPath(Path.createFromPathName('lib'))
+        self.assertEqual([o.name for o in lib.sortedChildren], ['a', 'b', 'c', 'd'])
+        self.assertEqual(lib.childRow(c), 2)
+        self.assertEqual(root.childRow(lib), 0)
+        c.remove()
+        self.assertEqual(len(lib.sortedChildren), 3)
+        self.assertEqual(lib.childRow(lib.cellNames['d']), 2)
+
+    def test_13_libraryViewUpdates(self):
+        root = self.database.libraries
+        view = LibraryView()
+        root.libraryViewAdded(view)
+        lib = root.createLibraryFromPath(Path.createFromPathName('lib'))
+        c1 = root.createCellFromPath(Path.createFromPathName('lib/c1'))
+        c2 = root.createCellFromPath(Path.createFromPathName('lib/c2'))
+        Schematic('schematic', c1)
+        self.database.runDeferredProcesses()
+        self.assertEqual(len(view.updates), 1) #coalesced
+        (changedNodes, changedData) = view.updates[0]
+        self.assertEqual(changedNodes, set([root, lib, c1]))
+        c2.remove()
+        self.database.runDeferredProcesses()
+        self.assertEqual(view.updates[1][0], set([lib]))
+
+    def test_14_nameIndex(self):
+        root = self.database.libraries
+        c1 = root.createCellFromPath(Path.createFromPathName('analog/resistor'))
+        c2 = root.createCellFromPath(Path.createFromPathName('digital.gates/nand2'))
+        lib = root.libraryByPath(Path.createFromPathName('digital.gates'))
+        self.assertEqual(root.nameIndex.search('RES'), [c1])
+        self.assertEqual(root.nameIndex.search('gate'), [lib])
+        c1.remove()
+        self.assertEqual(root.nameIndex.search('res'), [])
+        self.assertEqual(root.nameIndex.search('nand'), [c2])
+
+    def test_15_callQueue(self):
+        import threading
+        self.database.layers = Layers(self.database)
+        root = self.database.libraries
+        cell = root.createCellFromPath(Path.createFromPathName('lib/cell'))
+        sc = Schematic('schematic', cell)
+        self.database.runDeferredProcesses()
+        queue = self.database.callQueue
+        def worker():
+            for i in range(10):
+                queue.post(NetSegment, sc, self.database.layers, 0, i*100, 1000, i*100)
+        t = threading.Thread(target=worker)
+        t.start()
+        t.join()
+        self.assertEqual(len(sc.netSegments), 0) #nothing run yet
+        self.assertEqual(queue.apply(4), True)
+        self.assertEqual(len(sc.netSegments), 4)
+        call = queue.post(lambda: 1/0)
+        self.assertEqual(queue.apply(0), False)
+        self.assertEqual(len(sc.netSegments), 10)
+        self.assertRaises(ZeroDivisionError, call.result)
+        call = queue.post(len, sc.netSegments)
+        queue.cancel()
+        self.assertEqual(call.result(), None)
+        self.assertEqual(len(queue), 0)
+
+    def test_16_memoryUsage(self):
+        class View():
+            def __init__(self, scene):
+                self._scene = scene
+            def scene(self):
+                return self._scene
+        self.database.layers = Layers(self.database)
+        root = self.database.libraries
+        cell = root.createCellFromPath(Path.createFromPathName('lib/cell'))
+        sc = Schematic('schematic', cell)
+        for i in range(10):
+            NetSegment(sc, self.database.layers, 0, i*100, 1000, i*100)
+        line = Line(sc, self.database.layers, 0, 0, 100, 100)
+        views = [View(self), View(None)] #registries hold weak references
+        for v in views:
+            line.installUpdateHook(v)
+        usage = self.database.memoryUsage()
+        node = usage.childByName('libraries').childByName('lib').childByName('cell').childByName('schematic')
+        self.assertEqual(node.childByName('elements').objects, 11)
+        self.assertTrue(node.childByName('index').bytes > 0)
+        self.assertEqual(usage.childByName('views').objects, 1)
+        self.assertEqual(usage.childByName('views (detached)').objects, 1)
+        self.assertTrue(usage.totalBytes > node.totalBytes > 0)
+        self.assertTrue('schematic' in usage.report(4))
+
+    def test_17_viewRegistryLeak(self):
+        import gc
+        class Item():
+            def __init__(self, element):
+                self.element = element
+                element.installUpdateHook(self)
+            def updateItem(self):
+                pass
+        class Scene():
+            def __init__(self, design):
+                self.items = []
+                design.sceneAdded(self)
+            def addElems(self, elems):
+                self.items = [Item(e) for e in elems]
+        self.database.layers = Layers(self.database)
+        root = self.database.libraries
+        cell = root.createCellFromPath(Path.createFromPathName('lib/cell'))
+        sc = Schematic('schematic', cell)
+        for i in range(1000):
+            Line(sc, self.database.layers, 0, i*100, 1000, i*100)
+        self.assertEqual(list(sc.elems)[0].views, ()) #no registry until a view is added
+        design = Design(sc, self.database.designs)
+        view = LibraryView()
+        root.libraryViewAdded(view)
+        sizes = []
+        for n in range(5):
+            scene = Scene(design)
+            self.assertEqual(design.scene, scene)
+            self.assertEqual(sum(len(e.views) for e in sc.elems), 1000)
+            del scene
+            gc.collect()
+            sizes.append(len(gc.get_objects()))
+            self.assertEqual(design.scene, None)
+            self.assertEqual(sum(len(e.views) for e in sc.elems), 0)
+        self.assertEqual(min(sizes), max(sizes)) #flat
+        self.assertEqual(len(root.libraryViews), 1)
+        del view
+        gc.collect()
+        self.assertEqual(len(root.libraryViews), 0)
+
+    def test_18_transactionRollback(self):
+        self.database.layers = Layers(self.database)
+        layers = self.database.layers
+        root = self.database.libraries
+        cell = root.createCellFromPath(Path.createFromPathName('lib/cell'))
+        sc = Schematic('schematic', cell)
+        NetSegment(sc, layers, 0, 0, 1000, 0)
+        l = Label(sc, layers)
+        l.text = 'a'
+        self.database.runDeferredProcesses()
+        def edit():
+            with self.database.transaction():
+                NetSegment(sc, layers, 500, 0, 500, 500)
+                with self.database.transaction():
+                    l.text = 'b'
+                list(sc.netSegments)[0].remove()
+                raise ValueError
+        self.assertRaises(ValueError, edit)
+        self.assertFalse(self.database.inTransaction)
+        self.assertEqual(len(sc.netSegments), 1)
+        self.assertEqual(list(sc.netSegments)[0].geometry, (0, 0, 1000, 0))
+        self.assertEqual(len(sc.solderDots), 0)
+        self.assertEqual(list(sc.labels)[0].text, 'a')
+        self.assertEqual(self.database.undo(), True) #edits before the transaction
+        self.assertEqual(len(sc.netSegments), 0)
+        self.assertEqual(self.database.redo(), True)
+        self.assertEqual(self.database.redo(), False) #no record of the rollback
+
+    def test_19_journalLayers(self):
+        layers = Layers(self.database)
+        for name in ('annotation', 'bus'):
+            l = Layer()
+            l.name = name
+            l.type = 'drawing'
+            layers.addLayer(l)
+        self.database.layers = layers
+        annotation = layers.layerByName('annotation', 'drawing')
+        bus = layers.layerByName('bus', 'drawing')
+        root = self.database.libraries
+        cell = root.createCellFromPath(Path.createFromPathName('lib/cell'))
+        sc = Schematic('schematic', cell)
+        line = Line(sc, layers, 0, 0, 1000, 0)
+        self.assertEqual(line.layer, annotation)
+        self.database.runDeferredProcesses()
+        line.layer = bus
+        self.database.runDeferredProcesses()
+        self.assertEqual(self.database.undo(), True)
+        self.assertEqual(line.layer, annotation)
+        self.assertEqual(self.database.redo(), True)
+        self.assertEqual(line.layer, bus)
+        line.remove()
+        self.database.runDeferredProcesses()
+        self.assertEqual(self.database.undo(), True)
+        self.assertEqual(list(sc.lines)[0].layer, bus)
+
+    def test_20_journalKeys(self):
+        self.database.layers = Layers(self.database)
+        layers = self.database.layers
+        root = self.database.libraries
+        cell = root.createCellFromPath(Path.createFromPathName('lib/cell'))
+        sc = Schematic('schematic', cell)
+        journal = self.database.journal
+        journal.depth = 2
+        for i in range(100):
+            with self.database.transaction():
+                l = Line(sc, layers, 0, i, 1000, i)
+            with self.database.transaction():
+                l.remove()
+        self.assertTrue(len(journal._elements) <= 2)
+        self.assertEqual(len(journal._keys), len(journal._elements))
+        l = Line(sc, layers, 0, 0, 1000, 0)
+        l.remove() #never grouped
+        journal.closeGroup()
+        self.assertTrue(len(journal._elements) <= 2)
+        self.assertEqual(self.database.undo(), True)
+        self.assertEqual(len(sc.lines), 1)
+        l = Line(sc, layers, 0, 0, 500, 0)
+        journal.closeGroup() #redo groups dropped
+        self.assertTrue(len(journal._elements) <= 3)
+
+    def test_21_threadCheck(self):
+        import threading
+        self.database.layers = Layers(self.database)
+        layers = self.database.layers
+        root = self.database.libraries
+        cell = root.createCellFromPath(Path.createFromPathName('lib/cell'))
+        sc = Schematic('schematic', cell)
+        l = Line(sc, layers, 0, 0, 1000, 0)
+        errors = []
+        def attempt(f, *args):
+            try:
+                f(*args)
+            except ThreadError:
+                errors.append(f)
+        def worker():
+            attempt(Line, sc, layers, 0, 100, 1000, 100)
+            attempt(setattr, l, 'x', 500)
+            attempt(l.remove)
+            attempt(root.createCellFromPath, Path.createFromPathName('lib/cell2'))
+            self.database.callQueue.post(setattr, l, 'x', 200)
+        t = threading.Thread(target=worker)
+        t.start()
+        t.join()
+        self.assertEqual(len(errors), 4)
+        self.assertEqual([e.geometry for e in sc.lines], [(0, 0, 1000, 0)])
+        self.database.callQueue.apply()
+        self.assertEqual(l.x, 200)
+
+    def test_22_perfCounters(self):
+        directory = tempfile.mkdtemp()
+        f = open(os.path.join(directory, 'res.sym'), 'w')
+        f.write('v 20110115 2\n'
+                'L 0 0 100 0 3 0 0 0 -1 -1\n'
+                'L 0 100 100 100 3 0 0 0 -1 -1\n')
+        f.close()
+        self.database.layers = Layers(self.database)
+        perf.enable()
+        try:
+            importer = GedaImporter(self.database.libraries)
+            importer.importLibraryList([('lib', directory)], [])
+            counters = perf.counters
+        finally:
+            perf.disable()
+            perf.reset()
+            shutil.rmtree(directory)
+        self.assertEqual(counters['GedaImporter.cells'], 1)
+        self.assertEqual(counters['GedaReader.records'], 2)
+        self.assertTrue(counters['Database.deferredProcesses'] >= 1)
@@ -0,0 +1,55 @@
+﻿import unittest
+
+from Database.Path import Path
+from Database.CellViews import *
+from Database.Design import *
+from Database.Primitives import *
+from Database.Tests.test_Database import Client
+
+try:
+    from PSchem.GraphicsScene import *
+    from PSchem.LayerView import loadDefaultLayers
+except ImportError: #Qt bindings not installed
+    GraphicsScene = None
+
+@unittest.skipUnless(GraphicsScene, 'Qt bindings are not installed')
+class GraphicsSceneTest(unittest.TestCase):
+    def setUp(self):
+        self.application = QtGui.QApplication.instance() or QtGui.QApplication([])
+        self.client = Client()
+        self.database = self.client.database
+
+    def tearDown(self):
+        self.database.close()
+        self.client.database = None
+        self.client = None
+        self.database = None
+
+    def test_01_instanceLabels(self):
+        layers = loadDefaultLayers(self.database)
+        root = self.database.libraries
+        res = root.createCellFromPath(Path.createFromPathName('lib/res'))
+        sy = Symbol('symbol', res)
+        Line(sy, layers, 0, 0, 1000, 0)
+        l = Label(sy, layers)
+        l.text = 'R1'
+        l.textSize = 100
+        top = root.createCellFromPath(Path.createFromPathName('lib/top'))
+        sc = Schematic('schematic', top)
+        for (hMirror, vMirror) in ((False, False), (True, False),
+                                   (False, True), (True, True)):
+            i = Instance(sc, layers)
+            i.instanceLibraryPath = 'lib'
+            i.instanceCellName = 'res'
+            i.instanceCellViewName = 'symbol'
+            i.hMirror = hMirror
+            i.vMirror = vMirror
+        design = Design(sc, self.database.designs)
+        scene = GraphicsScene(design)
+        texts = [item for item in scene.items() if isinstance(item, TextItemInt)]
+        self.assertEqual(len(texts), 4)
+        for text in texts:
+            m = text.sceneTransform()
+            #readable once the view flips the y axis
+            self.assertTrue(m.m11() > 0)
+            self.assertTrue(m.m22() < 0)
@@ -0,0 +1,45 @@
+﻿import unittest
+
+from Database.NameIndex import *
+
+class NameIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = NameIndex()
+        for name in ['resistor', 'Res', 'capacitor', 'nmos', 'pmos', 'nmos4', 'vres']:
+            self.index.add(name, name)
+        
+    def tearDown(self):
+        self.index = None
+        
+    def test_01_search(self):
+        idx = self.index
+        self.assertEqual(len(idx), 7)
+        self.assertEqual(idx.search('res'), ['Res', 'resistor', 'vres'])
+        self.assertEqual(idx.search('MOS'), ['nmos', 'pmos', 'nmos4'])
+        self.assertEqual(idx.search('s'), ['Res', 'nmos', 'pmos', 'vres', 'nmos4', 'resistor'])
+        self.assertEqual(idx.search('res', limit=1), ['Res'])
+        self.assertEqual(idx.search('xyz'), [])
+
+    def test_02_fuzzy(self):
+        idx = self.index
+        self.assertEqual(idx.search('capacitr'), [])
+        self.assertEqual(idx.search('capacitr', fuzzy=True), ['capacitor'])
+
+    def test_03_remove(self):
+        idx = self.index
+        idx.remove('Res', 'Res')
+        idx.remove('nmos4', 'nmos4')
+        self.assertEqual(idx.search('res'), ['resistor', 'vres'])
+        self.assertEqual(idx.search('mos4'), [])
+        self.assertEqual(len(idx), 5)
+
+    def test_04_unicode(self):
+        idx = self.index
+        idx.add('r_\xce\xa9', 'ohm') #utf-8 bytes
+        idx.add(u'Gr\xf6\xdfe', 'size')
+        self.assertEqual(idx.search(u'\u03a9'), ['ohm'])
+        self.assertEqual(idx.search(u'GR\xd6'), ['size'])
+        self.assertEqual(idx.search(u'\u20ac', True), [])
+        self.assertEqual(idx.search(u'res'), ['Res', 'resistor', 'vres'])
+        idx.remove(u'r_\u03a9', 'ohm')
+        self.assertEqual(idx.search('r_'), [])
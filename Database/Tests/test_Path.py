@@ -101,3 +101,15 @@ class PathTest(unittest.TestCase):
         self.assertRaises(PathError, Path.createFromPathName, 'a.b.c..d/e/f')
         self.assertRaises(PathError, Path.createFromPathName, 'a.b.c.d//f')
         self.assertRaises(PathError, Path.createFromPathName, 'a.b.c.d/e/f/g')
+
+    def test_09_interned(self):
+        p1 = Path.createFromPathName('a.b/e/f')
+        p2 = Path.createFromPathName('a.b/e/f')
+        p3 = Path.createFromNames('a.b', 'e', 'f')
+        self.assertTrue(p1 is p2)
+        self.assertTrue(p1 is p3)
+        self.assertTrue(p1.descend is p1.descend)
+        self.assertTrue(p1.cell.cell is p1.cell)
+        self.assertEqual(p1.cell, Path.createFromPathName('a.b/e'))
+        self.assertEqual(hash(p1.library), hash(Path.createFromPathName('a.b')))
+        self.assertRaises(AttributeError, setattr, p1, 'cellName', 'x')
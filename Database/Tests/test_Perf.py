@@ -0,0 +1,51 @@
+﻿import unittest
+import os
+import json
+import tempfile
+
+from Database.Perf import Perf, perf, timed
+
+@timed('square')
+def square(x):
+    return x*x
+
+class PerfTest(unittest.TestCase):
+    def tearDown(self):
+        perf.disable()
+        perf.reset()
+
+    def test_01_disabled(self):
+        self.assertEqual(square(3), 9)
+        with perf.timer('block'):
+            perf.count('items')
+        self.assertEqual(perf.timers, {})
+        self.assertEqual(perf.counters, {})
+
+    def test_02_timersAndCounters(self):
+        perf.enable()
+        square(2)
+        square(3)
+        with perf.timer('block'):
+            perf.count('items', 5)
+        self.assertEqual(perf.timers['square'][0], 2)
+        self.assertEqual(perf.timers['block'][0], 1)
+        self.assertEqual(perf.counters, {'items': 5})
+        self.assertTrue('square' in perf.report())
+        self.assertEqual(square.__name__, 'square')
+
+    def test_03_trace(self):
+        p = Perf()
+        p.enable(tracing=True)
+        with p.timer('outer'):
+            p.count('n')
+        (fd, fileName) = tempfile.mkstemp('.json')
+        os.close(fd)
+        try:
+            p.saveTrace(fileName)
+            events = json.load(open(fileName))['traceEvents']
+        finally:
+            os.remove(fileName)
+        self.assertEqual(sorted(e['ph'] for e in events), ['C', 'X'])
+        x = [e for e in events if e['ph'] == 'X'][0]
+        self.assertEqual(x['name'], 'outer')
+        self.assertTrue(x['dur'] >= 0)
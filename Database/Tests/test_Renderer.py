@@ -0,0 +1,71 @@
+﻿import unittest
+import os
+import shutil
+import tempfile
+
+from Database.Path import Path
+from Database.CellViews import *
+from Database.Primitives import *
+from Database.Tests.test_Database import Client
+
+try:
+    from PSchem.Renderer import *
+    from PSchem.LayerView import loadDefaultLayers
+except ImportError: #Qt bindings not installed
+    BatchRenderer = None
+
+@unittest.skipUnless(BatchRenderer, 'Qt bindings are not installed')
+class RendererTest(unittest.TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.database = self.client.database
+        self.directory = tempfile.mkdtemp(prefix='pschem-render-')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        self.database.close()
+        self.client.database = None
+        self.client = None
+        self.database = None
+
+    def test_01_renderSymbol(self):
+        layers = loadDefaultLayers(self.database, False)
+        root = self.database.libraries
+        cell = root.createCellFromPath(Path.createFromPathName('lib/res'))
+        sy = Symbol('symbol', cell)
+        Line(sy, layers, 0, 0, 1000, 0)
+        Rect(sy, layers, 200, -100, 600, 200)
+        a = AttributeLabel(sy, layers, 'footprint', 'x' * 200)
+        a.textSize = 100
+        a.visible = False
+        renderer = BatchRenderer(self.database, self.directory, 1)
+        fileName = renderer.render([sy], 'png', 64)[sy]
+        self.assertTrue(os.path.getsize(fileName) > 0)
+        image = QtGui.QImage(fileName)
+        self.assertEqual(image.width(), 64)
+        background = image.pixel(0, 0)
+        columns = [x for x in range(64) for y in range(64)
+                   if image.pixel(x, y) != background]
+        self.assertTrue(max(columns) - min(columns) > 32) #not shrunk by the hidden label
+        mtime = os.path.getmtime(fileName)
+        self.assertEqual(renderer.render([sy], 'png', 64)[sy], fileName) #cached
+        self.assertEqual(os.path.getmtime(fileName), mtime)
+
+    def test_02_renderLabel(self):
+        layers = loadDefaultLayers(self.database, False)
+        root = self.database.libraries
+        cell = root.createCellFromPath(Path.createFromPathName('lib/label'))
+        sy = Symbol('symbol', cell)
+        l = Label(sy, layers)
+        l.text = 'MMMMMMMM'
+        l.textSize = 100
+        l.vAlign = Label.AlignBottom
+        ensureApplication()
+        fileName = os.path.join(self.directory, 'label.png')
+        renderToFile(sy, fileName, 64)
+        image = QtGui.QImage(fileName)
+        background = image.pixel(0, 0)
+        columns = [x for x in range(64) for y in range(64)
+                   if image.pixel(x, y) != background]
+        self.assertTrue(columns) #drawn inside the extents
+        self.assertTrue(max(columns) - min(columns) > 16)
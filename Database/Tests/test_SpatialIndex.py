@@ -0,0 +1,206 @@
+﻿import unittest
+
+from Database.SpatialIndex import *
+from Database.Picker import *
+from Database.Primitives import *
+from Database.Layers import *
+from Database.CellViews import *
+from Database.Tests.test_Database import Client
+
+class SpatialIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SpatialIndex(10)
+        
+    def tearDown(self):
+        self.index = None
+        
+    def test_01_addRemove(self):
+        idx = self.index
+        idx.add('a', (0, 0, 5, 5))
+        idx.add('b', (20, 20, 35, 25))
+        idx.add('c', (-5, 3, -100, -30)) #unnormalized
+        self.assertEqual(len(idx), 3)
+        self.assertEqual(idx.boxOf('c'), (-100, -30, -5, 3))
+        self.assertEqual(idx.intersecting((1, 1, 2, 2)), set(['a']))
+        self.assertEqual(idx.intersecting((5, 5, 20, 20)), set(['a', 'b']))
+        self.assertEqual(idx.intersecting((-50, -50, 100, 100)), set(['a', 'b', 'c']))
+        self.assertEqual(idx.intersecting((6, 6, 19, 19)), set())
+        idx.remove('a')
+        self.assertEqual(idx.intersecting((5, 5, 20, 20)), set(['b']))
+        self.assertEqual(idx.extents, (-100, -30, 35, 25))
+        
+    def test_02_update(self):
+        idx = self.index
+        idx.add('a', (0, 0, 5, 5))
+        idx.update('a', (100, 100, 105, 105))
+        self.assertEqual(idx.intersecting((0, 0, 5, 5)), set())
+        self.assertEqual(idx.intersecting((100, 100, 100, 100)), set(['a']))
+        
+    def test_03_oversized(self):
+        idx = self.index
+        idx.add('big', (-10000, -10000, 10000, 10000))
+        idx.add('small', (0, 0, 1, 1))
+        self.assertEqual(idx.intersecting((500, 500, 501, 501)), set(['big']))
+        idx.remove('big')
+        self.assertEqual(idx.intersecting((-20000, -20000, 20000, 20000)), set(['small']))
+        self.assertEqual(idx.extents, (0, 0, 1, 1))
+
+    def test_04_contained(self):
+        idx = self.index
+        idx.add('a', (0, 0, 5, 5))
+        idx.add('b', (4, 4, 30, 30))
+        self.assertEqual(idx.contained((-1, -1, 10, 10)), set(['a']))
+        self.assertEqual(idx.contained((0, 0, 30, 30)), set(['a', 'b']))
+        self.assertEqual(idx.intersecting((-1, -1, 10, 10)), set(['a', 'b']))
+
+    def test_05_extents(self):
+        idx = self.index
+        boxes = {}
+        for n in range(200):
+            box = ((n*37) % 101, (n*53) % 97, (n*37) % 101 + n % 7, (n*53) % 97 + n % 5)
+            boxes[n] = box
+            idx.add(n, box)
+        for n in range(0, 200, 3):
+            idx.remove(n)
+            del boxes[n]
+        for n in range(1, 200, 5):
+            boxes[n] = (-n, 2*n, n, 3*n)
+            idx.update(n, boxes[n])
+        b = boxes.values()
+        self.assertEqual(idx.extents, (min(x[0] for x in b), min(x[1] for x in b),
+                                       max(x[2] for x in b), max(x[3] for x in b)))
+        for n in list(boxes):
+            idx.remove(n)
+        self.assertEqual(idx.extents, None)
+
+class DiagramSpatialIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.database = self.client.database
+        
+    def tearDown(self):
+        self.database.close()
+        self.client.database = None
+        self.client = None
+        self.database = None
+        
+    def test_01_elements(self):
+        root = self.database.libraries
+        p = Path.createFromPathName('lib/cell/schematic')
+        sc = root.createSchematicFromPath(p)
+        layers = Layers(self.database)
+        l1 = Line(sc, layers, 0, 0, 1000, 0)
+        idx = sc.spatialIndex
+        self.assertEqual(idx.boxOf(l1), (0, 0, 1000, 0))
+        l2 = Line(sc, layers, 5000, 5000, 6000, 7000)
+        self.assertEqual(idx.intersecting((900, -10, 1100, 10)), set([l1]))
+        self.assertEqual(sc.extents, (0, 0, 6000, 7000))
+        l2.remove()
+        self.assertEqual(sc.extents, (0, 0, 1000, 0))
+
+    def test_02_picker(self):
+        root = self.database.libraries
+        p = Path.createFromPathName('lib/cell/schematic')
+        sc = root.createSchematicFromPath(p)
+        layers = Layers(self.database)
+        l1 = Line(sc, layers, 0, 0, 1000, 1000)
+        r = Rect(sc, layers, 0, 0, 1000, 1000)
+        picker = Picker(sc, 10)
+        self.assertEqual(picker.pick(500, 505), (l1, r))
+        self.assertEqual(picker.pick(900, 100), (r,))
+        self.assertTrue(picker.pick(500, 505) is picker.pick(500, 505)) #cached
+        l2 = Line(sc, layers, 0, 500, 1000, 500)
+        self.assertEqual(set(picker.pick(500, 505)), set([l1, l2, r]))
+        l1.remove()
+        self.assertEqual(picker.pick(500, 505)[-1], r)
+        self.assertEqual(picker.pick(2000, 2000), ())
+        self.assertEqual(picker.contained((-10, -10, 1010, 600)), [l2])
+        self.assertEqual(picker.intersecting((-10, -10, 1010, 600)), [l2, r])
+
+    def test_03_labels(self):
+        root = self.database.libraries
+        p = Path.createFromPathName('lib/cell/schematic')
+        sc = root.createSchematicFromPath(p)
+        layers = Layers(self.database)
+        Line(sc, layers, 0, 0, 1000, 0)
+        l = Label(sc, layers)
+        l.text = 'refdes=R1'
+        l.textSize = 100
+        l.x = 200
+        l.y = 100
+        l.vAlign = Label.AlignBottom
+        self.assertEqual(sc.spatialIndex.boxOf(l), (200, 100, 740, 200))
+        self.assertEqual(sc.extents, (0, 0, 1000, 200))
+        self.assertTrue(l.hitTest(700, 150))
+        self.assertFalse(l.hitTest(200, 250, 10))
+        l.angle = 90
+        (x1, y1, x2, y2) = sc.spatialIndex.boxOf(l)
+        self.assertEqual([round(c) for c in (x1, y1, x2, y2)], [100, 100, 200, 640])
+        self.assertTrue(l.hitTest(150, 600))
+        self.assertFalse(l.hitTest(600, 150))
+        l.visible = False
+        self.assertFalse(l in sc.spatialIndex)
+        self.assertEqual(sc.extents, (0, 0, 1000, 0))
+        l.visible = True
+        self.assertTrue(l in sc.spatialIndex)
+
+    def test_04_pickOrder(self):
+        layers = Layers(self.database)
+        for (name, z) in (('net', 100), ('attribute', 400), ('instance', 1000)):
+            l = Layer()
+            l.name = name
+            l.type = 'drawing'
+            l.zValue = z
+            layers.addLayer(l)
+        self.database.layers = layers
+        root = self.database.libraries
+        top = root.createCellFromPath(Path.createFromPathName('lib/top'))
+        res = root.createCellFromPath(Path.createFromPathName('lib/res'))
+        sy = Symbol('symbol', res)
+        Line(sy, layers, 0, 0, 1000, 0)
+        Line(sy, layers, 0, 1000, 1000, 1000)
+        a = AttributeLabel(sy, layers, 'refdes', 'R1' * 100)
+        a.visible = False
+        sc = Schematic('schematic', top)
+        i = Instance(sc, layers)
+        i.instanceLibraryPath = 'lib'
+        i.instanceCellName = 'res'
+        i.instanceCellViewName = 'symbol'
+        self.assertEqual(i.boundingBox, (0, 0, 1000, 1000))
+        n = NetSegment(sc, layers, 500, -500, 500, 500)
+        self.database.runDeferredProcesses()
+        picker = Picker(sc, 10)
+        self.assertEqual(picker.pick(500, 0), (n, i)) #nets are drawn above instances
+        self.assertEqual(picker.pick(200, 500), ()) #inside the box, off the lines
+        i.angle = 90
+        self.assertEqual(picker.pick(-1000, 300), (i,))
+        self.assertEqual(picker.pick(-300, 300), ())
+        a2 = AttributeLabel(sc, layers, 'value', '1k')
+        a2.x = 3000
+        a2.y = 3000
+        a2.visible = False
+        self.assertEqual(picker.pick(3000, 3000), ())
+        l1 = Line(sc, layers, 5000, 0, 6000, 0)
+        l2 = Line(sc, layers, 5000, 0, 6000, 0)
+        self.assertEqual(picker.pick(5500, 0), (l2, l1)) #later one on top
+
+    def test_05_extentsChanged(self):
+        class Unit():
+            changes = 0
+            def extentsChanged(self):
+                self.changes += 1
+        root = self.database.libraries
+        p = Path.createFromPathName('lib/cell/schematic')
+        sc = root.createSchematicFromPath(p)
+        layers = Layers(self.database)
+        Line(sc, layers, 0, 0, 1000, 1000)
+        self.assertEqual(sc.extents, (0, 0, 1000, 1000)) #as a scene does
+        unit = Unit()
+        sc.designUnits.add(unit)
+        Line(sc, layers, 100, 100, 200, 200) #inside the extents
+        self.assertEqual(unit.changes, 0)
+        l = Line(sc, layers, 0, 0, 2000, 0)
+        self.assertEqual(unit.changes, 1)
+        l.remove()
+        self.assertEqual(unit.changes, 2)
+        self.assertEqual(sc.extents, (0, 0, 1000, 1000))
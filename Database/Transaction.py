@@ -0,0 +1,52 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+class Transaction():
+    """
+    Groups database edits. While a transaction is open, deferred
+    processing requests and element view updates are buffered and
+    schematic connectivity indices are updated lazily. Everything is
+    flushed once when the outermost transaction is committed.
+    Use through Database.transaction():
+
+        with database.transaction():
+            for i in range(1000):
+                NetSegment(schematic, layers, 0, i*100, 1000, i*100)
+
+    If the block raises, the edits of the outermost transaction are
+    reverted through the journal (edits made while the journal is
+    suspended are kept) and the exception is propagated.
+    """
+    def __init__(self, database):
+        self._database = database
+
+    @property
+    def database(self):
+        return self._database
+
+    def __enter__(self):
+        self.database.beginTransaction()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.database.commitTransaction()
+        else:
+            self.database.rollbackTransaction()
+        return False
@@ -32,6 +32,7 @@ except ImportError:
 import os
 import time
 import re
+import bisect
 from collections import deque
 
 
@@ -93,10 +94,12 @@ class StdoutWrap():
         self.stream = sys.stdout
 
     def write(self, txt):
-        self.console.write(txt)
         #if self.stream.fileno() >= 0: # for Windows (pythonw.exe) compatibility
         #    self.stream.write(txt)
-        if txt.find('\n', -1) != -1:
+        if QtCore.QThread.currentThread() != self.console.thread():
+            #background command, handled by the GUI thread
+            self.console.emit(QtCore.SIGNAL("backgroundOutput(QString)"), txt)
+        elif self.console.write(txt):
             QtGui.qApp.processEvents() #interferes with deferred processing of Database notifications
 
     def writeSync(self, txt, markPos = False):
@@ -123,63 +126,159 @@ class StderrWrap():
         self.stream = sys.stderr
 
     def write(self, txt):
-        self.console.writeErr(txt)
         if self.stream.fileno() >= 0:
             self.stream.write(txt)
-        QtGui.qApp.processEvents() #interferes with deferred processing of Database notifications
+        if self.console.writeErr(txt):
+            QtGui.qApp.processEvents() #interferes with deferred processing of Database notifications
 
     def isatty(self):
         return True
 
+class OutputBuffer():
+    """
+    Console output waiting to be inserted into the document.
+
+    Only the last maxLines lines are kept, older ones are appended to
+    the log file (if set) or dropped.
+    """
+    def __init__(self, maxLines = 10000, logPath = None):
+        self._chunks = deque()
+        self._lines = 0
+        self._dropped = 0
+        self._maxLines = maxLines
+        self._logPath = logPath
+        self._log = None
+
+    @property
+    def logPath(self):
+        return self._logPath
+
+    def setLogPath(self, logPath):
+        self.close()
+        self._logPath = logPath
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def append(self, txt):
+        lines = txt.count('\n')
+        if lines > self._maxLines:
+            split = txt.splitlines(True)
+            self.spill(''.join(split[:-self._maxLines]))
+            txt = ''.join(split[-self._maxLines:])
+            lines = txt.count('\n')
+        self._chunks.append(txt)
+        self._lines += lines
+        while self._lines > self._maxLines and len(self._chunks) > 1:
+            self.spill(self._chunks.popleft())
+
+    def spill(self, txt):
+        lines = txt.count('\n')
+        self._lines -= min(lines, self._lines)
+        self._dropped += lines
+        if self._logPath:
+            if not self._log:
+                self._log = open(self._logPath, 'a')
+            self._log.write(txt)
+
+    def take(self):
+        """Return and clear the pending text."""
+        txt = ''.join(self._chunks)
+        if self._dropped:
+            if self._log:
+                self._log.flush()
+                where = ' (see ' + self._logPath + ')'
+            else:
+                where = ''
+            txt = '[%d lines omitted%s]\n' % (self._dropped, where) + txt
+        self._chunks.clear()
+        self._lines = 0
+        self._dropped = 0
+        return txt
+
+    def close(self):
+        if self._log:
+            self._log.close()
+            self._log = None
+
+
 class History(deque):
-    pfirst = re.compile(r'^>>> ')
-    prest =  re.compile(r'^\.\.\. ')
+    """
+    Command history. Executed commands are appended to the history
+    file, which is compacted to the last maxEntries commands when it
+    grows compactRatio times larger. Prefix searches use a sorted index
+    of command texts.
+    """
     pstart = re.compile(r'^\S+.*\:$')
     pempty = re.compile(r'^\s*$')
+    maxEntries = 1000
+    compactRatio = 2
 
-    def __init__(self):
-        deque.__init__(self)
+    def __init__(self, maxEntries = None, filePath = None):
+        if maxEntries:
+            self.maxEntries = maxEntries
+        deque.__init__(self, (), self.maxEntries)
         self.pointer = 0
-        #dir = os.path.expanduser('~')
-        dir = os.getcwd()
-        fileName = 'pschem.history'
-        self.filePath = os.path.join(dir, fileName)
+        self._first = 0        #sequence number of self[0]
+        self._index = []       #sorted (text, sequence number)
+        self._fileEntries = 0
+        if not filePath:
+            #dir = os.path.expanduser('~')
+            dir = os.getcwd()
+            fileName = 'pschem.history'
+            filePath = os.path.join(dir, fileName)
+        self.filePath = filePath
         self.restore()
 
-    def __del__(self):
-        self.save()
+    def _add(self, cmd):
+        if len(self) == self.maxlen:
+            old = self.popleft()
+            i = bisect.bisect_left(self._index, (old.text(), self._first))
+            del self._index[i]
+            self._first += 1
+        bisect.insort(self._index, (cmd.text(), self._first + len(self)))
+        self.append(cmd)
 
-    def save(self):
-        print 'Saving command history to ' + self.filePath
-        f = open(self.filePath, 'w')
+    def _write(self, cmds, mode):
         try:
-            for cmd in self:
-                cmdText = unicode(cmd)
-                f.write(cmdText)
-                #write(cmdText)
-        finally:
-            f.close()
+            f = open(self.filePath, mode)
+            try:
+                for cmd in cmds:
+                    f.write(unicode(cmd))
+            finally:
+                f.close()
+        except IOError:
+            print traceback.format_exc()
+
+    def save(self):
+        self.compact()
+
+    def compact(self):
+        """Rewrite the history file with the retained commands only."""
+        self._write(self, 'w')
+        self._fileEntries = len(self)
 
     def restore(self):
-        first = True
-        cmd = ''
-        if os.path.exists(self.filePath) and os.path.isfile(self.filePath):
+        if os.path.isfile(self.filePath):
             print 'Restoring command history from ' + self.filePath
+            entries = 0
+            cmd = None
             f = open(self.filePath, 'r')
             try:
                 for line in f:
-                    if first and self.pfirst.search(line):
-                        line = self.pfirst.sub('', line)
+                    if cmd is None and line.startswith('>>> '):
+                        line = line[4:]
                         if not self.pstart.search(line):
-                            self.push(Command(line, 'single'))
+                            self._add(Command(line, 'single'))
+                            entries += 1
                         else:
                             cmd = line
-                            first = False
-                    elif not first and self.prest.search(line):
-                        line = self.prest.sub('', line)
+                    elif cmd is not None and line.startswith('... '):
+                        line = line[4:]
                         if self.pempty.search(line):
-                            self.push(Command(cmd, 'exec'))
-                            first = True
+                            self._add(Command(cmd, 'exec'))
+                            entries += 1
+                            cmd = None
                         else:
                             cmd += line
                     else:
@@ -188,43 +287,57 @@ class History(deque):
                 print traceback.format_exc()
             finally:
                 f.close()
+            self.pointer = len(self)
+            self._fileEntries = entries
+            if entries > len(self):
+                self.compact()
         else:
             print 'No history file found: ' + self.filePath
 
-        
     def push(self, cmd):
         self._transient = None
-        self.append(cmd)
+        self._add(cmd)
         self.pointer = len(self)
-        #self.pointer += 1
+        self._write((cmd,), 'a')
+        self._fileEntries += 1
+        if self._fileEntries > self.compactRatio * self.maxEntries:
+            self.compact()
+
+    def matches(self, searchTxt):
+        """Positions of commands starting with searchTxt."""
+        index = self._index
+        i = bisect.bisect_left(index, (searchTxt,))
+        while i < len(index) and index[i][0].startswith(searchTxt):
+            yield index[i][1] - self._first
+            i += 1
 
     def previous(self, searchTxt = None):
-        if self.pointer > 0:
-            self.pointer -= 1
-            val = self[self.pointer]
-            #print ">>" + str(searchTxt) + "<<"
-            #if (not searchTxt or str(val).find(searchTxt) != -1):
-            if (not searchTxt or val.find(searchTxt) != -1):
-                return val
-            else:
-                return self.previous(searchTxt)
+        if not searchTxt:
+            if self.pointer > 0:
+                self.pointer -= 1
+                return self[self.pointer]
+            return None
+        positions = [p for p in self.matches(searchTxt) if p < self.pointer]
+        if positions:
+            self.pointer = max(positions)
+            return self[self.pointer]
 
     def next(self, searchTxt = None):
-        if (self.pointer < len(self) - 1):
-            self.pointer += 1
-            val = self[self.pointer]
-            #print ">>" + str(searchTxt) + "<<"
-            #if (not searchTxt or str(val).find(searchTxt) != -1):
-            if (not searchTxt or val.find(searchTxt) != -1):
-                return val
-            else:
-                return self.next(searchTxt)
-            #return self[self.pointer]
+        if not searchTxt:
+            if self.pointer < len(self) - 1:
+                self.pointer += 1
+                return self[self.pointer]
+            return None
+        positions = [p for p in self.matches(searchTxt) if p > self.pointer]
+        if positions:
+            self.pointer = min(positions)
+            return self[self.pointer]
+        self.pointer = len(self)
 
     def __repr__(self):
         text = ''
         for cmd in self:
-            text += cmd
+            text += unicode(cmd)
         return text
     
 
@@ -235,6 +348,8 @@ class ConsoleWidget(QtGui.QPlainTextEdit):
     pempty = re.compile(r'^\s*$')
     pindented = re.compile(r'^\s+.*$')
     penter = re.compile(r'\n$')
+    maxLines = 10000 #arbitrary limit on number of lines
+    flushInterval = 50 #ms between output updates
 
     def __init__(self, window=None):
         QtGui.QPlainTextEdit.__init__(self)
@@ -253,6 +368,14 @@ class ConsoleWidget(QtGui.QPlainTextEdit):
         
         self._synchronous = True
         self._syncFlag = False
+
+        self._output = OutputBuffer(self.maxLines)
+        self._lastFlush = 0.0
+        self._flushTimer = QtCore.QTimer(self)
+        self._flushTimer.setSingleShot(True)
+        self.connect(self._flushTimer, QtCore.SIGNAL("timeout()"), self.flush)
+        self.connect(self, QtCore.SIGNAL("backgroundOutput(QString)"),
+                     self.writeBackground)
                 
         self.defaultFormat = self.currentCharFormat()
         fontFamilies = QtGui.QFontDatabase().families()
@@ -271,7 +394,7 @@ class ConsoleWidget(QtGui.QPlainTextEdit):
 
         self.setLineWrapMode(QtGui.QPlainTextEdit.NoWrap)
         
-        self.setMaximumBlockCount(10000) #arbitrary limit on number of lines
+        self.setMaximumBlockCount(self.maxLines)
         self.setUndoRedoEnabled(False)
         
         sys.stdout = StdoutWrap(self)
@@ -288,8 +411,19 @@ class ConsoleWidget(QtGui.QPlainTextEdit):
         self.connect(self._pasteAct, QtCore.SIGNAL("triggered()"),
                     self.paste)
 
+        self._backgroundAct = QtGui.QAction(self.tr("Run in Background"), self)
+        self._backgroundAct.setCheckable(True)
+        self._cancelAct = QtGui.QAction(self.tr("Cancel"), self)
+        self._cancelAct.setShortcut(self.tr("Esc"))
+        self._cancelAct.setEnabled(False)
+        self.connect(self._cancelAct, QtCore.SIGNAL("triggered()"),
+                    self.cancelCommand)
+
         self.menu.addAction(self._copyAct)
         self.menu.addAction(self._pasteAct)
+        self.menu.addSeparator()
+        self.menu.addAction(self._backgroundAct)
+        self.menu.addAction(self._cancelAct)
 
         #self.menu.addAction(self.trUtf8('Copy'), self.copy)
         #self.menu.addAction(self.trUtf8('Paste'), self.paste)
@@ -349,9 +483,42 @@ class ConsoleWidget(QtGui.QPlainTextEdit):
     def execute(self, cmd, echo = True):
         self._history.push(cmd)
         self._buffer = None
-        self.controller().execute(cmd, echo)
+        if self._backgroundAct.isChecked() and not echo:
+            self.executeInBackground(cmd)
+        else:
+            self.controller().execute(cmd, echo)
+        self.flush()
+
+    def executeInBackground(self, cmd):
+        worker = self.controller().executeInBackground(cmd)
+        if worker:
+            self.connect(worker, QtCore.SIGNAL("progress(int, int)"),
+                         self.commandProgress)
+            self.connect(worker, QtCore.SIGNAL("finished()"),
+                         self.commandFinished)
+            self._cancelAct.setEnabled(True)
+            self.showStatus(self.tr("Running"))
+
+    def cancelCommand(self):
+        self.controller().cancel()
+
+    def commandProgress(self, done, total):
+        self.showStatus("Running: " + str(done) + "/" + str(total))
+
+    def commandFinished(self):
+        self._cancelAct.setEnabled(False)
+        self.showStatus(self.tr("Ready"))
+
+    def showStatus(self, message):
+        if self.window:
+            self.window.statusBar().showMessage(message)
+
+    def setOutputLog(self, logPath):
+        """Append output that does not fit in the console to logPath."""
+        self._output.setLogPath(logPath)
 
     def setSynchronous(self, synchronous, markPos = False):
+        self.flush()
         if markPos:
             self._asyncCursorPos = self.textCursor().position()
             #sys.stdout.stream.write(str(self._asyncCursorPos))
@@ -369,6 +536,25 @@ class ConsoleWidget(QtGui.QPlainTextEdit):
         return ref
         
     def write(self, txt):
+        """
+        Queue txt for output. Pending output is inserted at most every
+        flushInterval ms, returns True if it was inserted now.
+        """
+        self._output.append(txt)
+        if time.time() - self._lastFlush >= self.flushInterval / 1000.0:
+            self.flush()
+            return True
+        if not self._flushTimer.isActive():
+            self._flushTimer.start(self.flushInterval)
+        return False
+
+    def flush(self):
+        self._flushTimer.stop()
+        self._lastFlush = time.time()
+        if len(self._output) > 0:
+            self.insertOutput(self._output.take())
+
+    def insertOutput(self, txt):
         if self._synchronous:
             #cursor = self.textCursor()
             #cursor.setPosition(self._lastCursorPos)
@@ -385,10 +571,18 @@ class ConsoleWidget(QtGui.QPlainTextEdit):
         self.setLastCursorPos()
         self.ensureCursorVisible()
 
+    def writeBackground(self, txt):
+        """Output of a background command, inserted above the prompt."""
+        synchronous = self._synchronous
+        self.setSynchronous(False)
+        self.write(unicode(txt))
+        self.setSynchronous(synchronous)
+
     def writeErr(self, txt):
-        self.write(txt)
+        return self.write(txt)
 
     def readline(self):
+        self.flush()
         self._inReadline = True
         while True:
             #val = self.verticalScrollBar().value()
@@ -540,6 +734,8 @@ class ConsoleWidget(QtGui.QPlainTextEdit):
             event.accept()
             self.verticalScrollBar().triggerAction(QtGui.QAbstractSlider.SliderPageStepAdd)
 
+        elif key == QtCore.Qt.Key_Escape and self.controller().running:
+            self.cancelCommand()
         elif key == QtCore.Qt.Key_C and (modifier & QtCore.Qt.ControlModifier):
             self.copy()
             return
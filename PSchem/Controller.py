@@ -27,6 +27,7 @@ from Database.Attributes import *
 from Database.Layers import *
 from Database.Path import *
 from Database.Exceptions import *
+from Database.Perf import perf
 import traceback
 import sys
 import math
@@ -38,7 +39,72 @@ QtGui = Qt.QtGui
 
 #from PyQt4 import QtGui, QtCore
 
+class CommandCancelled(KeyboardInterrupt):
+    """Raised inside a background command when it gets cancelled."""
+    pass
+
+class CommandWorker(QtCore.QThread):
+    """
+    Runs a console command in its own thread, so that long scripts do
+    not block the window. Reading the database is allowed while the
+    views are being drawn, changes have to be posted with mutate() and
+    are applied by the GUI thread in batches. Modifying the database
+    directly raises ThreadError. Cancellation is cooperative: the
+    command is interrupted at its next function call.
+    """
+    def __init__(self, cmd, globals, locals):
+        QtCore.QThread.__init__(self)
+        self._cmd = cmd
+        self._globals = globals
+        self._locals = locals
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        self._cancelled = True
+
+    def trace(self, frame, event, arg):
+        if self._cancelled:
+            raise CommandCancelled()
+        return None #no line tracing
+
+    def progress(self, done, total):
+        self.emit(QtCore.SIGNAL("progress(int, int)"), done, total)
+
+    def run(self):
+        sys.settrace(self.trace)
+        try:
+            exec (self._cmd.compiled(), self._globals, self._locals)
+        except CommandCancelled:
+            print 'Cancelled: ' + self._cmd.text()
+        except Exception:
+            print traceback.format_exc()
+        finally:
+            sys.settrace(None)
+
+
+def mutate(func, *args, **kwargs):
+    """
+    Call func(*args, **kwargs) in the GUI thread, in a batch with other
+    posted calls. Returns a PendingCall, use its result() to wait.
+    """
+    call = database.callQueue.post(func, *args, **kwargs)
+    if QtCore.QThread.currentThread() == QtGui.qApp.thread():
+        database.callQueue.apply(0)
+    return call
+
+def progress(done, total):
+    """Report progress of the running background command."""
+    worker = QtCore.QThread.currentThread()
+    if isinstance(worker, CommandWorker):
+        worker.progress(done, total)
+
+
 class Controller():
+    callInterval = 20 #ms between batches of posted database calls
 
     def __init__(self, wnd):
         global window
@@ -52,9 +118,22 @@ class Controller():
         database = window.database
         self.locals = locals()
         self.globals = globals()
+        self._worker = None
+        self._callTimer = QtCore.QTimer()
+        QtCore.QObject.connect(self._callTimer, QtCore.SIGNAL("timeout()"),
+                               self.applyCalls)
+
+    @property
+    def running(self):
+        """True while a background command is running."""
+        return self._worker is not None
         
 
     def execute(self, cmd, echo = True):
+        """Run cmd in the GUI thread, refused while a command runs in the background."""
+        if self._worker:
+            print 'A command is running in the background, wait or cancel it'
+            return False
         if echo:
             sys.stdout.pushSync(False)
             sys.stdout.write('--- ' + cmd.text() + '\n')
@@ -76,4 +155,32 @@ class Controller():
             #if res is not None:
             #    sys.stdout.write('=== '+str(res))
             sys.stdout.popSync()
+        return True
 
+    def executeInBackground(self, cmd):
+        """Start cmd in a CommandWorker and return it."""
+        if self._worker:
+            print 'A command is already running'
+            return
+        worker = CommandWorker(cmd, self.globals, self.globals)
+        QtCore.QObject.connect(worker, QtCore.SIGNAL("finished()"),
+                               self.workerFinished)
+        self._worker = worker
+        self._callTimer.start(self.callInterval)
+        worker.start()
+        return worker
+
+    def cancel(self):
+        if self._worker:
+            self._worker.cancel()
+
+    def applyCalls(self):
+        database.callQueue.apply()
+
+    def workerFinished(self):
+        self._callTimer.stop()
+        if self._worker.cancelled:
+            database.callQueue.cancel()
+        else:
+            database.callQueue.apply(0)
+        self._worker = None
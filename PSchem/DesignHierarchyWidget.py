@@ -123,12 +123,10 @@ class DesignHierarchyModel(QtCore.QAbstractItemModel):
                 pparent = parent.parentDesignUnit
                 if pparent:
                     #sys.stderr.write('pparent' + pparent.cellView.cell.name + "\n")
-                    d = pparent.sortedChildDesignUnits
-                    n = d.index(parent)
+                    n = pparent.childRow(parent)
                     return self.createIndex(n, 0, parent)
                 else:
-                    d = list(self.designs.sortedDesigns)
-                    n = d.index(parent)
+                    n = self.designs.designRow(parent)
                     return self.createIndex(n, 0, parent)
         return QtCore.QModelIndex()
 
@@ -27,8 +27,9 @@ QtGui = Qt.QtGui
 
 from PSchem.GraphicsItems import *
 from PSchem.Modes import *
+from Database.Perf import timed
 from random import random
-#import math
+import math
 #import time
 
 class UndoViewStack(list):
@@ -99,6 +100,70 @@ class Cursor():
         rectCursor.translate(self._cursor)
         painter.drawRect(rectCursor)
 
+class GridTile():
+    """
+    Pre-rendered tile of the background grid.
+    The tile spans a whole number of major grid periods, so it repeats
+    seamlessly when used as a texture brush. It is re-rendered only when
+    the zoom factor, the grid size or the grid layer pens change.
+    """
+    minTileSize = 256 #pixels
+    maxPeriod = 512   #pixels, larger periods are cheaper to draw directly
+
+    def __init__(self):
+        self._key = None
+        self._brush = None
+
+    def invalidate(self):
+        self._key = None
+        self._brush = None
+
+    def brush(self, scale, gridSize, penMin, penMaj):
+        """
+        Return a texture brush painting the grid in scene coordinates,
+        or None if the grid is too sparse for a tile to pay off.
+        """
+        key = (scale, gridSize,
+               penMin.style(), penMin.color().rgba(),
+               penMaj.style(), penMaj.color().rgba())
+        if key != self._key:
+            self._key = key
+            self._brush = self.render(scale, gridSize, penMin, penMaj)
+        return self._brush
+
+    def render(self, scale, gridSize, penMin, penMaj):
+        #grid lines are drawn every second grid point, see DesignView.drawGrid
+        minorStep = 2.0 * gridSize
+        majorStep = 5.0 * minorStep
+        period = majorStep * scale
+        if period > self.maxPeriod:
+            return None
+        periods = max(1, int(math.ceil(self.minTileSize / period)))
+        tileScene = periods * majorStep
+        tileSize = max(1, int(round(tileScene * scale)))
+
+        pixmap = QtGui.QPixmap(tileSize, tileSize)
+        pixmap.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(pixmap)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
+        painter.scale(tileSize / tileScene, tileSize / tileScene)
+        if minorStep * scale > 10.0:
+            painter.setPen(penMin)
+            steps = periods * 5
+            painter.drawLines(
+                [QtCore.QLineF(n * minorStep, 0, n * minorStep, tileScene) for n in range(steps)] +
+                [QtCore.QLineF(0, n * minorStep, tileScene, n * minorStep) for n in range(steps)])
+        painter.setPen(penMaj)
+        painter.drawLines(
+            [QtCore.QLineF(n * majorStep, 0, n * majorStep, tileScene) for n in range(periods)] +
+            [QtCore.QLineF(0, n * majorStep, tileScene, n * majorStep) for n in range(periods)])
+        painter.end()
+
+        brush = QtGui.QBrush(pixmap)
+        #map tile pixels back to scene units, anchored at the scene origin
+        brush.setTransform(QtGui.QTransform().scale(tileScene / tileSize, tileScene / tileSize))
+        return brush
+
 class DesignView(QtGui.QGraphicsView):
     def __init__(self, window, scene):
         QtGui.QGraphicsView.__init__(self)
@@ -130,11 +195,16 @@ class DesignView(QtGui.QGraphicsView):
         #self.setDragMode(QtGui.QGraphicsView.RubberBandDrag)
 
         self._scene = scene
+        self._visibleAreaTimer = QtCore.QTimer()
+        self._visibleAreaTimer.setSingleShot(True)
+        self.connect(self._visibleAreaTimer, QtCore.SIGNAL("timeout()"), self.updateVisibleArea)
 
         self.setScene(self._scene)
 
         self._gridSize = 1.0
         self._gridCache = []
+        self._gridTile = GridTile()
+        self._gridLayers = None
         
         self._cursor = None
         self.modeStack = ModeStack(self)
@@ -158,7 +228,13 @@ class DesignView(QtGui.QGraphicsView):
 
     def setGridSize(self, gridSize):
         self._gridSize = gridSize
+        self.invalidateGrid()
         
+    @timed('DesignView.paintEvent')
+    def paintEvent(self, event):
+        QtGui.QGraphicsView.paintEvent(self, event)
+
+    @timed('DesignView.drawBackground')
     def drawBackground(self, painter, rect):
         brush = self.window.database.layers.layerByName('background', 'drawing').view.brush
         brush.setMatrix(painter.worldMatrix().inverted()[0])
@@ -200,11 +276,33 @@ class DesignView(QtGui.QGraphicsView):
             n += 1
         painter.drawLines(self._gridCache[0:n])
 
+    def gridLayers(self):
+        """
+        Grid layers, looked up once instead of on every repaint.
+        """
+        if not self._gridLayers:
+            layers = self.window.database.layers
+            self._gridLayers = (
+                layers.layerByName('gridminor', 'drawing'),
+                layers.layerByName('gridmajor', 'drawing'),
+                layers.layerByName('axes', 'drawing'))
+        return self._gridLayers
+
+    def invalidateGrid(self):
+        """
+        Drop the cached grid tile, e.g. after a grid layer color change.
+        """
+        self._gridLayers = None
+        self._gridTile.invalidate()
+        self.resetCachedContent()
+        self.viewport().update()
+
     def drawGrid(self, painter, rect):
         painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
-        penMin = self.window.database.layers.layerByName('gridminor', 'drawing').view.pen
-        penMaj = self.window.database.layers.layerByName('gridmajor', 'drawing').view.pen
-        penAxes = self.window.database.layers.layerByName('axes', 'drawing').view.pen
+        layerMin, layerMaj, layerAxes = self.gridLayers()
+        penMin = layerMin.view.pen
+        penMaj = layerMaj.view.pen
+        penAxes = layerAxes.view.pen
         #scaleWorldInv = 2.0/abs(painter.worldMatrix().m11())
         #penMaj.setWidthF(scaleWorldInv)
         #penMin.setWidthF(scaleWorldInv)
@@ -215,18 +313,42 @@ class DesignView(QtGui.QGraphicsView):
         gridSizeView = gridSize * scale
 
         if gridSizeView > 1.0: #major grid
-            if gridSizeView > 5.0: #minor grid
-                painter.setPen(penMin)
+            brush = self._gridTile.brush(scale, gridSize, penMin, penMaj)
+            if brush:
+                painter.fillRect(rect, brush)
+            else:
+                if gridSizeView > 5.0: #minor grid
+                    painter.setPen(penMin)
+                    self.drawGridInt(painter, rect, gridSize)
+                gridSize *= 5.0
+                painter.setPen(penMaj)
                 self.drawGridInt(painter, rect, gridSize)
-            gridSize *= 5.0
-            painter.setPen(penMaj)
-            self.drawGridInt(painter, rect, gridSize)
         #axes
         painter.setPen(penAxes)
         painter.drawLines(
             [QtCore.QLineF(0, rect.top(), 0, rect.bottom()), QtCore.QLineF(rect.left(), 0, rect.right(), 0)])
 
 
+    def visibleAreaChanged(self):
+        """
+        Schedule (coalesced) item creation for virtual scenes or
+        recentering of a progressive scene build.
+        """
+        if self.scene().virtual or self.scene().builder:
+            self._visibleAreaTimer.start(50)
+
+    def updateVisibleArea(self):
+        self.scene().updateVisibleArea(
+            self.mapToScene(self.viewport().rect()).boundingRect())
+
+    def scrollContentsBy(self, dx, dy):
+        QtGui.QGraphicsView.scrollContentsBy(self, dx, dy)
+        self.visibleAreaChanged()
+
+    def resizeEvent(self, event):
+        QtGui.QGraphicsView.resizeEvent(self, event)
+        self.visibleAreaChanged()
+
     def snapToGrid(self, point):
         gs = self._gridSize
         x = round(point.x() / gs) * gs
@@ -410,6 +532,7 @@ class DesignView(QtGui.QGraphicsView):
             self.checkSceneRect(newvr)
             self.scale(scaleFactor, scaleFactor)
             self.centerOn(cp)
+            self.visibleAreaChanged()
             
     def fitRect(self, rect):
         self.undoViewStack.pushView(self.matrix())
@@ -426,8 +549,10 @@ class DesignView(QtGui.QGraphicsView):
         self.setMatrix(m2)
         self.currentCenterPoint = rect.center()
         self.centerOn(self.currentCenterPoint)
+        self.visibleAreaChanged()
         
     def fit(self):
+        self.scene().resetSceneRect()
         rect = self.scene().sceneRect()
         w = rect.width()
         h = rect.height()
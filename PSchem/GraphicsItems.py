@@ -71,7 +71,57 @@ class BaseItem(QtGui.QGraphicsItem):
 
     def updateBoundingRect(self):
         return QtCore.QRectF()
+
+    def release(self):
+        """Detach the item and its children from the database model."""
+        for c in self.childItems():
+            if isinstance(c, BaseItem):
+                c.release()
+        if self.model:
+            self.model.uninstallUpdateHook(self)
         
+def labelTransform(label, metrics, w, m):
+    """
+    Transform of a label text drawn with its top left corner at
+    the origin, w wide. The text is flipped so that it reads upright
+    whatever the signs of m, the transform from the label's coordinates
+    to the diagram's, and shifted by the alignment offsets. The label
+    angle is not applied.
+    """
+    ascent = metrics.ascent()
+    descent = metrics.descent()
+    h = ascent - descent
+
+    if (label.vAlign == Label.AlignTop):
+        vOffs = descent
+    elif (label.vAlign == Label.AlignBottom):
+        vOffs = ascent
+    else:
+        vOffs = (ascent + descent) / 2.0
+
+    if (label.hAlign == Label.AlignLeft):
+        hOffs = 0
+    elif (label.hAlign == Label.AlignRight):
+        hOffs = -w
+    else:
+        hOffs = -w / 2.0
+
+    m11 = m.m11()
+    m12 = m.m12()
+    m21 = m.m21()
+    m22 = m.m22()
+    dx = 0
+    dy = 0
+    if m11 < 0 or m12 < 0:
+        dx = w
+    if m21 < 0 or m22 > 0:
+        dy = h
+
+    return QtGui.QTransform(
+        cmp(m11, 0)+cmp(m12, 0), 0,
+        0, -cmp(m22, 0)+cmp(m21, 0),
+        hOffs+dx, vOffs+dy)
+
 class TextItemInt(QtGui.QGraphicsSimpleTextItem):
     def __init__(self, parent):
         QtGui.QGraphicsSimpleTextItem.__init__(self, parent)
@@ -93,61 +143,11 @@ class TextItemInt(QtGui.QGraphicsSimpleTextItem):
         #    painter.drawRect(self.boundingRect())
 
     def updateMatrix(self):
-        #self.prepareGeometryChange()
-        sm = self.transform()
-        s11 = sm.m11()
-        s12 = sm.m12()
-        s21 = sm.m21()
-        s22 = sm.m22()
-        sdx = sm.dx()
-        sdy = sm.dy()
-        
-        m = self.sceneTransform()
-        m11 = m.m11()
-        m12 = m.m12()
-        m21 = m.m21()
-        m22 = m.m22()
-        mdx = m.dx()
-        mdy = m.dy()
-
-        #print m11, m12, m21, m22, s11, s12, s21, s22
         self._metrics = QtGui.QFontMetricsF(self.font())
-        ascent = self._metrics.ascent()
-        descent = self._metrics.descent()
-        h = ascent - descent
+        parent = self.parentItem()
         w = self.boundingRect().width()
-
-        label = self.parentItem().model
-        if (label.vAlign == Label.AlignTop):
-            vOffs = descent
-        elif (label.vAlign == Label.AlignBottom):
-            vOffs = ascent
-        else:
-            vOffs = (ascent + descent) / 2.0
-
-        if (label.hAlign == Label.AlignLeft):
-            hOffs = 0
-        elif (label.hAlign == Label.AlignRight):
-            hOffs = -w
-        else:
-            hOffs = -w / 2.0
-
-
-        dx = 0
-        dy = 0
-        if m11 < 0 or m12 < 0:
-            dx = w
-        if m21 < 0 or m22 > 0:
-            dy = h
-
-        transform = QtGui.QTransform(
-            s11*(cmp(m11, 0)+cmp(m12, 0)), 0,
-            0, s22*(-cmp(m22,0)+cmp(m21, 0)),
-            hOffs+dx, vOffs+dy)
-        #self.prepareGeometryChange()
-        #self.parentItem().prepareGeometryChange()
-        self.setTransform(transform)
-        #self.prepareGeometryChange()
+        self.setTransform(labelTransform(parent.model, self._metrics, w,
+                                         parent.sceneTransform()))
         
     #def boundingRect(self):
         #return QtCore.QRectF(self._metrics.boundingRect(
@@ -208,7 +208,7 @@ class TextItem(BaseItem):
         self.setTransform(matrix)
         #print self.model, self.model.layer, self.model.layer.zValue
        
-        self.setZValue(self.model.layer.zValue)
+        self.setZValue(self.model.zValue)
         self.updateBoundingRect()
         self.update(self.boundingRect())
 
@@ -294,7 +294,7 @@ class CustomPathItem(BaseItem):
             elif e[0] == CustomPath.close:
                 self.path.closeSubpath()
         #self.width = self.model.width()
-        self.setZValue(self.model.layer.zValue)
+        self.setZValue(self.model.zValue)
         #self.prepareGeometryChange()
         #self.setPath(p)
         self.updateBoundingRect()
@@ -352,7 +352,7 @@ class LineItem(BaseItem):
         uu = float(l.diagram.uu)
         self.lineShape = QtCore.QLineF(
             l.x1/uu, l.y1/uu, l.x2/uu, l.y2/uu)
-        self.setZValue(l.layer.zValue)
+        self.setZValue(l.zValue)
         #self._width = l.width
         #self.setLine(self.lineShape)
         self.updateBoundingRect()
@@ -418,7 +418,7 @@ class RectItem(BaseItem):
         uu = float(r.diagram.uu)
         self.rectShape = QtCore.QRectF(
             r.x/uu, r.y/uu, r.w/uu, r.h/uu)
-        self.setZValue(r.layer.zValue)
+        self.setZValue(r.zValue)
         #self._width = l.width()
         #self.setRect(self._boundingRectShape)
         #self.update(self.boundingRect())
@@ -478,7 +478,7 @@ class EllipseItem(BaseItem):
         e = self.model
         self.updateBoundingRect()
         #self.setRect(e.x/uu-cx/2.0, e.y/uu-cy/2.0, cx, cy)
-        self.setZValue(e.layer.zValue)
+        self.setZValue(e.zValue)
         self.update(self.boundingRect())
 
     def updateBoundingRect(self):
@@ -543,7 +543,7 @@ class EllipseArcItem(BaseItem):
         self.startAngle = -e.startAngle*16
         self.spanAngle = -e.spanAngle*16
         self.updateBoundingRect()
-        self.setZValue(e.layer.zValue)
+        self.setZValue(e.zValue)
         self.update(self.boundingRect())
 
     def updateBoundingRect(self): #needs tightening
@@ -578,7 +578,7 @@ class InstanceItem(BaseItem):
         self.uu = float(self.cellView.uu)
         self._boundingRect = QtCore.QRectF()
         self.selectShape = QtGui.QPainterPath()
-        #self.setZValue(self.model.layer.zValue)
+        self.setZValue(self.model.zValue) #same stacking as picking
         self.setHandlesChildEvents(True)
         self.model.itemAdded(self)
         self.cellView.instanceItemAdded(self)
@@ -593,6 +593,26 @@ class InstanceItem(BaseItem):
     #    #self._selectShape.addRect(self._boundingRect)
     #    return self._selectShape
 
+    def release(self):
+        BaseItem.release(self)
+        self.cellView.instanceItemRemoved(self)
+
+    def rebind(self):
+        """Rebuild the item if the instance now resolves to another cellView."""
+        cellView = self.model.instanceCellView
+        if cellView is self.cellView:
+            return
+        self.cellView.instanceItemRemoved(self)
+        for c in self.childItems():
+            if isinstance(c, BaseItem):
+                c.release()
+            if self.scene():
+                self.scene().removeItem(c)
+        self.cellView = cellView
+        self.uu = float(self.cellView.uu)
+        self.cellView.instanceItemAdded(self)
+        self.updateBoundingRect()
+
     def instanceRemoved(self):
         #self.model = None
         #self._cellView = None
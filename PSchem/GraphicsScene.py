@@ -25,12 +25,141 @@ QtGui = Qt.QtGui
 #from PyQt4 import QtCore, QtGui
 from PSchem.GraphicsItems import *
 from Database.Primitives import *
+from Database.Perf import perf, timed
+import time
+
+class SceneBuilder(QtCore.QObject):
+    """
+    Populates a scene with graphics items in small batches run from the
+    Qt event loop, so that the UI stays responsive while a large diagram
+    is being opened. Elements closest to the build center are inserted
+    first. Scene indexing is disabled until the build is finished.
+
+    Signals: progress(int, int) with the number of inserted and total
+    elements and finished() when the build completes or is cancelled.
+    """
+    chunkTime = 0.02 #seconds of work per event loop iteration
+    recenterDistance = 0.1 #fraction of the rect size the center has to move
+
+    def __init__(self, scene, elems):
+        QtCore.QObject.__init__(self)
+        self._scene = scene
+        self._pending = list(elems)
+        self._total = len(self._pending)
+        self._done = 0
+        self._cancelled = False
+        self._timer = QtCore.QTimer()
+        self._timer.setInterval(0)
+        self.connect(self._timer, QtCore.SIGNAL("timeout()"), self.buildChunk)
+        self._rect = self.elemsRect()
+        self._center = self._rect.center()
+        self.sortPending()
+
+    @property
+    def total(self):
+        return self._total
+
+    @property
+    def done(self):
+        return self._done
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    @property
+    def active(self):
+        return self._timer.isActive()
+
+    @property
+    def rect(self):
+        return self._rect
+
+    def elemPos(self, e):
+        """Approximate element position in scene coordinates."""
+        uu = self._scene.uu
+        if isinstance(e, CustomPath):
+            if e.path and len(e.path[0]) > 2:
+                return (e.path[0][-2]/uu, e.path[0][-1]/uu)
+            return (0.0, 0.0)
+        if hasattr(e, 'x2'):
+            return ((e.x + e.x2)/(2.0*uu), (e.y + e.y2)/(2.0*uu))
+        return (e.x/uu, e.y/uu)
+
+    def elemsRect(self):
+        """Scene rectangle estimated from element positions."""
+        if not self._pending:
+            return QtCore.QRectF()
+        xs, ys = zip(*[self.elemPos(e) for e in self._pending])
+        left, right, top, bottom = min(xs), max(xs), min(ys), max(ys)
+        return QtCore.QRectF(left, top, right-left, bottom-top)
+
+    def sortPending(self):
+        """Sort pending elements so that the nearest one is at the end."""
+        cx = self._center.x()
+        cy = self._center.y()
+        def dist(e):
+            x, y = self.elemPos(e)
+            return (x-cx)*(x-cx) + (y-cy)*(y-cy)
+        self._pending.sort(key=dist, reverse=True)
+
+    def setCenter(self, point):
+        """
+        Insert elements closest to the point first. Pending elements are
+        resorted only when the center moves noticeably.
+        """
+        size = max(self._rect.width(), self._rect.height())
+        if QtCore.QLineF(self._center, point).length() > self.recenterDistance * size:
+            self._center = QtCore.QPointF(point)
+            self.sortPending()
+
+    def start(self):
+        self._scene.setItemIndexMethod(QtGui.QGraphicsScene.NoIndex)
+        self._timer.start()
+
+    def buildChunk(self):
+        scene = self._scene
+        pending = self._pending
+        deadline = time.time() + self.chunkTime
+        while pending and time.time() < deadline:
+            e = pending.pop()
+            if e.diagram: #not removed meanwhile
+                scene.createItem(e)
+            self._done += 1
+        self.emit(QtCore.SIGNAL("progress(int, int)"), self._done, self._total)
+        if not pending:
+            self.finish()
+
+    def cancel(self):
+        if self.active:
+            self._cancelled = True
+            self._pending = []
+            self.finish()
+
+    def finish(self):
+        self._timer.stop()
+        scene = self._scene
+        scene.setItemIndexMethod(QtGui.QGraphicsScene.BspTreeIndex)
+        scene.builderFinished(self)
+        self.emit(QtCore.SIGNAL("finished()"))
+
 
 class GraphicsScene(QtGui.QGraphicsScene):
+    progressiveThreshold = 2000 #elements
+    virtualThreshold = 20000    #elements
+    visibleMargin = 0.5         #fraction of the visible area added on each side
+
     def __init__(self, design):
         QtGui.QGraphicsScene.__init__(self)
         self.design = design
         self.uu = float(design.cellView.uu)
+        self.builder = None
+        self.virtual = False
+        self._elemItems = {} #element -> item, virtual mode only
+        self._sceneRectTimer = QtCore.QTimer()
+        self._sceneRectTimer.setSingleShot(True)
+        self._sceneRectTimer.setInterval(0)
+        self.connect(self._sceneRectTimer, QtCore.SIGNAL("timeout()"), self.resetSceneRect)
 
         self.design.sceneAdded(self)
 
@@ -52,49 +181,173 @@ class GraphicsScene(QtGui.QGraphicsScene):
     def designRemoved(self):
         self._design = None
         
+    @timed('GraphicsScene.addElems')
+    def addElems(self, elems):
+        """
+        Add graphics items for database elements. Large diagrams are
+        populated progressively by a SceneBuilder. Huge diagrams switch
+        the scene to the virtual mode, where items are created only
+        around the visible area, see updateVisibleArea.
+        """
+        elems = list(elems)
+        if len(elems) >= self.virtualThreshold:
+            self.virtual = True
+            self.resetSceneRect()
+        elif len(elems) < self.progressiveThreshold:
+            for e in elems:
+                e.addToView(self)
+            self.resetSceneRect()
+        else:
+            self.builder = SceneBuilder(self, elems)
+            rect = self.builder.rect
+            w = rect.width()
+            h = rect.height()
+            self.setSceneRect(rect.adjusted(-0.1*w, -0.1*h, 0.1*w, 0.1*h))
+            self.builder.start()
+
+    def builderFinished(self, builder):
+        if builder is self.builder:
+            self.builder = None
+            if not self.virtual:
+                self.resetSceneRect()
+
+    def logicalRect(self):
+        """
+        Rectangle covering the whole design, including elements
+        without items in the virtual mode. Taken from the extents
+        maintained incrementally by the diagram's spatial index,
+        so it does not visit the items.
+        """
+        extents = self.design.cellView.extents
+        if not extents:
+            return QtCore.QRectF()
+        uu = self.uu
+        return QtCore.QRectF(extents[0]/uu, extents[1]/uu,
+                             (extents[2]-extents[0])/uu, (extents[3]-extents[1])/uu)
+
+    def resetSceneRect(self):
+        self.setSceneRect(self.logicalRect())
+
+    def extentsChanged(self):
+        """Refresh the scene rect once all pending edits are processed."""
+        if not self.builder and not self._sceneRectTimer.isActive():
+            self._sceneRectTimer.start()
+
+    @timed('GraphicsScene.createItem')
+    def createItem(self, e):
+        item = e.addToView(self)
+        if item:
+            perf.count('GraphicsScene.items')
+            if self.virtual:
+                self._elemItems[e] = item
+        return item
+
+    def releaseItem(self, e):
+        item = self._elemItems.pop(e)
+        item.release()
+        if item.scene() is self:
+            self.removeItem(item)
+
+    @timed('GraphicsScene.updateVisibleArea')
+    def updateVisibleArea(self, rect):
+        """
+        In the virtual mode create items for elements intersecting the
+        visible area plus a margin and release items of elements lying
+        far outside of it. Otherwise a progressive build continues from
+        the center of the visible area.
+        """
+        if not self.virtual:
+            self.setBuildCenter(rect.center())
+            return
+        self.cancelBuild()
+        index = self.design.cellView.spatialIndex
+        uu = self.uu
+        def box(margin):
+            mx = margin * rect.width()
+            my = margin * rect.height()
+            return ((rect.left()-mx)*uu, (rect.top()-my)*uu,
+                    (rect.right()+mx)*uu, (rect.bottom()+my)*uu)
+        wanted = index.intersecting(box(self.visibleMargin))
+        kept = index.intersecting(box(2*self.visibleMargin))
+        for e in [e for e in self._elemItems if e not in kept]:
+            self.releaseItem(e)
+        new = [e for e in wanted if e not in self._elemItems]
+        if len(new) < self.progressiveThreshold:
+            for e in new:
+                self.createItem(e)
+        else:
+            self.builder = SceneBuilder(self, new)
+            self.builder.setCenter(rect.center())
+            self.builder.start()
+
+    def setBuildCenter(self, point):
+        if self.builder:
+            self.builder.setCenter(point)
+
+    def cancelBuild(self):
+        if self.builder:
+            self.builder.cancel()
+
     def addElem(self, e):
         print 'Unknown element type', e
 
+    @timed('GraphicsScene.addLine')
     def addLine(self, l):
         #line = LineItem(QtCore.QLineF(l.x1/self.uu, l.y1/self.uu, l.x2/self.uu, l.y2/self.uu), None)
         line = LineItem(l)
         #line.setLineWidth(0.0)
         self.addItem(line)
+        return line
 
+    @timed('GraphicsScene.addRect')
     def addRect(self, r):
         #rect = QtGui.QGraphicsRectItem(QtCore.QRectF(r.x/self.uu, r.y/self.uu, r.w/self.uu, r.h/self.uu), None)
         rect = RectItem(r)
         #QtCore.QRectF(r.x()/self.uu, r.y()/self.uu, r.w()/self.uu, r.h()/self.uu), None)
         self.addItem(rect)
+        return rect
 
+    @timed('GraphicsScene.addEllipse')
     def addEllipse(self, e):
         ellipse = EllipseItem(e)
         self.addItem(ellipse)
+        return ellipse
 
+    @timed('GraphicsScene.addEllipseArc')
     def addEllipseArc(self, e):
         ellipseArc = EllipseArcItem(e)
         self.addItem(ellipseArc)
+        return ellipseArc
 
+    @timed('GraphicsScene.addCustomPath')
     def addCustomPath(self, p):
         path = CustomPathItem(p)
         self.addItem(path)
+        return path
 
+    @timed('GraphicsScene.addPin')
     def addPin(self, p):
         #line = LineItem(QtCore.QLineF(p.x1/self.uu, p.y1/self.uu, p.x2/self.uu, p.y2/self.uu), None)
         line = LineItem(p)
         #line.setLineWidth(0.0)
         self.addItem(line)
+        return line
 
+    @timed('GraphicsScene.addNetSegment')
     def addNetSegment(self, n):
         #line = LineItem(QtCore.QLineF(n.x1/self.uu, n.y1/self.uu, n.x2/self.uu, n.y2/self.uu), None)
         line = LineItem(n)
         #line.setLineWidth(0.0)
         self.addItem(line)
+        return line
 
+    @timed('GraphicsScene.addSolderDot')
     def addSolderDot(self, n):
         ellipse = EllipseItem(n)
         self.addItem(ellipse)
+        return ellipse
 
+    @timed('GraphicsScene.addLabel')
     def addLabel(self, l):
         ##return
         label = TextItem(l)
@@ -105,7 +358,9 @@ class GraphicsScene(QtGui.QGraphicsScene):
         #label.setAngle(l.angle())
         #label.setVisible(l.visible())
         self.addItem(label)
+        return label
 
+    @timed('GraphicsScene.addAttributeLabel')
     def addAttributeLabel(self, a):
         ##return
         attr = TextItem(a)
@@ -120,8 +375,10 @@ class GraphicsScene(QtGui.QGraphicsScene):
         #attr.setAngle(a.angle())
         #attr.setVisible(a.visible())
         self.addItem(attr)
+        return attr
 
 
+    @timed('GraphicsScene.addInstance')
     def addInstance(self, i):
         #instance = i.instance()
         instanceItem = InstanceItem(i)
@@ -132,10 +389,11 @@ class GraphicsScene(QtGui.QGraphicsScene):
         if i.hMirror:
             instanceItem.scale(-1, 1)
         self.addItem(instanceItem)
-        instanceItem.updateMatrix()
+        instanceItem.updateMatrix() #labels follow the final scene transform
+        return instanceItem
 
     def remove(self):
-        pass
+        self.cancelBuild()
         #for i in self.items:
         #    i.remove()
         #if self.design:
@@ -26,6 +26,7 @@ QtGui = Qt.QtGui
 from Database.Layers import *
 
 from random import random
+import weakref
 
 class LayerView():
     def __init__(self, layer):
@@ -169,7 +170,7 @@ class LayersView():
         self._layers = layers
         self._sortedLayerViews = None
         self._layerViews = set()
-        self._views = set()
+        self._views = weakref.WeakSet()
         layers.view = self
 
     @property
@@ -208,3 +209,180 @@ class LayersView():
         for v in self._views:
             v.update()
 
+
+def loadDefaultLayers(database, views=True):
+    """
+    Create the default layers of a database, with their views unless
+    views is False (no QApplication needed then, see addLayerViews).
+    """
+    layers = Layers(database)
+    if views:
+        LayersView(layers)
+
+
+    l = Layer()
+    l.name = 'background'
+    l.type = 'drawing'
+    l.linePattern = LinePattern(LinePattern.Solid, 0, 0)
+    l.fillPattern = FillPattern(FillPattern.Solid)
+    #l.fillPattern = FillPattern(FillPattern.DiagCross)
+    l.color = Color(Color.Black)
+    l.zValue = 0
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'gridminor'
+    l.type = 'drawing'
+    l.linePattern = LinePattern(LinePattern.Solid, 0, 0)
+    l.fillPattern = FillPattern(FillPattern.Solid)
+    l.color = Color([40, 40, 40])
+    l.zValue = 1
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'gridmajor'
+    l.type = 'drawing'
+    l.linePattern = LinePattern(LinePattern.Solid, 0, 0)
+    l.fillPattern = FillPattern(FillPattern.Solid)
+    l.color = Color([50, 50, 50])
+    l.zValue = 2
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'axes'
+    l.type = 'drawing'
+    l.linePattern = LinePattern(LinePattern.Solid, 0, 0)
+    l.fillPattern = FillPattern(FillPattern.Solid)
+    l.color = Color([60, 60, 60])
+    l.zValue = 3
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'net'
+    l.type = 'drawing'
+    p = LinePattern(LinePattern.Solid, 0.1, 1)
+    p.setEndStyle = LinePattern.RoundEnd
+    l.linePattern = p
+    l.fillPattern = FillPattern(FillPattern.Solid)
+    l.color = Color(Color.Cyan)
+    l.zValue = 100
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'bus'
+    l.type = 'drawing'
+    p = LinePattern(LinePattern.Solid, 0.5, 1)
+    p.setEndStyle = LinePattern.RoundEnd
+    l.linePattern = p
+    l.fillPattern = FillPattern(FillPattern.Solid)
+    l.color = Color(Color.Cyan)
+    l.zValue = 100
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'pin'
+    l.type = 'drawing'
+    p = LinePattern(LinePattern.Solid, 0.1, 1)
+    #p.setEndStyle = LinePattern.SquareEnd
+    p.setEndStyle = LinePattern.FlatEnd
+    l.linePattern = p
+    l.fillPattern = FillPattern(FillPattern.Solid)
+    l.color = Color(Color.Red)
+    l.zValue = 200
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'annotation' #no fill
+    l.type = 'drawing'
+    p = LinePattern(LinePattern.Solid, 0.1, 1)
+    p.setEndStyle = LinePattern.RoundEnd
+    l.linePattern = p
+    l.color = Color(Color.Green)
+    l.zValue = 50
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'annotation2'
+    l.type = 'drawing'
+    p = LinePattern(LinePattern.Solid, 0.1, 1)
+    p.setEndStyle = LinePattern.RoundEnd
+    l.linePattern = p
+    #l.fillPattern = FillPattern(FillPattern.Solid)
+    l.fillPattern = FillPattern(FillPattern.Dense4)
+    l.color = Color(Color.Green)
+    l.zValue = 55
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'attribute'
+    l.type = 'drawing'
+    p = LinePattern(LinePattern.Solid, 0.1, 1)
+    p.setEndStyle = LinePattern.RoundEnd
+    l.linePattern = p
+    l.fillPattern = FillPattern(FillPattern.Solid)
+    l.color = Color(Color.Yellow)
+    l.zValue = 400
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'instance'
+    l.type = 'drawing'
+    p = LinePattern(LinePattern.NoLine, 0, 0)
+    p.setEndStyle = LinePattern.RoundEnd
+    l.linePattern = p
+    l.color = Color(Color.White)
+    l.zValue = 1000
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'selection'
+    l.type = 'drawing'
+    p = LinePattern(LinePattern.Solid, 0, 1)
+    p.setEndStyle = LinePattern.RoundEnd
+    l.linePattern = p
+    #l.fillPattern = FillPattern(FillPattern.Solid)
+    l.color = Color(Color.Red)
+    l.zValue = 900000
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'preselection'
+    l.type = 'drawing'
+    p = LinePattern(LinePattern.Dash, 0, 1)
+    p.setEndStyle = LinePattern.FlatEnd
+    l.linePattern = p
+    #l.fillPattern = FillPattern(FillPattern.Solid)
+    l.color = Color(Color.Yellow)
+    l.zValue = 900010
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'lasso'
+    l.type = 'drawing'
+    p = LinePattern(LinePattern.Dash, 0, 1)
+    p.setEndStyle = LinePattern.FlatEnd
+    l.linePattern = p
+    #l.fillPattern = FillPattern(FillPattern.Solid)
+    l.color = Color(Color.White)
+    l.zValue = 900020
+    layers.addLayer(l)
+
+    l = Layer()
+    l.name = 'cursor'
+    l.type = 'drawing'
+    p = LinePattern(LinePattern.Solid, 0, 1)
+    l.linePattern = p
+    #l.fillPattern = FillPattern(FillPattern.Solid)
+    l.color = Color(Color.Yellow)
+    l.zValue = 1000000
+    layers.addLayer(l)
+
+    database.layers = layers
+    return layers
+
+def addLayerViews(layers):
+    """Create views of layers loaded without them."""
+    layersView = LayersView(layers)
+    for layer in layers.layers:
+        layersView.addLayer(layer)
+    return layersView
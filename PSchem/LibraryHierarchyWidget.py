@@ -35,16 +35,122 @@ class LibraryHierarchyModel(QtCore.QAbstractItemModel):
         #self.modelThread.start()
         #self.moveToThread(self.modelThread)
         self.libraries = libraries
+        self._children = {}  #node -> list of children as seen by the views
+        self._childRows = {} #node -> {child: row}
         libraries.libraryViewAdded(self)
         #print 'model ', self.thread()
 
     def prepareForUpdate(self):
         self.emit(QtCore.SIGNAL("layoutAboutToBeChanged()"))
 
-    def update(self):
-        self.emit(QtCore.SIGNAL("layoutChanged()"))
-        #self.reset()
-        #self.dataChanged(QtCore.QModelIndex(), QtCore.QModelIndex())
+    def update(self, changedNodes=None, changedData=()):
+        """
+        Bring the views in sync with the database. Child lists of
+        changed nodes are diffed against what the views have seen and
+        reported as row removals/insertions of the affected parent only.
+        """
+        if changedNodes is None:
+            self._children = {}
+            self._childRows = {}
+            self.reset()
+            return
+        for node in changedNodes:
+            if node in self._children:
+                self.updateChildren(node)
+        for node in changedData:
+            index = self.nodeIndex(node)
+            if index is not None and index.isValid():
+                self.emit(QtCore.SIGNAL("dataChanged(QModelIndex, QModelIndex)"),
+                          index, index.sibling(index.row(), 1))
+
+    def updateChildren(self, node):
+        shown = self._children[node]
+        new = self.sortedChildren(node)
+        parent = self.nodeIndex(node)
+        if parent is None:
+            return
+        newSet = set(new)
+        removed = [n for (n, c) in enumerate(shown) if not c in newSet]
+        for (first, last) in reversed(self.ranges(removed)):
+            self.beginRemoveRows(parent, first, last)
+            for c in shown[first:last+1]:
+                self.forget(c)
+            del shown[first:last+1]
+            self._childRows.pop(node, None)
+            self.endRemoveRows()
+        shownSet = set(shown)
+        if [c for c in new if c in shownSet] != shown:
+            #order of the remaining children has changed, start over
+            self.update()
+            return
+        inserted = [n for (n, c) in enumerate(new) if not c in shownSet]
+        for (first, last) in self.ranges(inserted):
+            self.beginInsertRows(parent, first, last)
+            shown[first:first] = new[first:last+1]
+            self._childRows.pop(node, None)
+            self.endInsertRows()
+
+    @staticmethod
+    def ranges(rows):
+        """Group sorted row numbers into (first, last) ranges."""
+        ranges = []
+        for r in rows:
+            if ranges and ranges[-1][1] == r - 1:
+                ranges[-1] = (ranges[-1][0], r)
+            else:
+                ranges.append((r, r))
+        return ranges
+
+    def forget(self, node):
+        """Drop the cached children of a removed node and its descendants."""
+        for c in self._children.pop(node, ()):
+            self.forget(c)
+        self._childRows.pop(node, None)
+
+    def sortedChildren(self, node):
+        if isinstance(node, Libraries):
+            return node.sortedLibraries
+        elif isinstance(node, Library):
+            return node.sortedChildren
+        elif isinstance(node, Cell):
+            return node.sortedCellViews
+        return []
+
+    def children(self, node):
+        """Children of a node as currently presented to the views."""
+        children = self._children.get(node)
+        if children is None:
+            children = list(self.sortedChildren(node))
+            self._children[node] = children
+        return children
+
+    def childRow(self, node, child):
+        rows = self._childRows.get(node)
+        if rows is None:
+            rows = dict((c, n) for (n, c) in enumerate(self.children(node)))
+            self._childRows[node] = rows
+        return rows.get(child)
+
+    def parentNode(self, node):
+        if isinstance(node, Library):
+            return node.parentLibrary or self.libraries
+        elif isinstance(node, Cell):
+            return node.library
+        elif isinstance(node, CellView):
+            return node.cell
+        return None
+
+    def nodeIndex(self, node):
+        """Model index of a node, None if the views have not seen it."""
+        if isinstance(node, Libraries):
+            return QtCore.QModelIndex()
+        parent = self.parentNode(node)
+        if parent is None or not parent in self._children:
+            return None
+        row = self.childRow(parent, node)
+        if row is None:
+            return None
+        return self.createIndex(row, 0, node)
 
     def data(self, index, role):
         if not index.isValid():
@@ -101,12 +207,11 @@ class LibraryHierarchyModel(QtCore.QAbstractItemModel):
         if parent.isValid():
             data = parent.internalPointer()
 
-        if not parent.isValid() or isinstance(data, Libraries):
-            children = self.libraries.sortedLibraries
-        elif isinstance(data, Library):
-            children = data.sortedLibraries + data.sortedCells
-        elif isinstance(data, Cell):
-            children = data.sortedCellViews
+        if not parent.isValid():
+            data = self.libraries
+        if isinstance(data, Libraries) or isinstance(data, Library) or \
+            isinstance(data, Cell):
+            children = self.children(data)
         else:
             return QtCore.QModelIndex()
 
@@ -120,44 +225,21 @@ class LibraryHierarchyModel(QtCore.QAbstractItemModel):
             return QtCore.QModelIndex()
 
         data = index.internalPointer()
-        if isinstance(data, Libraries):
-            return QtCore.QModelIndex()
-        elif isinstance(data, Library):
-            parentLibrary = data.parentLibrary
-            if parentLibrary:
-                pParentLibrary = parentLibrary.parentLibrary
-                if pParentLibrary:
-                    d = pParentLibrary.sortedLibraries + pParentLibrary.sortedCells
-                else:
-                    d = self.libraries.sortedLibraries
-                n = d.index(parentLibrary)
-                return self.createIndex(n, 0, parentLibrary)
+        parent = self.parentNode(data)
+        if parent is None or isinstance(parent, Libraries):
             return QtCore.QModelIndex()
-        elif isinstance(data, Cell):
-            parentLibrary = data.library.parentLibrary
-            if parentLibrary:
-                d = parentLibrary.sortedLibraries + parentLibrary.sortedCells
-            else:
-                d = self.libraries.sortedLibraries
-            n = d.index(data.library)
-            return self.createIndex(n, 0, data.library)
-        elif isinstance(data, CellView):
-            d = data.library.sortedCells
-            n = d.index(data.cell)
-            return self.createIndex(n, 0, data.cell)
-        else:
+        index = self.nodeIndex(parent)
+        if index is None:
             return QtCore.QModelIndex()
+        return index
 
     def hasChildren(self, parent):
         if not parent.isValid():
             return True
         data = parent.internalPointer()
-        if isinstance(data, Libraries):
-            return len(data.sortedLibraries) > 0
-        elif isinstance(data, Library):
-            return len(data.sortedLibraries) + len(data.sortedCells) > 0
-        elif isinstance(data, Cell):
-            return len(data.sortedCellViews) > 0
+        if isinstance(data, Libraries) or isinstance(data, Library) or \
+            isinstance(data, Cell):
+            return len(self.children(data)) > 0
         else:
             return False
 
@@ -166,15 +248,12 @@ class LibraryHierarchyModel(QtCore.QAbstractItemModel):
             return 0
 
         if not parent.isValid():
-            return len(self.libraries.sortedLibraries)
+            return len(self.children(self.libraries))
 
         data = parent.internalPointer()
-        if isinstance(data, Libraries):
-            return len(data.sortedLibraries)
-        elif isinstance(data, Library):
-            return len(data.sortedLibraries) + len(data.sortedCells)
-        elif isinstance(data, Cell):
-            return len(data.sortedCellViews)
+        if isinstance(data, Libraries) or isinstance(data, Library) or \
+            isinstance(data, Cell):
+            return len(self.children(data))
         else:
             return 0
 
@@ -212,20 +291,104 @@ class LibraryHierarchyModel(QtCore.QAbstractItemModel):
         return None
         #return QtCore.QVariant()
 
+class LibraryFilterProxyModel(QtGui.QSortFilterProxyModel):
+    """
+    Shows libraries and cells whose names contain the filter text,
+    together with their parent libraries and their contents.
+    The matching set comes directly from Libraries.nameIndex,
+    so accepting a row costs O(depth) rather than a name test.
+    """
+    def __init__(self, libraries, parent=None):
+        QtGui.QSortFilterProxyModel.__init__(self, parent)
+        self.libraries = libraries
+        self.fuzzy = False
+        self._text = ''
+        self._matches = set()
+        self._ancestors = set()
+
+    @property
+    def matches(self):
+        return self._matches
+
+    def setFilterText(self, text):
+        self._text = text
+        self._matches = set()
+        self._ancestors = set()
+        if text:
+            self._matches = set(self.libraries.nameIndex.search(text, self.fuzzy))
+            for m in self._matches:
+                l = self.parentLibrary(m)
+                while l and not l in self._ancestors:
+                    self._ancestors.add(l)
+                    l = l.parentLibrary
+        self.invalidateFilter()
+
+    def parentLibrary(self, node):
+        if isinstance(node, Cell):
+            return node.library
+        return node.parentLibrary
+
+    def accepted(self, node):
+        if not self._text:
+            return True
+        if isinstance(node, CellView):
+            node = node.cell
+        if node in self._matches or node in self._ancestors:
+            return True
+        l = self.parentLibrary(node)
+        while l:
+            if l in self._matches:
+                return True
+            l = l.parentLibrary
+        return False
+
+    def filterAcceptsRow(self, row, parent):
+        source_idx = self.sourceModel().index(row, 0, parent)
+        if not source_idx.isValid():
+            return True
+        return self.accepted(source_idx.internalPointer())
+
 class LibraryHierarchyWidget(QtGui.QWidget):
+    filterDelay = 200 #ms
+    expandLimit = 200 #matches
+
     def __init__(self, window, model):
         QtGui.QWidget.__init__(self, window)
         self.window = window
         self.model = model
+        self.proxyModel = LibraryFilterProxyModel(model.libraries, self)
+        self.proxyModel.setSourceModel(model)
         
         self.treeView = QtGui.QTreeView()
         self.treeView.setUniformRowHeights(True)
         self.treeView.setAlternatingRowColors(True)
 
+        self.filterText = QtGui.QLineEdit()
+        self.fuzzyCheckBox = QtGui.QCheckBox(self.tr('Fuzzy'))
+        self._filterTimer = QtCore.QTimer(self)
+        self._filterTimer.setSingleShot(True)
+        self._filterTimer.setInterval(self.filterDelay)
+
+        layout2 = QtGui.QHBoxLayout()
+        layout2.addWidget(QtGui.QLabel(self.tr('Filter')))
+        layout2.addWidget(self.filterText)
+        layout2.addWidget(self.fuzzyCheckBox)
+
         layout = QtGui.QVBoxLayout()
+        layout.addLayout(layout2)
         layout.addWidget(self.treeView)
 
-        self.treeView.setModel(model)
+        self.treeView.setModel(self.proxyModel)
+
+        self.connect(self.filterText,
+                     QtCore.SIGNAL("textChanged(QString)"),
+                     lambda text: self._filterTimer.start())
+        self.connect(self.fuzzyCheckBox,
+                     QtCore.SIGNAL("toggled(bool)"),
+                     self.updateFilter)
+        self.connect(self._filterTimer,
+                     QtCore.SIGNAL("timeout()"),
+                     self.updateFilter)
 
         self.connect(self.treeView,
                      #QtCore.SIGNAL("doubleClicked(QModelIndex)"),
@@ -234,11 +397,18 @@ class LibraryHierarchyWidget(QtGui.QWidget):
 
         self.setLayout(layout)
 
+    def updateFilter(self):
+        self.proxyModel.fuzzy = self.fuzzyCheckBox.isChecked()
+        self.proxyModel.setFilterText(unicode(self.filterText.text()))
+        if self.proxyModel.matches and \
+            len(self.proxyModel.matches) <= self.expandLimit:
+            self.treeView.expandAll()
+
     def openCellView(self, index):
         if not index.isValid():
             return
 
-        data = index.internalPointer()
+        data = self.proxyModel.mapToSource(index).internalPointer()
 
         if isinstance(data, CellView):
             self.window.controller.execute(
@@ -29,8 +29,11 @@ QtGui = Qt.QtGui
 from PSchem.ToolOptions import *
 from PSchem.Lasso import *
 from PSchem.Selection import *
+from Database.Picker import Picker
 
 class SelectMode():
+    pickTolerance = 4 #pixels
+
     def __init__(self, view, transient=False):
         self._view = view
         self._optionPanel = None
@@ -47,6 +50,7 @@ class SelectMode():
         self._preSelected = None
         self._modifiers = None
         self._pos = None
+        self._picker = None
         self._timer = QtCore.QTimer()
         self._timer.setSingleShot(True)
         self._timer.setInterval(50)
@@ -61,6 +65,7 @@ class SelectMode():
     def exitMode(self):
         if self._preSelected:
             self._preSelected.preSelected = False
+        self._selection.clear() #deselect items of this mode
         self.removeLasso()
         self.uninstallActions()
 
@@ -85,8 +90,9 @@ class SelectMode():
         return self._mousePressedPos
     
     def addLasso(self, pos):
+        scene = self._view.scene()
         self._lasso = Lasso(self._view, pos)
-        self._view.scene().addItem(self._lasso)
+        scene.addItem(self._lasso)
         
     def stretchLasso(self, pos):
         if not self._lasso:
@@ -100,19 +106,57 @@ class SelectMode():
         if self._lasso:
             scene = self._view.scene()
             scene.removeItem(self._lasso)
-            scene.setSceneRect(scene.itemsBoundingRect())
+            scene.resetSceneRect()
             self._lasso = None
 
+    def picker(self):
+        """Picker of the viewed diagram, tolerance adjusted to the zoom level."""
+        scene = self._view.scene()
+        diagram = scene.design.cellView
+        if not self._picker or self._picker.diagram is not diagram:
+            self._picker = Picker(diagram)
+        scale = self._view.transform().m11()
+        self._picker.setTolerance(self.pickTolerance / scale * scene.uu)
+        return self._picker
+
+    def itemsOf(self, elems):
+        """Top-level items of the elements in the viewed scene."""
+        scene = self._view.scene()
+        items = []
+        for e in elems:
+            for v in e.views:
+                if v.scene() is scene and not v.parentItem():
+                    items.append(v)
+        return items
+
+    def findItemsInRect(self, rect, contained=True):
+        """
+        Top-level items within (or intersecting) a scene rectangle.
+        Candidates come from the spatial index, containment is then
+        checked on the item shapes.
+        """
+        uu = self._view.scene().uu
+        box = (rect.left()*uu, rect.top()*uu, rect.right()*uu, rect.bottom()*uu)
+        items = self.itemsOf(self.picker().intersecting(box))
+        if contained:
+            return [i for i in items if self.shapeWithin(i, rect)]
+        return items
+
+    def shapeWithin(self, item, rect):
+        """Like Qt.ContainsItemShape, but hidden children do not count."""
+        children = [c for c in item.childItems() if c.isVisible()]
+        if children:
+            return all(self.shapeWithin(c, rect) for c in children)
+        return rect.contains(item.mapToScene(item.shape()).boundingRect())
+
     def findItems(self, pos, modifiers=None):
-        items = self._view.scene().items(pos)
-        items = filter(lambda i: not(i.parentItem()), items)
-        items = filter(lambda i: not(isinstance(i, Lasso)), items)
-        #items = map(lambda i: i.model, items)
-        items = set(items)
+        """Top-level items at pos (grid snapped), topmost first."""
+        uu = self._view.scene().uu
+        items = self.itemsOf(self.picker().pick(pos.x()*uu, pos.y()*uu))
         if self.addMode(modifiers):
-            return ItemBuffer(items - self._selection, pos)
+            return ItemBuffer([i for i in items if not i in self._selection], pos)
         elif self.subtractMode(modifiers):
-            return ItemBuffer(items & self._selection, pos)
+            return ItemBuffer([i for i in items if i in self._selection], pos)
         else:
             itemsBuf = ItemBuffer(items, pos)
             itemsBuf.setPointerToUnique(self._selection)
@@ -144,15 +188,13 @@ class SelectMode():
         if pos and event.button() == QtCore.Qt.LeftButton:
             #print "released", pos
             if self.lassoRect():
-                items = self._view.scene().items(self.lassoRect(), QtCore.Qt.ContainsItemShape)
-                items = filter(lambda i: not(i.parentItem()), items)
-                #items = map(lambda i: i.model, items)
+                items = self.findItemsInRect(self.lassoRect())
                 if self.addMode(event.modifiers()):
                     self._selection |= items
                 elif self.subtractMode(event.modifiers()):
                     self._selection -= items
                 else:
-                    self._selection = Selection(items)
+                    self._selection.replace(items)
                 self._toBeSelected = None
                 self.removeLasso()
                 self.updatePreSelected()
@@ -160,14 +202,14 @@ class SelectMode():
                 if not self._toBeSelected or self._toBeSelected.pos() != pos:
                     self._toBeSelected = self.findItems(pos, event.modifiers())
                 item = self.currentItem()
-                if not self.addMode(event.modifiers()) and not self.subtractMode(event.modifiers()):
-                    self._selection = None
-                    self._selection = Selection()
-                if item:
-                    if self.subtractMode(event.modifiers()):
-                        self._selection.remove(item)
-                    else:
+                if self.subtractMode(event.modifiers()):
+                    if item:
+                        self._selection.discard(item)
+                elif self.addMode(event.modifiers()):
+                    if item:
                         self._selection.add(item)
+                else:
+                    self._selection.replace(item and [item] or [])
                 self.nextItem()
                 item = self.currentItem()
                 self.updatePreSelected()
@@ -38,6 +38,7 @@ from PSchem.LayerView import *
 from PSchem.Resources_rc import *
 from Database import Database
 from Database import Cells, Reader
+from Database.Perf import perf
 import os
 
 class SubWindow(QtGui.QMdiSubWindow):
@@ -46,9 +47,12 @@ class SubWindow(QtGui.QMdiSubWindow):
         self.mainWindow = window
 
     def closeEvent(self, event):
+        self.widget().scene().cancelBuild()
         self.mainWindow.updateMdi()
         
 class PWindow(QtGui.QMainWindow):
+    deferredProcessingBudget = 0.05 #seconds per event loop iteration
+
     def __init__(self):
         QtGui.QMainWindow.__init__(self)
         self.docks = set()
@@ -57,6 +61,7 @@ class PWindow(QtGui.QMainWindow):
         self._currentView = None
 
         self._databaseTimer = None
+        self._perfTimer = None
         self.database = Database.createDatabase(self)
 
         #print os.path.join(os.getcwd(), 'pschem.ini')
@@ -135,167 +140,8 @@ class PWindow(QtGui.QMainWindow):
         self.addDockWidget(QtCore.Qt.LeftDockWidgetArea, self.dockH)
 
     def loadLayers(self):
-        self.layers = Layers(self.database)
-        self.layersView = LayersView(self.layers)
-
-        l = Layer()
-        l.name = 'background'
-        l.type = 'drawing'
-        l.linePattern = LinePattern(LinePattern.Solid, 0, 0)
-        l.fillPattern = FillPattern(FillPattern.Solid)
-        #l.fillPattern = FillPattern(FillPattern.DiagCross)
-        l.color = Color(Color.Black)
-        l.zValue = 0
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'gridminor'
-        l.type = 'drawing'
-        l.linePattern = LinePattern(LinePattern.Solid, 0, 0)
-        l.fillPattern = FillPattern(FillPattern.Solid)
-        l.color = Color([40, 40, 40])
-        l.zValue = 1
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'gridmajor'
-        l.type = 'drawing'
-        l.linePattern = LinePattern(LinePattern.Solid, 0, 0)
-        l.fillPattern = FillPattern(FillPattern.Solid)
-        l.color = Color([50, 50, 50])
-        l.zValue = 2
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'axes'
-        l.type = 'drawing'
-        l.linePattern = LinePattern(LinePattern.Solid, 0, 0)
-        l.fillPattern = FillPattern(FillPattern.Solid)
-        l.color = Color([60, 60, 60])
-        l.zValue = 3
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'net'
-        l.type = 'drawing'
-        p = LinePattern(LinePattern.Solid, 0.1, 1)
-        p.setEndStyle = LinePattern.RoundEnd
-        l.linePattern = p
-        l.fillPattern = FillPattern(FillPattern.Solid)
-        l.color = Color(Color.Cyan)
-        l.zValue = 100
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'bus'
-        l.type = 'drawing'
-        p = LinePattern(LinePattern.Solid, 0.5, 1)
-        p.setEndStyle = LinePattern.RoundEnd
-        l.linePattern = p
-        l.fillPattern = FillPattern(FillPattern.Solid)
-        l.color = Color(Color.Cyan)
-        l.zValue = 100
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'pin'
-        l.type = 'drawing'
-        p = LinePattern(LinePattern.Solid, 0.1, 1)
-        #p.setEndStyle = LinePattern.SquareEnd
-        p.setEndStyle = LinePattern.FlatEnd
-        l.linePattern = p
-        l.fillPattern = FillPattern(FillPattern.Solid)
-        l.color = Color(Color.Red)
-        l.zValue = 200
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'annotation' #no fill
-        l.type = 'drawing'
-        p = LinePattern(LinePattern.Solid, 0.1, 1)
-        p.setEndStyle = LinePattern.RoundEnd
-        l.linePattern = p
-        l.color = Color(Color.Green)
-        l.zValue = 50
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'annotation2'
-        l.type = 'drawing'
-        p = LinePattern(LinePattern.Solid, 0.1, 1)
-        p.setEndStyle = LinePattern.RoundEnd
-        l.linePattern = p
-        #l.fillPattern = FillPattern(FillPattern.Solid)
-        l.fillPattern = FillPattern(FillPattern.Dense4)
-        l.color = Color(Color.Green)
-        l.zValue = 55
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'attribute'
-        l.type = 'drawing'
-        p = LinePattern(LinePattern.Solid, 0.1, 1)
-        p.setEndStyle = LinePattern.RoundEnd
-        l.linePattern = p
-        l.fillPattern = FillPattern(FillPattern.Solid)
-        l.color = Color(Color.Yellow)
-        l.zValue = 400
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'instance'
-        l.type = 'drawing'
-        p = LinePattern(LinePattern.NoLine, 0, 0)
-        p.setEndStyle = LinePattern.RoundEnd
-        l.linePattern = p
-        l.color = Color(Color.White)
-        l.zValue = 1000
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'selection'
-        l.type = 'drawing'
-        p = LinePattern(LinePattern.Solid, 0, 1)
-        p.setEndStyle = LinePattern.RoundEnd
-        l.linePattern = p
-        #l.fillPattern = FillPattern(FillPattern.Solid)
-        l.color = Color(Color.Red)
-        l.zValue = 900000
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'preselection'
-        l.type = 'drawing'
-        p = LinePattern(LinePattern.Dash, 0, 1)
-        p.setEndStyle = LinePattern.FlatEnd
-        l.linePattern = p
-        #l.fillPattern = FillPattern(FillPattern.Solid)
-        l.color = Color(Color.Yellow)
-        l.zValue = 900010
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'lasso'
-        l.type = 'drawing'
-        p = LinePattern(LinePattern.Dash, 0, 1)
-        p.setEndStyle = LinePattern.FlatEnd
-        l.linePattern = p
-        #l.fillPattern = FillPattern(FillPattern.Solid)
-        l.color = Color(Color.White)
-        l.zValue = 900020
-        self.layers.addLayer(l)
-
-        l = Layer()
-        l.name = 'cursor'
-        l.type = 'drawing'
-        p = LinePattern(LinePattern.Solid, 0, 1)
-        l.linePattern = p
-        #l.fillPattern = FillPattern(FillPattern.Solid)
-        l.color = Color(Color.Yellow)
-        l.zValue = 1000000
-        self.layers.addLayer(l)
-
-        self.database.layers = self.layers
+        self.layers = loadDefaultLayers(self.database)
+        self.layersView = self.layers.view
 
     def createLayerWidget(self):
         self.loadLayers()
@@ -401,6 +247,22 @@ class PWindow(QtGui.QMainWindow):
                     lambda: self.controller.execute(self.openCellViewCmd))
 
 
+        self.undoAct = QtGui.QAction(self.tr("&Undo"), self)
+        self.undoAct.setShortcut(self.tr("Ctrl+Z"))
+        self.undoAct.setStatusTip(self.tr("Undo the last database edit"))
+        self.undoCmd = Command("database.undo()")
+        self.connect(self.undoAct, QtCore.SIGNAL("triggered()"),
+                    lambda: self.controller.execute(self.undoCmd))
+
+
+        self.redoAct = QtGui.QAction(self.tr("&Redo"), self)
+        self.redoAct.setShortcut(self.tr("Ctrl+Y"))
+        self.redoAct.setStatusTip(self.tr("Redo the last undone database edit"))
+        self.redoCmd = Command("database.redo()")
+        self.connect(self.redoAct, QtCore.SIGNAL("triggered()"),
+                    lambda: self.controller.execute(self.redoCmd))
+
+
         self.exitAct = QtGui.QAction(self.tr("E&xit"), self)
         self.exitAct.setShortcut(self.tr("Ctrl+Q"))
         self.exitAct.setStatusTip(self.tr("Exit the application"))
@@ -417,6 +279,13 @@ class PWindow(QtGui.QMainWindow):
                     lambda: self.controller.execute(self.toggleDocksCmd))
 
 
+        self.perfAct = QtGui.QAction(self.tr("Profile"), self)
+        self.perfAct.setCheckable(True)
+        self.perfAct.setStatusTip(self.tr("Collect timers and counters, see 'perf' in the console"))
+        self.perfCmd = Command("window.togglePerf()")
+        self.connect(self.perfAct, QtCore.SIGNAL("triggered()"),
+                    lambda: self.controller.execute(self.perfCmd))
+
         self.aboutAct = QtGui.QAction(self.tr("&About"), self)
         self.aboutAct.setStatusTip(self.tr("Show the application's About box"))
         #self.aboutCmd = Command("About.about()")
@@ -623,7 +492,10 @@ class PWindow(QtGui.QMainWindow):
 
         self.databaseMenu.addAction(self.openCellViewAct)
         self.databaseMenu.addAction(self.newSchematicAct)
+        self.databaseMenu.addAction(self.undoAct)
+        self.databaseMenu.addAction(self.redoAct)
         self.databaseMenu.addAction(self.toggleDocksAct)
+        self.databaseMenu.addAction(self.perfAct)
         self.databaseMenu.addAction(self.zoomInAct)
         self.databaseMenu.addAction(self.zoomPrevAct)
         self.databaseMenu.addAction(self.moveAct)
@@ -895,6 +767,11 @@ class PWindow(QtGui.QMainWindow):
             if not design:
                 design = Design(cellView, self.database.designs)
             scene = GraphicsScene(design)
+            if scene.builder:
+                self.connect(scene.builder, QtCore.SIGNAL("progress(int, int)"),
+                             self.sceneBuildProgress)
+                self.connect(scene.builder, QtCore.SIGNAL("finished()"),
+                             lambda: self.statusBar().showMessage(self.tr("Ready")))
             #self.database.addDesign(design)
             dView = DesignView(self, scene)
             subWin = SubWindow(self)
@@ -912,6 +789,10 @@ class PWindow(QtGui.QMainWindow):
             #subWin.show()
             #self.setCurrentView(dView)
 
+    def sceneBuildProgress(self, done, total):
+        self.statusBar().showMessage(
+            "Loading: " + str(done) + "/" + str(total) + " elements")
+
     def openCellViewByName(self, libPath, cellName, viewName):
         cellView = self.database.cellViewByName(libPath, cellName, viewName)
         print self.__class__.__name__, cellView
@@ -925,11 +806,17 @@ class PWindow(QtGui.QMainWindow):
 
     def openDesignUnitByPathName(self, pathName):
         (cellViewPathName, sep, instancePathName) = pathName.partition(':')
-        cellViewPath = Path.createFromPathName(cellViewPathName)
-        cellView = self.database.libraries.objectByPath(cellViewPath)
-        design = self.database.designs.designUnitByPath(cellViewPathName)
-        print self.__class__.__name__, cellView, design
-        self.openCellView(cellView, design)
+        designs = self.database.designs
+        designUnit = designs.designUnitByPath(pathName)
+        if not designUnit and not designs.designUnitByPath(cellViewPathName):
+            cellViewPath = Path.createFromPathName(cellViewPathName)
+            cellView = self.database.libraries.objectByPath(cellViewPath)
+            if cellView:
+                Design(cellView, designs)
+                designUnit = designs.designUnitByPath(pathName)
+        print self.__class__.__name__, designUnit
+        if designUnit:
+            self.openCellView(designUnit.cellView, designUnit)
         
     #def runDeferred(self):
     #    print self.thread()
@@ -937,16 +824,37 @@ class PWindow(QtGui.QMainWindow):
 
     def deferredProcessingRequested(self):
         #print self.thread()
-        if self._databaseTimer and self._databaseTimer.isActive():
-            #self._databaseTimer.start(50)
-            QtGui.qApp.processEvents()
-        else:
+        if not self._databaseTimer:
             self._databaseTimer = QtCore.QTimer()
             self._databaseTimer.setSingleShot(True)
-            self.connect(self._databaseTimer, QtCore.SIGNAL("timeout()"), self.database.runDeferredProcesses)
+            self.connect(self._databaseTimer, QtCore.SIGNAL("timeout()"), self.runDeferredProcesses)
+        if not self._databaseTimer.isActive():
             self._databaseTimer.start(500)
             #.singleShot(5000, self.database.runDeferredProcesses)
+
+    def runDeferredProcesses(self):
+        """
+        Run deferred processes for at most deferredProcessingBudget
+        seconds, then yield to the event loop if more work is pending.
+        """
+        if self.database.runDeferredProcesses(budget=self.deferredProcessingBudget):
+            self._databaseTimer.start(0)
         
+    def togglePerf(self):
+        """Enable profiling and show the top timers in the status bar."""
+        if not self._perfTimer:
+            self._perfTimer = QtCore.QTimer()
+            self.connect(self._perfTimer, QtCore.SIGNAL("timeout()"),
+                         lambda: self.statusBar().showMessage(perf.summary()))
+        if perf.enabled:
+            perf.disable()
+            self._perfTimer.stop()
+            self.statusBar().showMessage(self.tr("Ready"))
+        else:
+            perf.enable()
+            self._perfTimer.start(1000)
+        self.perfAct.setChecked(perf.enabled)
+
     def leaveCPU(self):
         QtGui.qApp.processEvents()
         
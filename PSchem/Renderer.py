@@ -0,0 +1,387 @@
+﻿# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem.
+ 
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with PSchem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Rendering of cell views without a window, for thumbnails and exports.
+Run from the top directory to render imported gEDA libraries:
+
+    python -m PSchem.Renderer -o thumbnails -f png -s 256 sym.analog=../geda/symbols/analog
+"""
+
+import os
+import sys
+import hashlib
+import shutil
+import multiprocessing
+from optparse import OptionParser
+
+import Globals
+Qt = __import__(Globals.UI,  globals(),  locals(),  ['QtCore',  'QtGui'])
+QtCore = Qt.QtCore
+QtGui = Qt.QtGui
+
+from Database.Database import Database
+from Database.Primitives import *
+from Database.Path import Path
+from Database.Perf import timed
+from Database import Reader
+from PSchem.LayerView import loadDefaultLayers, addLayerViews
+from PSchem.GraphicsItems import labelTransform
+
+plainTypes = (str, unicode, int, long, float, bool, type(None))
+volatileKeys = frozenset(['_instanceGeneration', '_editable', '_serial']) #no effect on looks
+
+def plainData(value):
+    """Value if it is made of plain data only, else None."""
+    if isinstance(value, plainTypes):
+        return value
+    if isinstance(value, (list, tuple)):
+        items = [plainData(v) for v in value]
+        if None not in items:
+            return tuple(items)
+    return None
+
+def contentHash(cellView, memo = None):
+    """
+    SHA-1 of what a cell view looks like: the plain attributes and
+    layers of its elements, and the hashes of instantiated cell views.
+    """
+    if memo is None:
+        memo = {}
+    if cellView in memo:
+        return memo[cellView]
+    digests = []
+    for e in cellView.elems:
+        data = [e.__class__.__name__]
+        for (k, v) in sorted(e.__dict__.items()):
+            v = None if k in volatileKeys else plainData(v)
+            if v is not None:
+                data.append((k, v))
+        if e.layer:
+            data.append(e.layer.fullName)
+        if e.__class__ is Instance and e.instanceCellView:
+            data.append(contentHash(e.instanceCellView, memo))
+        digests.append(hashlib.sha1(repr(data)).hexdigest())
+    digests.sort()
+    digest = hashlib.sha1(str(cellView.uu) + '\n' + '\n'.join(digests)).hexdigest()
+    memo[cellView] = digest
+    return digest
+
+
+class Renderer():
+    """
+    Paints a cell view straight from its database elements with the
+    pens and brushes of the layer views, onto any QPainter (QImage,
+    QSvgGenerator, QPrinter). The cell view extents, which leave out
+    hidden labels, are fitted into the target rectangle.
+    """
+    margin = 0.05 #fraction of the target left empty on each side
+
+    def __init__(self, painter):
+        self._painter = painter
+        self._diagramTransform = QtGui.QTransform() #diagram to device
+
+    @property
+    def painter(self):
+        return self._painter
+
+    @timed('Renderer.paint')
+    def paint(self, cellView, rect):
+        painter = self._painter
+        background = cellView.database.layers.layerByName('background', 'drawing')
+        if background and background.view:
+            painter.fillRect(rect, background.view.brush)
+        extents = cellView.extents
+        if not extents:
+            return
+        uu = float(cellView.uu)
+        (x1, y1, x2, y2) = [c / uu for c in extents]
+        w = max(x2 - x1, 1e-3)
+        h = max(y2 - y1, 1e-3)
+        scale = min(rect.width() / w, rect.height() / h) * (1 - 2*self.margin)
+        painter.save()
+        painter.translate(rect.center())
+        painter.scale(scale, -scale)
+        painter.translate(-(x1 + x2) / 2.0, -(y1 + y2) / 2.0)
+        self._diagramTransform = painter.transform()
+        self.paintElems(cellView)
+        painter.restore()
+
+    def paintElems(self, diagram):
+        elems = [e for e in diagram.elems if e.layer and e.layer.view]
+        for e in sorted(elems, key=lambda e: (e.zValue, e.serial)):
+            e.addToView(self)
+
+    def setStyle(self, layer):
+        """Pen and brush of a layer, as used by the graphics items."""
+        painter = self._painter
+        transform = painter.transform()
+        scale = abs(transform.m11()) + abs(transform.m12())
+        pen = QtGui.QPen(layer.view.pen)
+        width = layer.lineWidth
+        pixelWidth = layer.linePixelWidth
+        if width > 0:
+            pen.setWidth(max(scale*width, pixelWidth))
+        painter.setPen(pen)
+        brush = QtGui.QBrush(layer.view.brush)
+        brush.setMatrix(painter.worldMatrix().inverted()[0])
+        painter.setBrush(brush)
+
+    def addElem(self, e):
+        pass #nothing to draw
+
+    def addLine(self, l):
+        uu = float(l.diagram.uu)
+        self.setStyle(l.layer)
+        self._painter.drawLine(QtCore.QLineF(l.x1/uu, l.y1/uu, l.x2/uu, l.y2/uu))
+
+    addPin = addLine
+    addNetSegment = addLine
+
+    def addRect(self, r):
+        uu = float(r.diagram.uu)
+        self.setStyle(r.layer)
+        self._painter.drawRect(QtCore.QRectF(r.x/uu, r.y/uu, r.w/uu, r.h/uu))
+
+    def ellipseRect(self, e):
+        uu = float(e.diagram.uu)
+        cx = e.radiusX/uu
+        cy = e.radiusY/uu
+        return QtCore.QRectF(e.x/uu-cx/2.0, e.y/uu-cy/2.0, cx, cy)
+
+    def addEllipse(self, e):
+        self.setStyle(e.layer)
+        self._painter.drawEllipse(self.ellipseRect(e))
+
+    addSolderDot = addEllipse
+
+    def addEllipseArc(self, e):
+        self.setStyle(e.layer)
+        self._painter.setBrush(QtGui.QBrush())
+        self._painter.drawArc(self.ellipseRect(e),
+                              int(-e.startAngle*16), int(-e.spanAngle*16))
+
+    def addCustomPath(self, p):
+        uu = float(p.diagram.uu)
+        path = QtGui.QPainterPath()
+        for e in p.path:
+            if e[0] == CustomPath.move:
+                path.moveTo(e[1]/uu, e[2]/uu)
+            elif e[0] == CustomPath.line:
+                path.lineTo(e[1]/uu, e[2]/uu)
+            elif e[0] == CustomPath.curve:
+                path.cubicTo(e[1]/uu, e[2]/uu, e[3]/uu, e[4]/uu, e[5]/uu, e[6]/uu)
+            elif e[0] == CustomPath.close:
+                path.closeSubpath()
+        self.setStyle(p.layer)
+        self._painter.drawPath(path)
+
+    def addLabel(self, l):
+        if not l.visible or not l.text:
+            return
+        painter = self._painter
+        uu = float(l.diagram.uu)
+        font = QtGui.QFont('Helvetica', 12, 0, False)
+        metrics = QtGui.QFontMetricsF(font)
+        ascent = metrics.ascent()
+        descent = metrics.descent()
+        scale = l.textSize/(ascent-descent)/uu
+        painter.save()
+        painter.translate(l.x/uu, l.y/uu)
+        painter.scale(scale, scale)
+        m = painter.transform() * self._diagramTransform.inverted()[0]
+        painter.setTransform(labelTransform(l, metrics, metrics.width(l.text), m), True)
+        painter.setFont(font)
+        painter.setPen(QtGui.QPen(l.layer.view.fontBrush, 0))
+        painter.drawText(QtCore.QPointF(0, ascent), l.text) #as QGraphicsSimpleTextItem
+        painter.restore()
+
+    addAttributeLabel = addLabel
+
+    def addInstance(self, i):
+        cellView = i.instanceCellView
+        if not cellView:
+            return
+        painter = self._painter
+        uu = float(i.diagram.uu)
+        painter.save()
+        painter.translate(i.x/uu, i.y/uu)
+        painter.rotate(i.angle)
+        if i.vMirror:
+            painter.scale(1, -1)
+        if i.hMirror:
+            painter.scale(-1, 1)
+        self.paintElems(cellView)
+        painter.restore()
+
+
+def renderToFile(cellView, fileName, size = 512):
+    """Render to a PNG (or other image), SVG or PDF file by extension."""
+    format = os.path.splitext(fileName)[1][1:].lower()
+    image = None
+    if format == 'svg':
+        QtSvg = __import__(Globals.UI,  globals(),  locals(),  ['QtSvg']).QtSvg
+        device = QtSvg.QSvgGenerator()
+        device.setFileName(fileName)
+        device.setSize(QtCore.QSize(size, size))
+        device.setViewBox(QtCore.QRect(0, 0, size, size))
+    elif format == 'pdf':
+        device = QtGui.QPrinter(QtGui.QPrinter.HighResolution)
+        device.setOutputFormat(QtGui.QPrinter.PdfFormat)
+        device.setOutputFileName(fileName)
+    else:
+        device = image = QtGui.QImage(size, size, QtGui.QImage.Format_ARGB32)
+        image.fill(0) #transparent where the background does not cover
+    painter = QtGui.QPainter(device)
+    Renderer(painter).paint(cellView, QtCore.QRectF(painter.viewport()))
+    painter.end()
+    if image:
+        image.save(fileName)
+
+
+_database = None    #database of the worker processes, inherited on fork
+_application = None #QApplication created for rendering, kept alive here
+
+def ensureApplication():
+    """
+    Create a QApplication unless one exists. Without an X display it is
+    created as a non-GUI (Tty) application, so that rendering also works
+    in headless documentation builds.
+    """
+    global _application
+    app = QtGui.QApplication.instance()
+    if app is None:
+        gui = (not sys.platform.startswith(('linux', 'freebsd')) or
+               bool(os.environ.get('DISPLAY')))
+        app = _application = QtGui.QApplication(sys.argv, gui)
+    return app
+
+def renderTask(task):
+    """Render one cell view in a worker, task is (path name, file name, size)."""
+    (pathName, fileName, size) = task
+    ensureApplication()
+    layers = _database.layers
+    if not layers.view:
+        addLayerViews(layers)
+    cellView = _database.libraries.objectByPath(Path.createFromPathName(pathName))
+    (directory, name) = os.path.split(fileName)
+    tmpName = os.path.join(directory, '.' + str(os.getpid()) + '-' + name)
+    renderToFile(cellView, tmpName, size)
+    os.rename(tmpName, fileName)
+    return fileName
+
+
+class BatchRenderer():
+    """
+    Renders many cell views in parallel worker processes. Outputs are
+    kept in a cache directory named by the cell view content hash, so
+    unchanged cell views are rendered only once. Workers are forked
+    with a copy of the database, this is not done if the process
+    already runs a QApplication (rendering is serial then).
+    """
+    def __init__(self, database, cacheDirectory, processes = None):
+        self._database = database
+        self._cacheDirectory = cacheDirectory
+        self._processes = processes
+        if not os.path.isdir(cacheDirectory):
+            os.makedirs(cacheDirectory)
+
+    @property
+    def cacheDirectory(self):
+        return self._cacheDirectory
+
+    def render(self, cellViews, format = 'png', size = 256):
+        """Render cell views, return {cellView: cached file name}."""
+        memo = {}
+        outputs = {}
+        tasks = {}
+        for cellView in cellViews:
+            fileName = os.path.join(self._cacheDirectory, '%s-%d.%s' %
+                                    (contentHash(cellView, memo), size, format))
+            outputs[cellView] = fileName
+            if not os.path.exists(fileName) and fileName not in tasks:
+                tasks[fileName] = (cellView.path, fileName, size)
+        self.run(tasks.values())
+        return outputs
+
+    def run(self, tasks):
+        global _database
+        _database = self._database
+        serial = (self._processes == 1 or len(tasks) < 2 or
+                  not hasattr(os, 'fork') or QtGui.QApplication.instance())
+        if serial:
+            for task in tasks:
+                renderTask(task)
+        else:
+            pool = multiprocessing.Pool(self._processes)
+            try:
+                pool.map(renderTask, tasks, max(1, len(tasks) // 64))
+            finally:
+                pool.close()
+                pool.join()
+
+    def export(self, cellViews, directory, format = 'png', size = 256):
+        """Copy renderings to directory as library/cell/view.format files."""
+        outputs = self.render(cellViews, format, size)
+        for (cellView, cached) in outputs.items():
+            fileName = os.path.join(directory, *cellView.path.split('/')) + '.' + format
+            if not os.path.isdir(os.path.dirname(fileName)):
+                os.makedirs(os.path.dirname(fileName))
+            shutil.copyfile(cached, fileName)
+        return outputs
+
+
+class Client():
+    """Database client without an event loop."""
+    def deferredProcessingRequested(self):
+        pass
+
+    def leaveCPU(self):
+        pass
+
+def main(argv):
+    parser = OptionParser(usage='%prog [options] library=directory ...')
+    parser.add_option('-S', '--source', action='append', default=[],
+                      help='source (schematic) library=directory')
+    parser.add_option('-o', '--output', default='render', help='output directory')
+    parser.add_option('-c', '--cache', help='cache directory (output/.cache)')
+    parser.add_option('-f', '--format', default='png', help='png, svg or pdf')
+    parser.add_option('-s', '--size', type='int', default=256)
+    parser.add_option('-j', '--processes', type='int', help='worker processes')
+    (options, args) = parser.parse_args(argv)
+    database = Database.createDatabase(Client())
+    loadDefaultLayers(database, False)
+    importer = Reader.GedaImporter(database.libraries)
+    importer.importLibraryList([arg.split('=', 1) for arg in args],
+                               [arg.split('=', 1) for arg in options.source])
+    cellViews = []
+    pending = list(database.libraries.libraries)
+    while pending:
+        library = pending.pop()
+        pending.extend(library.libraries)
+        for cell in library.cells:
+            cellViews.extend(cell.cellViews)
+    cache = options.cache or os.path.join(options.output, '.cache')
+    renderer = BatchRenderer(database, cache, options.processes)
+    renderer.export(cellViews, options.output, options.format, options.size)
+    print 'Rendered', len(cellViews), 'cell views to', options.output
+    database.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -66,45 +66,76 @@ class ItemBuffer(list):
         return self._pos
 
 class Selection(set):
-    def __init__(self, items=[]):
-        set.__init__(self, items)
-        for i in items:
+    """
+    Set of selected items. Every modification computes the difference
+    against the current contents, flags only the items that changed,
+    repaints the union of their bounding rectangles once per scene
+    and notifies the installed hooks once with (added, removed) sets.
+    """
+    def __init__(self, items=()):
+        set.__init__(self)
+        self._hooks = set()
+        self.replace(items)
+
+    def installChangeHook(self, hook):
+        self._hooks.add(hook)
+
+    def uninstallChangeHook(self, hook):
+        self._hooks.discard(hook)
+
+    def changed(self, added, removed):
+        if not added and not removed:
+            return
+        for i in added:
             i.selected = True
-            i.update()
-        if len(items) > 0:
-            print self.__class__.__name__, self
+        for i in removed:
+            i.selected = False
+        rects = {}
+        for i in added | removed:
+            scene = i.scene()
+            if scene:
+                r = i.sceneBoundingRect()
+                if scene in rects:
+                    rects[scene] = rects[scene] | r
+                else:
+                    rects[scene] = r
+        for (scene, rect) in rects.iteritems():
+            scene.update(rect)
+        for hook in list(self._hooks):
+            hook(added, removed)
+
+    def replace(self, items):
+        items = set(items)
+        added = items - self
+        removed = self - items
+        set.__isub__(self, removed)
+        set.__ior__(self, added)
+        self.changed(added, removed)
 
     def add(self, item):
-        set.add(self, item)
-        item.selected = True
-        item.update()
-        print self.__class__.__name__, self
-        
+        if not item in self:
+            set.add(self, item)
+            self.changed(set([item]), set())
+
     def remove(self, item):
         set.remove(self, item)
-        item.selected = False
-        item.update()
-        print self.__class__.__name__, self
-        
+        self.changed(set(), set([item]))
+
+    def discard(self, item):
+        if item in self:
+            self.remove(item)
+
+    def clear(self):
+        self.replace(())
+
     def __ior__(self, items):
-        set.__ior__(self, items)
-        for i in items:
-            i.selected = True
-            i.update()
-        print self.__class__.__name__, self
+        added = set(items) - self
+        set.__ior__(self, added)
+        self.changed(added, set())
         return self
 
     def __isub__(self, items):
-        set.__isub__(self, items)
-        for i in items:
-            i.selected = False
-            i.update()
-        print self.__class__.__name__, self
+        removed = self & set(items)
+        set.__isub__(self, removed)
+        self.changed(set(), removed)
         return self
-
-    def __del__(self):
-        for i in self:
-            i.selected = False
-            i.update()
-        #print self.__class__.__name__, self
-
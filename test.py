@@ -2,6 +2,11 @@
 
 from Database.Tests.test_Path import *
 from Database.Tests.test_Database import *
+from Database.Tests.test_SpatialIndex import *
+from Database.Tests.test_NameIndex import *
+from Database.Tests.test_Perf import *
+from Database.Tests.test_GraphicsScene import *
+from Database.Tests.test_Renderer import *
 
 if __name__ == "__main__":
     unittest.main()